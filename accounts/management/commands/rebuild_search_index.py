@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Users
+from accounts.search import reindex_users
+
+
+class Command(BaseCommand):
+    help = "Rebuild the accent-folded people search tokens (user_search_tokens) for every user."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Users per batch (default: 500)")
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options["chunk_size"])
+        users = tokens = 0
+        last_id = 0
+        while True:
+            ids = list(Users.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                break
+            tokens += reindex_users(ids)
+            users += len(ids)
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index: {users} users, {tokens} tokens"))
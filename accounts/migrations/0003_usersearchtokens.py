@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_patientprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchTokens',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=64)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='accounts.users')),
+            ],
+            options={
+                'db_table': 'user_search_tokens',
+                'managed': True,
+                'indexes': [models.Index(fields=['token', 'user'], name='user_search_token_idx')],
+                'unique_together': {('user', 'token')},
+            },
+        ),
+    ]
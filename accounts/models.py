@@ -48,4 +48,20 @@ class PatientProfile(models.Model):
         db_table = 'patient_profiles'
 
     def __str__(self):
-        return f"PatientProfile(user_id={self.user_id})"
\ No newline at end of file
+        return f"PatientProfile(user_id={self.user_id})"
+
+class UserSearchTokens(models.Model):
+    """Search keys of a user: accent-folded, lowercased name words plus email,
+    phone, CCCD, license number and employee code. Looked up by prefix; kept
+    in sync by accounts.signals and rebuilt with `rebuild_search_index`.
+    See accounts.search.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(Users, models.CASCADE, related_name="search_tokens")
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        managed = True
+        db_table = 'user_search_tokens'
+        unique_together = (('user', 'token'),)
+        indexes = [models.Index(fields=['token', 'user'], name='user_search_token_idx')]
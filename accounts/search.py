@@ -0,0 +1,108 @@
+"""
+Accent-insensitive people search.
+
+Every external user has a few rows in `user_search_tokens`: the words of the
+full name folded to plain lowercase ASCII ("Nguyễn Văn Đức" -> nguyen, van,
+duc), the email and its local part, and the digits of phone, CCCD, license
+number and employee code. A search term is folded the same way and matched
+as a prefix on the (token, user) index, so "duc" finds "Đức", and one range
+read per term replaces icontains scans over the joined users table.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Users, UserSearchTokens
+
+TOKEN_MAX_LENGTH = 64
+_SPLIT = re.compile(r"[\s,;/|()]+")
+
+
+def fold(text):
+    """Lowercase, strip Vietnamese diacritics (đ -> d)."""
+    text = (text or "").replace("đ", "d").replace("Đ", "D")
+    text = unicodedata.normalize("NFD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).lower().strip()
+
+
+def query_terms(q):
+    """Folded search terms of a user query, empty terms dropped."""
+    return [t[:TOKEN_MAX_LENGTH] for t in _SPLIT.split(fold(q)) if t]
+
+
+def tokens_for(full_name=None, email=None, codes=()):
+    """Search tokens of one user from their name, email and identifying codes."""
+    tokens = set(query_terms(full_name))
+    email = fold(email)
+    if email:
+        tokens.add(email)
+        tokens.add(email.split("@", 1)[0])
+    for code in codes:
+        code = fold(code).replace(" ", "")
+        if code:
+            tokens.add(code)
+            digits = re.sub(r"\D", "", code)
+            if digits and digits != code:
+                tokens.add(digits)  # "+84 90-123" is also found as 8490123
+    return {t[:TOKEN_MAX_LENGTH] for t in tokens if t}
+
+
+def _profile_codes(user_ids):
+    """{user_id: [codes]} from the doctor, patient and staff rows of these users."""
+    from doctors.models import Doctors
+    from patients.models import PatientProfiles
+    from staff.models import StaffProfiles
+
+    codes = {}
+    for user_id, license_number in Doctors.objects.filter(user_id__in=user_ids).values_list("user_id", "license_number"):
+        codes.setdefault(user_id, []).append(license_number)
+    for user_id, cccd in PatientProfiles.objects.filter(user_id__in=user_ids).values_list("user_id", "cccd"):
+        codes.setdefault(user_id, []).append(cccd)
+    for row in StaffProfiles.objects.filter(user_id__in=user_ids).values_list("user_id", "employee_code", "cccd", "phone"):
+        codes.setdefault(row[0], []).extend(row[1:])
+    return codes
+
+
+@transaction.atomic
+def reindex_users(user_ids):
+    """Recompute the tokens of the given users (a constant number of queries per call)."""
+    user_ids = sorted({i for i in user_ids if i})
+    if not user_ids:
+        return 0
+    codes = _profile_codes(user_ids)
+    rows = []
+    for user_id, full_name, email, phone in (Users.objects
+                                             .filter(id__in=user_ids)
+                                             .values_list("id", "full_name", "email", "phone")):
+        for token in tokens_for(full_name, email, [phone, *codes.get(user_id, [])]):
+            rows.append(UserSearchTokens(user_id=user_id, token=token))
+    UserSearchTokens.objects.filter(user_id__in=user_ids).delete()
+    UserSearchTokens.objects.bulk_create(rows)
+    return len(rows)
+
+
+def reindex_user_on_commit(user_id):
+    if user_id:
+        transaction.on_commit(lambda: reindex_users([user_id]))
+
+
+def matching_users(term):
+    """Subquery of user ids having a token that starts with the (folded) term."""
+    return UserSearchTokens.objects.filter(token__startswith=term).values("user_id")
+
+
+def search_q(q, *user_fields):
+    """
+    Q requiring every term of `q` to match one of the users at `user_fields`
+    (e.g. "user", or "patient__user" and "doctor__user"). Empty query -> Q().
+    """
+    condition = Q()
+    for term in query_terms(q):
+        sub = matching_users(term)
+        any_user = Q()
+        for field in user_fields:
+            any_user |= Q(**{f"{field}_id__in": sub})
+        condition &= any_user
+    return condition
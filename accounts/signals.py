@@ -0,0 +1,35 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from clinic.identity import invalidate_identity
+from .search import reindex_user_on_commit
+
+
+@receiver([post_save, post_delete], sender="accounts.Users")
+@receiver([post_save, post_delete], sender="adminpanel.UserLite")
+def user_changed(sender, instance, **kwargs):
+    # Role / active flag / name may have changed: drop pinned session identities
+    invalidate_identity(instance.pk)
+
+
+@receiver([post_save, post_delete], sender="doctors.Doctors")
+@receiver([post_save, post_delete], sender="patients.PatientProfiles")
+def profile_changed(sender, instance, **kwargs):
+    # Pinned doctor / patient profile id of this user may have changed
+    invalidate_identity(instance.user_id)
+
+
+@receiver(post_save, sender="accounts.Users")
+@receiver(post_save, sender="adminpanel.UserLite")
+def user_search_changed(sender, instance, **kwargs):
+    # Name / email / phone feed the search tokens (deleted users cascade)
+    reindex_user_on_commit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender="doctors.Doctors")
+@receiver([post_save, post_delete], sender="patients.PatientProfiles")
+@receiver([post_save, post_delete], sender="accounts.PatientProfile")
+@receiver([post_save, post_delete], sender="staff.StaffProfiles")
+def profile_search_changed(sender, instance, **kwargs):
+    # License number / CCCD / employee code feed the search tokens
+    reindex_user_on_commit(instance.user_id)
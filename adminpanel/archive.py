@@ -0,0 +1,212 @@
+"""
+Monthly archival of append-only history tables.
+
+appointment_logs and chatbot_messages only grow. Rows of a past local month
+are moved to an archive table `<table>_YYYYMM` with the same columns and
+indexes, in short chunks (one INSERT ... SELECT and one DELETE by primary key
+per transaction), so the live tables stay small and no long lock is held.
+`ArchivePartitions` lists the archive tables and their row counts.
+
+Readers use `history()`: it reads the live table and only the archive tables
+of the months the query can reach, and returns live model instances in one
+ordered list. Deletion paths use `purge()` to delete the matching archived
+rows too. Filters must use plain columns (`appointment_id=`, not joins),
+since archive rows have no foreign keys.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from clinic.localdates import local_day_bounds, local_range_bounds
+from .models import ArchivePartitions
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class ArchiveSpec:
+    name: str
+    model_label: str
+    date_field: str = "created_at"
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    def table_for(self, month):
+        return f"{self.table}_{month:%Y%m}"
+
+
+SPECS = {spec.name: spec for spec in (
+    ArchiveSpec("appointment_logs", "appointments.AppointmentLogs"),
+    ArchiveSpec("chatbot_messages", "chatbot.ChatbotMessages"),
+)}
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def month_bounds(month):
+    """Half-open [start, end) aware datetimes of a local month."""
+    return local_range_bounds(month, next_month(month) - timedelta(days=1))
+
+
+# ---------------------------------------------------------------------------
+# Archive tables
+# ---------------------------------------------------------------------------
+
+_archive_models = {}
+
+
+def archive_model(spec, table):
+    """Unmanaged model over an archive table; foreign keys become plain *_id columns."""
+    if table not in _archive_models:
+        attrs = {"__module__": __name__}
+        for f in spec.model._meta.concrete_fields:
+            if f.is_relation:
+                attrs[f.attname] = models.BigIntegerField(db_column=f.column, null=f.null)
+            else:
+                attrs[f.name] = f.clone()
+        attrs["Meta"] = type("Meta", (), {"managed": False, "db_table": table, "app_label": "adminpanel"})
+        _archive_models[table] = type(f"Archive_{table}", (models.Model,), attrs)
+    return _archive_models[table]
+
+
+def _columns(spec):
+    qn = connection.ops.quote_name
+    return ", ".join(qn(f.column) for f in spec.model._meta.concrete_fields)
+
+
+def ensure_table(spec, month):
+    """Create (if needed) and register the archive table of a month. Returns its catalog row."""
+    table = spec.table_for(month)
+    if table not in connection.introspection.table_names():
+        if connection.vendor == "mysql":
+            qn = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                # Same columns and indexes; CREATE TABLE ... LIKE copies no foreign keys
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {qn(table)} LIKE {qn(spec.table)}")
+        else:
+            with connection.schema_editor() as editor:
+                editor.create_model(archive_model(spec, table))
+    partition, _ = ArchivePartitions.objects.get_or_create(
+        source=spec.name, month=month,
+        defaults={"table_name": table, "archived_at": timezone.now()},
+    )
+    return partition
+
+
+def live_rows(spec, month):
+    """Live rows of one local month."""
+    start, end = month_bounds(month)
+    return spec.model.objects.filter(**{f"{spec.date_field}__gte": start, f"{spec.date_field}__lt": end})
+
+
+def archive_month(spec, month, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None):
+    """Move the live rows of one local month to its archive table. Returns rows moved."""
+    rows = live_rows(spec, month)
+    if not rows.exists():
+        return 0
+    partition = ensure_table(spec, month)
+    qn = connection.ops.quote_name
+    columns, pk = _columns(spec), qn(spec.model._meta.pk.column)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            ids = list(rows.order_by(spec.date_field, "pk").values_list("pk", flat=True)[:chunk_size])
+            if not ids:
+                break
+            marks = ", ".join(["%s"] * len(ids))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {qn(partition.table_name)} ({columns}) "
+                    f"SELECT {columns} FROM {qn(spec.table)} WHERE {pk} IN ({marks})", ids)
+                cursor.execute(f"DELETE FROM {qn(spec.table)} WHERE {pk} IN ({marks})", ids)
+            ArchivePartitions.objects.filter(pk=partition.pk).update(
+                rows=models.F("rows") + len(ids), archived_at=timezone.now())
+        moved += len(ids)
+        if on_chunk:
+            on_chunk(spec, month, moved)
+    return moved
+
+
+def months_to_archive(spec, before):
+    """Local months, oldest first, with live rows older than the month of `before`."""
+    cutoff = month_start(before)
+    first = spec.model.objects.filter(
+        **{f"{spec.date_field}__lt": month_bounds(cutoff)[0]}
+    ).order_by(spec.date_field).values_list(spec.date_field, flat=True).first()
+    if first is None:
+        return []
+    months, month = [], month_start(timezone.localtime(first).date())
+    while month < cutoff:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+# ---------------------------------------------------------------------------
+# Readers and deletion
+# ---------------------------------------------------------------------------
+
+def partitions(spec, date_from=None, date_to=None):
+    """Catalog rows of the archive tables covering local days date_from..date_to."""
+    qs = ArchivePartitions.objects.filter(source=spec.name)
+    if date_from:
+        qs = qs.filter(month__gte=month_start(date_from))
+    if date_to:
+        qs = qs.filter(month__lte=date_to)
+    return list(qs.order_by("month"))
+
+
+def history(name, date_from=None, date_to=None, **filters):
+    """
+    Rows of the live table and its archives matching `filters` (plain column
+    lookups), as live model instances ordered by (date field, id). Giving the
+    earliest possible date skips the archive months before it.
+    """
+    spec = SPECS[name]
+    model = spec.model
+    date_q = {}
+    if date_from:
+        date_q[f"{spec.date_field}__gte"] = local_day_bounds(date_from)[0]
+    if date_to:
+        date_q[f"{spec.date_field}__lt"] = local_day_bounds(date_to)[1]
+
+    rows = list(model.objects.filter(**filters, **date_q))
+    attnames = [f.attname for f in model._meta.concrete_fields]
+    for partition in partitions(spec, date_from, date_to):
+        archived = archive_model(spec, partition.table_name).objects.filter(**filters, **date_q)
+        rows += [model(**values) for values in archived.values(*attnames)]
+    rows.sort(key=lambda r: (getattr(r, spec.date_field), r.pk))
+    return rows
+
+
+def appointment_logs(appointment):
+    """Logs of one appointment, live and archived (none can predate its creation)."""
+    since = timezone.localtime(appointment.created_at).date() if appointment.created_at else None
+    return history("appointment_logs", date_from=since, appointment_id=appointment.pk)
+
+
+def purge(name, **filters):
+    """Delete the archived rows matching `filters` (plain column lookups). Returns rows deleted."""
+    spec = SPECS[name]
+    deleted = 0
+    for partition in partitions(spec):
+        count = archive_model(spec, partition.table_name).objects.filter(**filters).delete()[0]
+        if count:
+            ArchivePartitions.objects.filter(pk=partition.pk).update(rows=models.F("rows") - count)
+            deleted += count
+    return deleted
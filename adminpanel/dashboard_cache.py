@@ -0,0 +1,91 @@
+"""
+Versioned cache for the admin dashboard context.
+
+The dashboard is split in two blocks:
+  * "past"  - closed days of the 7/30-day window, keyed by (range, local date);
+              long-lived, since those days only change on late edits.
+  * "today" - KPIs and per-doctor numbers of the current local day; short TTL.
+
+Each block kind carries a version number in the cache. Rollup refreshes report
+the local days they touched; a touched past day bumps the "past" version, a
+touched today bumps the "today" version, so only the affected block is rebuilt.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+KINDS = ("past", "today")
+
+
+def _ttl(kind):
+    if kind == "past":
+        return getattr(settings, "DASHBOARD_CACHE_PAST_TTL", 60 * 60 * 24)
+    return getattr(settings, "DASHBOARD_CACHE_TODAY_TTL", 60)
+
+
+def _version(kind):
+    key = f"dash:ver:{kind}"
+    # Seed with a timestamp so a cleared cache never reuses old version numbers
+    cache.add(key, int(time.time()), None)
+    return cache.get(key)
+
+
+def _count(kind, outcome):
+    key = f"dash:stats:{kind}:{outcome}"
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def get_block(kind, parts, build):
+    """Return the cached block for (kind, parts), building and storing it on a miss."""
+    key = "dash:{}:{}:v{}".format(kind, ":".join(str(p) for p in parts), _version(kind))
+    value = cache.get(key)
+    if value is not None:
+        _count(kind, "hit")
+        return value
+    _count(kind, "miss")
+    value = build()
+    cache.set(key, value, _ttl(kind))
+    return value
+
+
+def bump(kind):
+    key = f"dash:ver:{kind}"
+    _version(kind)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time()), None)
+
+
+def invalidate_days(days):
+    """Invalidate the blocks that cover any of the given local days."""
+    today = timezone.localdate()
+    days = set(days)
+    if any(d < today for d in days):
+        bump("past")
+    if today in days:
+        bump("today")
+
+
+def stats():
+    """Hit/miss counters per block kind (since the cache was last cleared)."""
+    keys = [f"dash:stats:{k}:{o}" for k in KINDS for o in ("hit", "miss")]
+    values = cache.get_many(keys)
+    result = {}
+    for kind in KINDS:
+        hit = values.get(f"dash:stats:{kind}:hit", 0)
+        miss = values.get(f"dash:stats:{kind}:miss", 0)
+        total = hit + miss
+        result[kind] = {
+            "hit": hit,
+            "miss": miss,
+            "ratio": round(hit * 100.0 / total, 1) if total else 0,
+            "version": _version(kind),
+        }
+    return result
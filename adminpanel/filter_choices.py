@@ -0,0 +1,34 @@
+"""
+Cached option lists for the admin list filters (doctor and specialty dropdowns).
+
+Built with two small queries and kept in the shared cache; writes to doctors,
+specialties or user names drop the entry (see adminpanel.signals).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from doctors.models import Doctors
+
+CACHE_KEY = "adminpanel:filter_choices"
+
+
+def _build():
+    doctors = list(Doctors.objects
+                   .order_by("user__full_name")
+                   .values_list("id", "user__full_name"))
+    specialties = list(Doctors.objects
+                       .filter(specialty__isnull=False)
+                       .order_by("specialty__name")
+                       .values_list("specialty_id", "specialty__name")
+                       .distinct())
+    return {"doctors": doctors, "specialties": specialties}
+
+
+def filter_choices():
+    """{"doctors": [(id, full_name)], "specialties": [(id, name)]}"""
+    ttl = getattr(settings, "ADMIN_FILTER_CHOICES_TTL", 600)
+    return cache.get_or_set(CACHE_KEY, _build, ttl)
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
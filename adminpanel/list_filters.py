@@ -0,0 +1,74 @@
+"""
+Query-string filters of the admin appointment and invoice lists.
+
+The list pages and their CSV/XLSX exports parse the same parameters here, so
+an export always contains exactly the rows the filtered list shows.
+"""
+from datetime import datetime
+
+from django.utils.dateparse import parse_date
+
+from accounts.search import search_q
+from appointments.models import Appointments
+from billing.models import Invoices
+
+
+def _parse_date(s):
+    # Date inputs send YYYY-MM-DD; dd/mm/YYYY kept for old links
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def appointment_filters(params):
+    """Parsed filters of adminpanel.views.appointments."""
+    return {
+        "q": params.get("q", "").strip(),
+        "date_from": _parse_date(params.get("date_from", "")),
+        "date_to": _parse_date(params.get("date_to", "")),
+        "doctor_id": params.get("doctor_id") or None,
+        "specialty_id": params.get("specialty_id") or None,
+        "status": params.get("status") or None,
+        "source": params.get("source") or None,
+        "order": params.get("order", "desc"),
+    }
+
+
+def appointments(filters):
+    """Appointments matching appointment_filters() (unordered)."""
+    qs = Appointments.objects.all().in_local_range(filters["date_from"], filters["date_to"])
+    if filters["doctor_id"]:
+        qs = qs.filter(doctor_id=filters["doctor_id"])
+    if filters["specialty_id"]:
+        qs = qs.filter(doctor__specialty_id=filters["specialty_id"])
+    if filters["status"]:
+        qs = qs.filter(status=filters["status"])
+    if filters["source"]:
+        qs = qs.filter(source=filters["source"])
+    if filters["q"]:
+        # Each term matches the patient or the doctor (name, phone, CCCD...; accent-insensitive)
+        qs = qs.filter(search_q(filters["q"], "patient__user", "doctor__user"))
+    return qs
+
+
+def invoices(params):
+    """Invoices matching the filters of adminpanel.views.invoice_list (unordered)."""
+    qs = Invoices.objects.all()
+    status = params.get("status")
+    if status in ("UNPAID", "PAID"):
+        qs = qs.filter(status=status)
+    doctor_id = params.get("doctor")
+    if doctor_id:
+        qs = qs.filter(appointment__doctor_id=doctor_id)
+    q = params.get("q")
+    if q:
+        # Patient name words or CCCD, accent-insensitive
+        qs = qs.filter(search_q(q, "appointment__patient__user"))
+    try:
+        qs = qs.in_local_range(parse_date(params.get("from") or ""), parse_date(params.get("to") or ""))
+    except ValueError:
+        pass
+    return qs
@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from adminpanel import archive
+
+
+class Command(BaseCommand):
+    help = "Move old appointment_logs / chatbot_messages rows to monthly archive tables, in small chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months", type=int, default=getattr(settings, "ARCHIVE_AFTER_MONTHS", 6),
+                            help="Keep this many recent months live (default: ARCHIVE_AFTER_MONTHS)")
+        parser.add_argument("--table", action="append", choices=sorted(archive.SPECS),
+                            help="Only this history table (repeatable; default: all)")
+        parser.add_argument("--chunk-size", type=int, default=archive.DEFAULT_CHUNK_SIZE,
+                            help=f"Rows moved per transaction (default: {archive.DEFAULT_CHUNK_SIZE})")
+        parser.add_argument("--dry-run", action="store_true", help="Only list the months and row counts")
+
+    def handle(self, *args, **options):
+        if options["months"] < 1:
+            raise CommandError("--months must be at least 1")
+        before = archive.month_start(timezone.localdate())
+        for _ in range(options["months"] - 1):
+            before = archive.month_start(before - timedelta(days=1))
+        chunk_size = max(1, options["chunk_size"])
+
+        started = time.monotonic()
+        total = 0
+        for name in options.get("table") or sorted(archive.SPECS):
+            spec = archive.SPECS[name]
+            for month in archive.months_to_archive(spec, before):
+                if options["dry_run"]:
+                    count = archive.live_rows(spec, month).count()
+                    line = f"  {name} {month:%Y-%m}: {count} rows -> {spec.table_for(month)}"
+                else:
+                    count = archive.archive_month(spec, month, chunk_size)
+                    line = f"  {name} {month:%Y-%m}: moved {count} rows to {spec.table_for(month)}"
+                if count:
+                    self.stdout.write(line)
+                total += count
+
+        elapsed = time.monotonic() - started
+        prefix = "[dry-run] Would archive" if options["dry_run"] else "Archived"
+        self.stdout.write(self.style.SUCCESS(f"{prefix} {total} rows older than {before:%Y-%m} ({elapsed:.1f}s)"))
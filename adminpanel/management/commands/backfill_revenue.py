@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from adminpanel import revenue
+
+
+class Command(BaseCommand):
+    help = "Write revenue ledger rows for payments recorded before the ledger existed and rebuild the day totals."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=revenue.BACKFILL_CHUNK,
+                            help=f"Ledger rows written per transaction (default: {revenue.BACKFILL_CHUNK})")
+        parser.add_argument("--rebuild-only", action="store_true",
+                            help="Only recompute revenue_days (running totals) from the ledger")
+
+    def handle(self, *args, **options):
+        if options["rebuild_only"]:
+            days = revenue.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt revenue totals of {days} days"))
+            return
+        written = revenue.backfill(max(1, options["chunk_size"]))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} ledger rows; revenue totals rebuilt"))
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from appointments.models import Appointments, Schedules
+from billing.models import Invoices
+from adminpanel import rollups
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+def first_activity_day():
+    """Earliest local day that has an appointment, schedule or invoice."""
+    candidates = [
+        rollups.local_day(Appointments.objects.aggregate(m=Min("appointment_at"))["m"]),
+        rollups.local_day(Invoices.objects.aggregate(m=Min("created_at"))["m"]),
+        Schedules.objects.aggregate(m=Min("work_date"))["m"],
+    ]
+    candidates = [d for d in candidates if d]
+    return min(candidates) if candidates else None
+
+
+class Command(BaseCommand):
+    help = "Backfill the dashboard daily rollup tables for a date range."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First local day (YYYY-MM-DD, default: first activity)")
+        parser.add_argument("--to", dest="date_to", help="Last local day (YYYY-MM-DD, default: today)")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        date_from = parse_date(options["date_from"]) if options.get("date_from") else (first_activity_day() or today)
+        date_to = parse_date(options["date_to"]) if options.get("date_to") else today
+        if date_to < date_from:
+            raise CommandError("--to must not be before --from")
+
+        days = rollups.refresh_range(date_from, date_to)
+        self.stdout.write(self.style.SUCCESS(f"Backfilled rollups {date_from}..{date_to}: {days} days"))
@@ -0,0 +1,80 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from adminpanel import render_jobs
+
+
+class Command(BaseCommand):
+    help = "Render queued documents (visit summary PDFs) in a bounded pool of renderer processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=getattr(settings, "RENDER_WORKER_PROCESSES", 2),
+                            help="Renderer processes (default: RENDER_WORKER_PROCESSES)")
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds between queue polls when idle")
+        parser.add_argument("--max-jobs-per-process", type=int, default=200,
+                            help="Replace a renderer process after this many jobs (bounds memory growth)")
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        if processes < 1:
+            raise CommandError("--processes must be at least 1")
+        self.stdout.write(f"Render worker: {processes} processes")
+        done = failed = 0
+        started = time.monotonic()
+        try:
+            while True:
+                try:
+                    counts = self.serve(processes, options)
+                except BrokenProcessPool:
+                    # A renderer died (e.g. killed for memory); its job is retried after the timeout
+                    self.stderr.write("Renderer process died; restarting the pool")
+                    continue
+                done, failed = done + counts[0], failed + counts[1]
+                break
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Rendered {done} documents, {failed} failed ({elapsed:.1f}s)"))
+
+    def serve(self, processes, options):
+        """Feed claimed jobs to the pool until the queue is empty (--once) or forever."""
+        done = failed = 0
+        # spawn: renderer processes share no database connection with this one;
+        # each sets Django up before it unpickles its first job
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+            max_tasks_per_child=max(1, options["max_jobs_per_process"]),
+        )
+        running = {}
+        with pool:
+            while True:
+                close_old_connections()
+                render_jobs.expire()
+                free = processes - len(running)
+                ids = render_jobs.claim(free) if free else []
+                for job_id in ids:
+                    running[pool.submit(render_jobs.run, job_id)] = job_id
+                if not running:
+                    if options["once"]:
+                        return done, failed
+                    time.sleep(options["poll"])
+                    continue
+                finished, _ = wait(running, timeout=options["poll"], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job_id = running.pop(future)
+                    status = future.result()
+                    if status == render_jobs.DONE:
+                        done += 1
+                    else:
+                        failed += 1
+                        self.stderr.write(f"  job {job_id}: {status}")
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.db import connection
 
+from doctors.pricing import invalidate_rank_fees
+
 class Command(BaseCommand):
     help = 'Create doctor_rank_fees table and populate with default data'
 
@@ -29,6 +31,7 @@ class Command(BaseCommand):
                     ('PGS', 700000),
                     ('GS', 1000000)
                 """)
+                invalidate_rank_fees()
                 self.stdout.write(
                     self.style.SUCCESS('Table created and populated with default data')
                 )
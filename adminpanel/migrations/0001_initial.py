@@ -0,0 +1,127 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('doctors', '0004_add_avatar_column'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorRankFee',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('rank', models.CharField(choices=[('BS', 'Bác sĩ'), ('ThS', 'Thạc sĩ'), ('TS', 'Tiến sĩ'), ('PGS', 'Phó giáo sư'), ('GS', 'Giáo sư')], max_length=10, unique=True)),
+                ('default_fee', models.DecimalField(decimal_places=2, max_digits=12)),
+            ],
+            options={
+                'db_table': 'doctor_rank_fees',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Drug',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('code', models.CharField(blank=True, max_length=100, null=True, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('unit', models.CharField(max_length=50)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('is_active', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'drugs',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Specialty',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'specialties',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UserLite',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('email', models.CharField(max_length=255, unique=True)),
+                ('password_hash', models.CharField(max_length=255)),
+                ('full_name', models.CharField(max_length=255)),
+                ('phone', models.CharField(blank=True, max_length=20, null=True)),
+                ('role', models.CharField(max_length=7)),
+                ('is_active', models.IntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'users',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupDays',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'rollup_days',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyAppointmentStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=12)),
+                ('total', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'daily_appointment_stats',
+                'unique_together': {('day', 'status')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyRevenueStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('item_type', models.CharField(max_length=12)),
+                ('billed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('collected', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'db_table': 'daily_revenue_stats',
+                'unique_together': {('day', 'item_type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyDoctorStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('schedules', models.PositiveIntegerField(default=0)),
+                ('open_slots', models.PositiveIntegerField(default=0)),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='doctors.doctors')),
+            ],
+            options={
+                'db_table': 'daily_doctor_stats',
+                'unique_together': {('day', 'doctor')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivePartitions',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=64)),
+                ('month', models.DateField()),
+                ('table_name', models.CharField(max_length=64, unique=True)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'archive_partitions',
+                'unique_together': {('source', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_usersearchtokens'),
+        ('adminpanel', '0002_archivepartitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovements',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=8)),
+                ('quantity', models.IntegerField()),
+                ('on_hand', models.IntegerField()),
+                ('ref_type', models.CharField(blank=True, max_length=16, null=True)),
+                ('ref_id', models.BigIntegerField(blank=True, null=True)),
+                ('note', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('actor_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='accounts.users')),
+                ('drug', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='movements', to='adminpanel.drug')),
+            ],
+            options={
+                'db_table': 'stock_movements',
+                'indexes': [models.Index(fields=['drug', 'id'], name='stock_mov_drug_idx'), models.Index(fields=['ref_type', 'ref_id'], name='stock_mov_ref_idx')],
+            },
+        ),
+    ]
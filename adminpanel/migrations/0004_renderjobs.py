@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_usersearchtokens'),
+        ('adminpanel', '0003_stockmovements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderJobs',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=32)),
+                ('entity_id', models.BigIntegerField()),
+                ('version', models.CharField(max_length=64)),
+                ('base_url', models.CharField(blank=True, max_length=500, null=True)),
+                ('status', models.CharField(default='PENDING', max_length=8)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='accounts.users')),
+            ],
+            options={
+                'db_table': 'render_jobs',
+                'indexes': [models.Index(fields=['status', 'id'], name='render_jobs_status_idx')],
+                'unique_together': {('kind', 'entity_id', 'version')},
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0004_renderjobs'),
+        ('billing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueDays',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('payments', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('consultation', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('drugs', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('other', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cum_payments', models.PositiveIntegerField(default=0)),
+                ('cum_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('cum_consultation', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('cum_drugs', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('cum_other', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'db_table': 'revenue_days',
+            },
+        ),
+        migrations.RemoveField(
+            model_name='dailyrevenuestats',
+            name='collected',
+        ),
+        migrations.CreateModel(
+            name='RevenueLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('consultation', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('drugs', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('other', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField()),
+                ('invoice', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='billing.invoices')),
+                ('payment', models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='billing.payments')),
+            ],
+            options={
+                'db_table': 'revenue_ledger',
+                'indexes': [models.Index(fields=['day', 'id'], name='revenue_ledger_day_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,118 @@
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import migrations
+from django.utils import timezone
+
+CHUNK = 1000
+FIELDS = ("payments", "amount", "consultation", "drugs", "other")
+SPLIT_COLUMN = {"CONSULTATION": "consultation", "DRUG": "drugs"}
+
+
+def _aware(value):
+    # Raw cursors return naive UTC datetimes when USE_TZ is on
+    return timezone.make_aware(value, dt_timezone.utc) if timezone.is_naive(value) else value
+
+
+def _local_day(value):
+    return timezone.localtime(_aware(value)).date()
+
+
+def _split(cursor, invoice_ids):
+    parts = defaultdict(lambda: {"consultation": Decimal(0), "drugs": Decimal(0), "other": Decimal(0)})
+    marks = ", ".join(["%s"] * len(invoice_ids))
+    cursor.execute(
+        "SELECT invoice_id, item_type, SUM(quantity * unit_price) FROM invoice_items "
+        f"WHERE invoice_id IN ({marks}) GROUP BY invoice_id, item_type", list(invoice_ids))
+    for invoice_id, item_type, total in cursor.fetchall():
+        parts[invoice_id][SPLIT_COLUMN.get(item_type, "other")] += Decimal(str(total or 0))
+    return parts
+
+
+def backfill(apps, schema_editor):
+    """
+    Fill revenue_ledger / revenue_days from the existing payments, so the
+    revenue figures (read from revenue_days from 0005 on) are complete once
+    migrate finishes. Frozen copy of adminpanel.revenue.backfill(): the ledger
+    tables go through the historical models and the legacy billing tables
+    (unmanaged, their foreign keys are not in the migration state) through raw
+    SQL. `manage.py backfill_revenue` stays available for re-runs.
+    """
+    connection = schema_editor.connection
+    if not {"payments", "invoices", "invoice_items"} <= set(connection.introspection.table_names()):
+        return  # Fresh database without the clinic schema: nothing to backfill
+    RevenueLedger = apps.get_model("adminpanel", "RevenueLedger")
+    RevenueDays = apps.get_model("adminpanel", "RevenueDays")
+    now = timezone.now()
+
+    with connection.cursor() as cursor:
+        last = 0
+        while True:
+            cursor.execute(
+                "SELECT p.id, p.invoice_id, p.amount, p.paid_at FROM payments p "
+                "WHERE p.id > %s AND NOT EXISTS (SELECT 1 FROM revenue_ledger l WHERE l.payment_id = p.id) "
+                "ORDER BY p.id LIMIT %s", [last, CHUNK])
+            payments = cursor.fetchall()
+            if not payments:
+                break
+            parts = _split(cursor, {invoice_id for _, invoice_id, _, _ in payments})
+            RevenueLedger.objects.bulk_create([
+                RevenueLedger(payment_id=pk, invoice_id=invoice_id, day=_local_day(paid_at), amount=amount,
+                              paid_at=_aware(paid_at), created_at=now, **parts[invoice_id])
+                for pk, invoice_id, amount, paid_at in payments
+            ])
+            last = payments[-1][0]
+
+        # PAID invoices without any payment row (older data) count on their creation day
+        last = 0
+        while True:
+            cursor.execute(
+                "SELECT i.id, i.created_at FROM invoices i "
+                "WHERE i.id > %s AND i.status = 'PAID' "
+                "AND NOT EXISTS (SELECT 1 FROM payments p WHERE p.invoice_id = i.id) "
+                "AND NOT EXISTS (SELECT 1 FROM revenue_ledger l WHERE l.invoice_id = i.id) "
+                "ORDER BY i.id LIMIT %s", [last, CHUNK])
+            invoices = cursor.fetchall()
+            if not invoices:
+                break
+            parts = _split(cursor, {pk for pk, _ in invoices})
+            RevenueLedger.objects.bulk_create([
+                RevenueLedger(invoice_id=pk, day=_local_day(created_at), amount=sum(parts[pk].values()),
+                              paid_at=_aware(created_at), created_at=now, **parts[pk])
+                for pk, created_at in invoices
+            ])
+            last = invoices[-1][0]
+
+    # revenue_days: per-day sums and running totals, recomputed from the ledger
+    running = dict.fromkeys(FIELDS, 0)
+    days = []
+    totals = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    for day, amount, consultation, drugs, other in (RevenueLedger.objects
+                                                    .values_list("day", "amount", "consultation", "drugs", "other")
+                                                    .iterator(chunk_size=CHUNK)):
+        row = totals[day]
+        row["payments"] += 1
+        for field, value in zip(FIELDS[1:], (amount, consultation, drugs, other)):
+            row[field] += value
+    for day in sorted(totals):
+        for field in FIELDS:
+            running[field] += totals[day][field]
+        days.append(RevenueDays(day=day, **totals[day], **{f"cum_{f}": running[f] for f in FIELDS}))
+    RevenueDays.objects.all().delete()
+    RevenueDays.objects.bulk_create(days, batch_size=CHUNK)
+
+    from adminpanel import dashboard_cache  # cache keys only, no models
+    dashboard_cache.bump("past")
+    dashboard_cache.bump("today")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0005_revenue_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0006_backfill_revenue_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='revenueledger',
+            name='reverses',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='reversal', to='adminpanel.revenueledger'),
+        ),
+    ]
@@ -47,6 +47,28 @@ class Drug(models.Model):
     def __str__(self): 
         return self.name
 
+class StockMovements(models.Model):
+    """Append-only drug stock ledger; on_hand is the drug's quantity right after the movement (see adminpanel.stock)."""
+    drug = models.ForeignKey(Drug, models.DO_NOTHING, related_name="movements")
+    kind = models.CharField(max_length=8)            # CONSUME / RECEIVE / ADJUST / RETURN
+    quantity = models.IntegerField()                 # signed change
+    on_hand = models.IntegerField()
+    ref_type = models.CharField(max_length=16, blank=True, null=True)   # e.g. APPOINTMENT
+    ref_id = models.BigIntegerField(blank=True, null=True)
+    actor_user = models.ForeignKey("accounts.Users", models.SET_NULL, blank=True, null=True, related_name="+")
+    note = models.CharField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "stock_movements"
+        indexes = [
+            models.Index(fields=["drug", "id"], name="stock_mov_drug_idx"),
+            models.Index(fields=["ref_type", "ref_id"], name="stock_mov_ref_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.drug_id}: {self.quantity:+d} -> {self.on_hand}"
+
 class UserLite(models.Model):
     id = models.BigAutoField(primary_key=True)
     email = models.CharField(max_length=255, unique=True)
@@ -64,3 +86,156 @@ class UserLite(models.Model):
     
     def __str__(self): 
         return f"{self.full_name} ({self.role})"
+
+
+# ---------------------------------------------------------------------------
+# Dashboard rollups (managed). One row per local day (+ dimension), kept up to
+# date by adminpanel.rollups from the appointment / schedule / billing writes.
+# ---------------------------------------------------------------------------
+
+class DailyAppointmentStats(models.Model):
+    day = models.DateField()
+    status = models.CharField(max_length=12)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "daily_appointment_stats"
+        unique_together = (("day", "status"),)
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.total}"
+
+
+class DailyRevenueStats(models.Model):
+    day = models.DateField()
+    item_type = models.CharField(max_length=12)
+    billed = models.DecimalField(max_digits=14, decimal_places=2, default=0)     # invoice lines created that day
+
+    class Meta:
+        db_table = "daily_revenue_stats"
+        unique_together = (("day", "item_type"),)
+
+    def __str__(self):
+        return f"{self.day} {self.item_type}: {self.billed}"
+
+
+class DailyDoctorStats(models.Model):
+    day = models.DateField()
+    doctor = models.ForeignKey("doctors.Doctors", models.CASCADE, related_name="daily_stats")
+    schedules = models.PositiveIntegerField(default=0)
+    open_slots = models.PositiveIntegerField(default=0)
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "daily_doctor_stats"
+        unique_together = (("day", "doctor"),)
+
+    def __str__(self):
+        return f"{self.day} BS #{self.doctor_id}: {self.booked}/{self.open_slots}"
+
+
+class RollupDays(models.Model):
+    """Days whose rollups have been fully computed (backfill / lazy fill marker)."""
+    day = models.DateField(unique=True)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "rollup_days"
+
+    def __str__(self):
+        return f"{self.day}"
+
+
+class ArchivePartitions(models.Model):
+    """One monthly archive table of an append-only history table (see adminpanel.archive)."""
+    source = models.CharField(max_length=64)        # live table, e.g. appointment_logs
+    month = models.DateField()                      # first local day of the month
+    table_name = models.CharField(max_length=64, unique=True)
+    rows = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "archive_partitions"
+        unique_together = (("source", "month"),)
+
+    def __str__(self):
+        return f"{self.table_name} ({self.rows})"
+
+
+class RenderJobs(models.Model):
+    """Queued document render run by `manage.py render_worker` (see adminpanel.render_jobs)."""
+    kind = models.CharField(max_length=32)           # clinic.documents kind, e.g. visit_summary
+    entity_id = models.BigIntegerField()
+    version = models.CharField(max_length=64)        # document fingerprint
+    base_url = models.CharField(max_length=500, blank=True, null=True)
+    status = models.CharField(max_length=8, default="PENDING")   # PENDING / RUNNING / DONE / FAILED
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    requested_by_user = models.ForeignKey("accounts.Users", models.SET_NULL, blank=True, null=True, related_name="+")
+    created_at = models.DateTimeField()
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = "render_jobs"
+        unique_together = (("kind", "entity_id", "version"),)
+        indexes = [models.Index(fields=["status", "id"], name="render_jobs_status_idx")]
+
+    def __str__(self):
+        return f"{self.kind} #{self.entity_id} {self.status}"
+
+
+# ---------------------------------------------------------------------------
+# Revenue ledger (managed), written by adminpanel.revenue when a payment is
+# recorded. Collected revenue is read from here, not from invoice lines.
+# ---------------------------------------------------------------------------
+
+class RevenueLedger(models.Model):
+    """
+    One append-only row per payment, split by invoice line type. Deleting the
+    payment or its invoice appends a reversal row (negated amounts, same day).
+    """
+    # No database constraints: the append-only ledger never blocks deletes elsewhere
+    payment = models.OneToOneField("billing.Payments", models.DO_NOTHING, blank=True, null=True,
+                                   db_constraint=False, related_name="+")   # NULL: PAID invoice without payment row
+    invoice = models.ForeignKey("billing.Invoices", models.DO_NOTHING, db_constraint=False, related_name="+")
+    reverses = models.OneToOneField("self", models.DO_NOTHING, blank=True, null=True,
+                                    db_constraint=False, related_name="reversal")  # set on reversal rows
+    day = models.DateField()                         # local day of the payment
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    consultation = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    drugs = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    other = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_at = models.DateTimeField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "revenue_ledger"
+        indexes = [models.Index(fields=["day", "id"], name="revenue_ledger_day_idx")]
+
+    def __str__(self):
+        return f"{self.day} HĐ #{self.invoice_id}: {self.amount}"
+
+
+class RevenueDays(models.Model):
+    """
+    Ledger totals of one local day plus running totals (cum_*) of every day up
+    to and including it: a period total is cum(to) - cum(day before from).
+    """
+    day = models.DateField(unique=True)
+    payments = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    consultation = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    drugs = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    other = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cum_payments = models.PositiveIntegerField(default=0)
+    cum_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    cum_consultation = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    cum_drugs = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    cum_other = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = "revenue_days"
+
+    def __str__(self):
+        return f"{self.day}: {self.amount} (tổng {self.cum_amount})"
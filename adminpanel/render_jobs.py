@@ -0,0 +1,101 @@
+"""
+Render queue for stored documents (clinic.documents).
+
+Web requests never run a PDF engine: when a document is not in the store yet
+the view calls `enqueue()` and answers with a page/JSON that polls. The
+`render_worker` command claims PENDING jobs (SELECT ... FOR UPDATE SKIP
+LOCKED, so several workers can share the table) and runs them in a bounded
+pool of renderer processes; each process loads WeasyPrint and its fonts once
+(on its first job) and reuses them for every later job.
+
+There is at most one job per (kind, entity, version). A job left RUNNING by a
+worker that died is picked up again after RENDER_JOB_TIMEOUT_SECONDS, up to
+MAX_ATTEMPTS times; a FAILED job runs again only when a retry is asked for.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from clinic import documents
+from .models import RenderJobs
+
+logger = logging.getLogger(__name__)
+
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+DONE = "DONE"
+FAILED = "FAILED"
+
+MAX_ATTEMPTS = 3
+
+# kind -> renderer(entity_id, base_url) that renders and stores the current version
+RENDERERS = {
+    documents.VISIT_SUMMARY: "doctors.visit_summary.render",
+}
+
+
+def timeout():
+    return timedelta(seconds=getattr(settings, "RENDER_JOB_TIMEOUT_SECONDS", 300))
+
+
+def enqueue(kind, entity_id, version, base_url=None, user=None, retry=False):
+    """The job rendering this document version, created as needed; retry=True re-queues a FAILED one."""
+    defaults = {"base_url": base_url, "requested_by_user_id": getattr(user, "pk", user),
+                "created_at": timezone.now()}
+    job, created = RenderJobs.objects.get_or_create(
+        kind=kind, entity_id=entity_id, version=version, defaults=defaults)
+    if not created and retry and job.status == FAILED:
+        RenderJobs.objects.filter(pk=job.pk, status=FAILED).update(
+            status=PENDING, attempts=0, error=None, base_url=base_url or job.base_url)
+        job.refresh_from_db()
+    return job
+
+
+def claim(limit):
+    """Mark up to `limit` runnable jobs RUNNING and return their ids, oldest first."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            RenderJobs.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=PENDING) | Q(status=RUNNING, started_at__lt=now - timeout()),
+                    attempts__lt=MAX_ATTEMPTS)
+            .order_by("id")
+            .values_list("pk", flat=True)[:limit]
+        )
+        if ids:
+            RenderJobs.objects.filter(pk__in=ids).update(
+                status=RUNNING, started_at=now, attempts=F("attempts") + 1)
+    return ids
+
+
+def expire():
+    """Fail RUNNING jobs that timed out on their last attempt. Returns how many."""
+    return RenderJobs.objects.filter(
+        status=RUNNING, started_at__lt=timezone.now() - timeout(), attempts__gte=MAX_ATTEMPTS,
+    ).update(status=FAILED, error="Quá thời gian xử lý.", finished_at=timezone.now())
+
+
+_warm = False
+
+
+def run(job_id):
+    """Render one claimed job (in a renderer process). Returns the final status."""
+    global _warm
+    if not _warm:
+        _warm = True
+        documents.warm_up()
+    job = RenderJobs.objects.get(pk=job_id)
+    try:
+        import_string(RENDERERS[job.kind])(job.entity_id, job.base_url)
+    except Exception as e:
+        logger.exception("Render job %s failed", job_id)
+        status, error = FAILED, f"{type(e).__name__}: {e}"[:1000]
+    else:
+        status, error = DONE, None
+    RenderJobs.objects.filter(pk=job_id).update(status=status, error=error, finished_at=timezone.now())
+    return status
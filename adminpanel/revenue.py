@@ -0,0 +1,228 @@
+"""
+Revenue ledger.
+
+Recording a payment appends one `revenue_ledger` row: local day, amount and
+the split of the invoice lines into consultation / drugs / other. The same
+transaction adds it to its day in `revenue_days`, whose cum_* columns hold
+the running totals of every day up to that one. Reading collected revenue
+never joins invoices, payments and lines again:
+
+- one day: one row of revenue_days;
+- any period: cum(last row on or before date_to) - cum(last row before
+  date_from), two reads on the unique day index;
+- a chart: one range read of revenue_days.
+
+A new day's row starts from the running totals of the row before it, read
+with a lock, so a payment of the previous day still committing is waited for
+rather than missed. Deleting a payment or an invoice appends a reversal row
+(negated, on the original day, see the post_delete receivers in
+adminpanel.signals), so collected revenue drops with the billed rollup and
+the ledger stays append-only. `backfill()` writes ledger rows for payments recorded
+before the ledger existed (migration 0006 runs it once) and `rebuild()`
+recomputes revenue_days from it.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value as V
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from billing.models import InvoiceItems, Invoices, Payments
+from . import dashboard_cache
+from .models import RevenueDays, RevenueLedger
+from .rollups import local_day
+
+FIELDS = ("payments", "amount", "consultation", "drugs", "other")
+SPLIT_FIELDS = ("consultation", "drugs", "other")
+# Invoice line type -> ledger column (anything else counts as "other")
+_SPLIT_COLUMN = {"CONSULTATION": "consultation", "DRUG": "drugs"}
+
+BACKFILL_CHUNK = 1000
+
+_MONEY = DecimalField(max_digits=14, decimal_places=2)
+_LINE_TOTAL = Coalesce(Sum(F("quantity") * F("unit_price"), output_field=_MONEY), V(0, output_field=_MONEY))
+
+
+def _zero():
+    return {f: 0 if f == "payments" else Decimal(0) for f in FIELDS}
+
+
+def split(invoice_ids):
+    """{invoice_id: {consultation, drugs, other}} from the invoice lines, one grouped query."""
+    result = defaultdict(lambda: {f: Decimal(0) for f in SPLIT_FIELDS})
+    for r in (InvoiceItems.objects
+              .filter(invoice_id__in=invoice_ids)
+              .values("invoice_id", "item_type")
+              .annotate(total=_LINE_TOTAL)
+              .order_by()):
+        result[r["invoice_id"]][_SPLIT_COLUMN.get(r["item_type"], "other")] += r["total"]
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------------------
+
+def _add(day, delta):
+    """Add `delta` (FIELDS subset) to a day and to the running totals from that day on."""
+    if not RevenueDays.objects.filter(day=day).exists():
+        previous = RevenueDays.objects.select_for_update().filter(day__lt=day).order_by("-day").first()
+        start = {f"cum_{f}": getattr(previous, f"cum_{f}") for f in FIELDS} if previous else {}
+        try:
+            with transaction.atomic():
+                RevenueDays.objects.create(day=day, **start)
+        except IntegrityError:
+            pass  # Created by a concurrent payment of the same day
+    delta = {f: v for f, v in delta.items() if v}
+    RevenueDays.objects.filter(day=day).update(**{f: F(f) + v for f, v in delta.items()})
+    RevenueDays.objects.filter(day__gte=day).update(**{f"cum_{f}": F(f"cum_{f}") + v for f, v in delta.items()})
+
+
+@transaction.atomic
+def record_payment(payment):
+    """Ledger row of a payment just recorded (call in the same transaction)."""
+    parts = split([payment.invoice_id])[payment.invoice_id]
+    entry = RevenueLedger.objects.create(
+        payment=payment, invoice_id=payment.invoice_id, day=local_day(payment.paid_at),
+        amount=payment.amount, paid_at=payment.paid_at, created_at=timezone.now(), **parts,
+    )
+    _add(entry.day, {"payments": 1, "amount": entry.amount, **parts})
+    transaction.on_commit(lambda: dashboard_cache.invalidate_days({entry.day}))
+    return entry
+
+
+def _reverse(entries):
+    """Append the opposite of every row of `entries` not reversed yet. Returns the rows appended."""
+    now = timezone.now()
+    reversals = []
+    for entry in entries.filter(reverses__isnull=True, reversal__isnull=True).order_by("id"):
+        parts = {f: -getattr(entry, f) for f in SPLIT_FIELDS}
+        reversals.append(RevenueLedger.objects.create(
+            reverses=entry, invoice_id=entry.invoice_id, day=entry.day, amount=-entry.amount,
+            paid_at=entry.paid_at, created_at=now, **parts,
+        ))
+        # On the original day: that day's collected figure drops like its billed figure
+        _add(entry.day, {"payments": -1, "amount": -entry.amount, **parts})
+    if reversals:
+        days = {r.day for r in reversals}
+        transaction.on_commit(lambda: dashboard_cache.invalidate_days(days))
+    return reversals
+
+
+@transaction.atomic
+def reverse_payment(payment_id):
+    """Reverse the ledger row of a deleted payment."""
+    return _reverse(RevenueLedger.objects.filter(payment_id=payment_id))
+
+
+@transaction.atomic
+def reverse_invoice(invoice_id):
+    """Reverse what is left of a deleted invoice (rows of payments deleted before it are skipped)."""
+    return _reverse(RevenueLedger.objects.filter(invoice_id=invoice_id))
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+def _cum_at(day):
+    """Running totals of every day up to and including `day`."""
+    row = (RevenueDays.objects
+           .filter(day__lte=day)
+           .order_by("-day")
+           .values(*[f"cum_{f}" for f in FIELDS])
+           .first())
+    return {f: row[f"cum_{f}"] for f in FIELDS} if row else _zero()
+
+
+def period(date_from, date_to):
+    """Totals ({payments, amount, consultation, drugs, other}) of local days date_from..date_to."""
+    end, start = _cum_at(date_to), _cum_at(date_from - timedelta(days=1))
+    return {f: end[f] - start[f] for f in FIELDS}
+
+
+def day_totals(day):
+    row = RevenueDays.objects.filter(day=day).values(*FIELDS).first()
+    return row or _zero()
+
+
+def daily(date_from, date_to):
+    """{day: amount} of the days with payments in date_from..date_to."""
+    return dict(RevenueDays.objects
+                .filter(day__range=(date_from, date_to))
+                .values_list("day", "amount"))
+
+
+# ---------------------------------------------------------------------------
+# Backfill / rebuild
+# ---------------------------------------------------------------------------
+
+@transaction.atomic
+def rebuild():
+    """Recompute revenue_days from the ledger. Returns the number of days."""
+    rows = (RevenueLedger.objects
+            .values("day")
+            .annotate(recorded=Count("id", filter=Q(reverses__isnull=True)),
+                      reversed=Count("id", filter=Q(reverses__isnull=False)),
+                      amount=Sum("amount"), consultation=Sum("consultation"),
+                      drugs=Sum("drugs"), other=Sum("other"))
+            .order_by("day"))
+    running = _zero()
+    days = []
+    for r in rows:
+        r["payments"] = r["recorded"] - r["reversed"]
+        for f in FIELDS:
+            running[f] += r[f]
+        days.append(RevenueDays(day=r["day"], **{f: r[f] for f in FIELDS},
+                                **{f"cum_{f}": running[f] for f in FIELDS}))
+    RevenueDays.objects.all().delete()
+    RevenueDays.objects.bulk_create(days, batch_size=BACKFILL_CHUNK)
+    return len(days)
+
+
+def _missing_payments():
+    return Payments.objects.exclude(pk__in=RevenueLedger.objects.filter(payment__isnull=False).values("payment_id"))
+
+
+def _missing_paid_invoices():
+    # PAID invoices without any payment row (older data) count on their creation day
+    return (Invoices.objects
+            .filter(status="PAID", payments__isnull=True)
+            .exclude(pk__in=RevenueLedger.objects.values("invoice_id")))
+
+
+def backfill(chunk_size=BACKFILL_CHUNK):
+    """Write the missing ledger rows in chunks, then rebuild revenue_days. Returns rows written."""
+    written = 0
+    now = timezone.now()
+    while True:
+        with transaction.atomic():
+            payments = list(_missing_payments().order_by("id")[:chunk_size])
+            if not payments:
+                break
+            parts = split([p.invoice_id for p in payments])
+            RevenueLedger.objects.bulk_create([
+                RevenueLedger(payment=p, invoice_id=p.invoice_id, day=local_day(p.paid_at), amount=p.amount,
+                              paid_at=p.paid_at, created_at=now, **parts[p.invoice_id])
+                for p in payments
+            ])
+        written += len(payments)
+    while True:
+        with transaction.atomic():
+            invoices = list(_missing_paid_invoices().order_by("id").values_list("id", "created_at")[:chunk_size])
+            if not invoices:
+                break
+            parts = split([pk for pk, _ in invoices])
+            RevenueLedger.objects.bulk_create([
+                RevenueLedger(invoice_id=pk, day=local_day(created_at), paid_at=created_at, created_at=now,
+                              amount=sum(parts[pk].values()), **parts[pk])
+                for pk, created_at in invoices
+            ])
+        written += len(invoices)
+    rebuild()
+    dashboard_cache.bump("past")
+    dashboard_cache.bump("today")
+    return written
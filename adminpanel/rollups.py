@@ -0,0 +1,193 @@
+"""
+Per-local-day rollups behind the admin dashboard.
+
+Writes to appointments, schedules, invoices and invoice items mark the local
+day(s) they touch; after commit only those days are recomputed (a handful of
+grouped queries each). The dashboard then reads O(days) rows from the rollup
+tables instead of scanning every row in its 7/30-day window. Collected
+revenue comes from the payment ledger instead (adminpanel.revenue).
+"""
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum, F, DecimalField, Value as V
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from appointments.models import Appointments, Schedules
+from billing.models import Invoices, InvoiceItems
+from clinic.localdates import group_by_local_day, day_list
+from .models import DailyAppointmentStats, DailyRevenueStats, DailyDoctorStats, RollupDays
+
+# Appointment statuses that occupy a doctor's slot (same as the dashboard's "booked")
+BOOKED_STATUSES = ("PENDING", "CONFIRMED", "IN_PROGRESS", "COMPLETED")
+# Schedule statuses that count towards "open slots" of the day
+SLOT_SCHEDULE_STATUSES = ("OPEN", "CLOSED")
+DEFAULT_SLOT_MINUTES = 30
+# Backfill works through history in chunks of this many days (bounded memory)
+CHUNK_DAYS = 31
+
+_MONEY = DecimalField(max_digits=14, decimal_places=2)
+_LINE_TOTAL = Coalesce(Sum(F("quantity") * F("unit_price"), output_field=_MONEY), V(0, output_field=_MONEY))
+
+
+def local_day(dt):
+    """Local calendar date of a (possibly naive) datetime, or None."""
+    if dt is None:
+        return None
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return timezone.localtime(dt).date()
+
+
+# ---------------------------------------------------------------------------
+# Recompute a range of local days (grouped in SQL, one pass per table)
+# ---------------------------------------------------------------------------
+
+@transaction.atomic
+def refresh_appointments(date_from, date_to):
+    rows = group_by_local_day(Appointments.objects.all(), "appointment_at", date_from, date_to,
+                              by=("status",), total=Count("id"))
+    DailyAppointmentStats.objects.filter(day__range=(date_from, date_to)).delete()
+    DailyAppointmentStats.objects.bulk_create([
+        DailyAppointmentStats(day=r["day"], status=r["status"], total=r["total"]) for r in rows
+    ])
+
+
+@transaction.atomic
+def refresh_doctors(date_from, date_to):
+    stats = {}
+
+    def row(day, doctor_id):
+        return stats.setdefault((day, doctor_id), DailyDoctorStats(day=day, doctor_id=doctor_id))
+
+    schedules = (Schedules.objects
+                 .filter(work_date__range=(date_from, date_to), status__in=SLOT_SCHEDULE_STATUSES)
+                 .values_list("work_date", "doctor_id", "start_time", "end_time", "slot_duration_minutes"))
+    for day, doctor_id, st, en, dur in schedules:
+        minutes = (en.hour * 60 + en.minute) - (st.hour * 60 + st.minute)
+        dur = int(dur or 0) or DEFAULT_SLOT_MINUTES
+        r = row(day, doctor_id)
+        r.schedules += 1
+        r.open_slots += minutes // dur if minutes > 0 else 0
+
+    booked = group_by_local_day(Appointments.objects.filter(status__in=BOOKED_STATUSES), "appointment_at",
+                                date_from, date_to, by=("doctor_id",), cnt=Count("id"))
+    for r in booked:
+        row(r["day"], r["doctor_id"]).booked = r["cnt"]
+
+    DailyDoctorStats.objects.filter(day__range=(date_from, date_to)).delete()
+    DailyDoctorStats.objects.bulk_create(list(stats.values()))
+
+
+@transaction.atomic
+def refresh_revenue(date_from, date_to):
+    # Billed: every invoice line, by the invoice's creation day. Collected
+    # revenue is not rolled up here: it comes from the ledger (adminpanel.revenue).
+    rows = group_by_local_day(InvoiceItems.objects.all(), "invoice__created_at", date_from, date_to,
+                              by=("item_type",), total=_LINE_TOTAL)
+    DailyRevenueStats.objects.filter(day__range=(date_from, date_to)).delete()
+    DailyRevenueStats.objects.bulk_create([
+        DailyRevenueStats(day=r["day"], item_type=r["item_type"] or "OTHER", billed=r["total"]) for r in rows
+    ])
+
+
+@transaction.atomic
+def _refresh_chunk(date_from, date_to):
+    refresh_appointments(date_from, date_to)
+    refresh_doctors(date_from, date_to)
+    refresh_revenue(date_from, date_to)
+    days = day_list(date_from, date_to)
+    RollupDays.objects.filter(day__in=days).delete()
+    RollupDays.objects.bulk_create([RollupDays(day=d, refreshed_at=timezone.now()) for d in days])
+
+
+def refresh_day(day):
+    """Recompute every rollup of one local day and mark it as filled."""
+    refresh_range(day, day)
+
+
+def _refresh_chunks(date_from, date_to):
+    n = 0
+    chunk_from = date_from
+    while chunk_from <= date_to:
+        chunk_to = min(chunk_from + timedelta(days=CHUNK_DAYS - 1), date_to)
+        _refresh_chunk(chunk_from, chunk_to)
+        n += (chunk_to - chunk_from).days + 1
+        chunk_from = chunk_to + timedelta(days=1)
+    return n
+
+
+def refresh_range(date_from, date_to):
+    """Recompute every day in [date_from, date_to], chunk by chunk. Returns the number of days."""
+    n = _refresh_chunks(date_from, date_to)
+    if n:
+        from . import dashboard_cache
+        dashboard_cache.invalidate_days({date_from, date_to})
+    return n
+
+
+def ensure_days(date_from, date_to):
+    """Fill days of the range that were never rolled up (before the first backfill)."""
+    done = set(RollupDays.objects
+               .filter(day__range=(date_from, date_to))
+               .values_list("day", flat=True))
+    missing = [d for d in day_list(date_from, date_to) if d not in done]
+    if missing:
+        # Called while building a dashboard block: fill without invalidating it
+        _refresh_chunks(missing[0], missing[-1])
+
+
+# ---------------------------------------------------------------------------
+# Dirty tracking from write paths
+# ---------------------------------------------------------------------------
+
+_state = threading.local()
+
+
+def _pending():
+    if not hasattr(_state, "pending"):
+        _state.pending = {"appointments": set(), "doctors": set(), "revenue": set(), "invoices": set()}
+    return _state.pending
+
+
+def _flush():
+    pending = _pending()
+    invoice_ids = pending["invoices"]
+    if invoice_ids:
+        pending["invoices"] = set()
+        # Resolve the day an invoice's lines are billed on (its creation day)
+        for created_at in Invoices.objects.filter(id__in=invoice_ids).values_list("created_at", flat=True):
+            pending["revenue"].add(local_day(created_at))
+
+    touched = set()
+    for kind, refresh in (("appointments", refresh_appointments),
+                          ("doctors", refresh_doctors),
+                          ("revenue", refresh_revenue)):
+        days, pending[kind] = pending[kind], set()
+        for day in sorted(days):
+            refresh(day, day)
+        touched |= days
+
+    if touched:
+        from . import dashboard_cache
+        dashboard_cache.invalidate_days(touched)
+
+
+def mark(kind, *days):
+    """Queue local days of one rollup kind for recompute after the current commit."""
+    days = {d for d in days if d is not None}
+    if not days:
+        return
+    _pending()[kind].update(days)
+    transaction.on_commit(_flush)
+
+
+def mark_invoices(*invoice_ids):
+    """Queue invoices whose revenue days are resolved at flush time."""
+    ids = {i for i in invoice_ids if i is not None}
+    if not ids:
+        return
+    _pending()["invoices"].update(ids)
+    transaction.on_commit(_flush)
@@ -0,0 +1,80 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from appointments.models import Appointments, Schedules
+from billing.models import Invoices, InvoiceItems, Payments
+from billing.totals import invoice_totals_changed
+from doctors.pricing import invalidate_rank_fees
+from . import filter_choices, revenue, rollups
+from .models import DoctorRankFee
+
+
+@receiver(post_init, sender=Appointments)
+def remember_appointment_day(sender, instance, **kwargs):
+    # Day the row was loaded with, so a rescheduled appointment also refreshes its old day
+    instance._rollup_day = rollups.local_day(instance.__dict__.get("appointment_at"))
+
+
+@receiver([post_save, post_delete], sender=Appointments)
+def appointment_changed(sender, instance, **kwargs):
+    days = (getattr(instance, "_rollup_day", None), rollups.local_day(instance.appointment_at))
+    rollups.mark("appointments", *days)
+    rollups.mark("doctors", *days)
+    instance._rollup_day = days[1]
+
+
+@receiver(post_init, sender=Schedules)
+def remember_schedule_day(sender, instance, **kwargs):
+    instance._rollup_day = instance.__dict__.get("work_date")
+
+
+@receiver([post_save, post_delete], sender=Schedules)
+def schedule_changed(sender, instance, **kwargs):
+    rollups.mark("doctors", getattr(instance, "_rollup_day", None), instance.work_date)
+    instance._rollup_day = instance.work_date
+
+
+@receiver(post_save, sender=Invoices)
+def invoice_saved(sender, instance, **kwargs):
+    rollups.mark_invoices(instance.pk)
+
+
+@receiver(post_delete, sender=Invoices)
+def invoice_deleted(sender, instance, **kwargs):
+    rollups.mark("revenue", rollups.local_day(instance.created_at))
+    revenue.reverse_invoice(instance.pk)
+
+
+@receiver(post_delete, sender=Payments)
+def payment_deleted(sender, instance, **kwargs):
+    # Collected revenue drops with the payment (bulk .delete() also sends post_delete)
+    revenue.reverse_payment(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=InvoiceItems)
+def invoice_item_changed(sender, instance, **kwargs):
+    rollups.mark_invoices(instance.invoice_id)
+
+
+@receiver(invoice_totals_changed)
+def invoice_totals_recomputed(sender, invoice_ids, **kwargs):
+    # Set-based total updates bypass Invoices.post_save
+    rollups.mark_invoices(*invoice_ids)
+
+
+@receiver([post_save, post_delete], sender=DoctorRankFee)
+def rank_fee_changed(sender, instance, **kwargs):
+    # Fee registry of every worker reloads once the write is committed
+    transaction.on_commit(invalidate_rank_fees)
+
+
+@receiver([post_save, post_delete], sender="doctors.Doctors")
+@receiver([post_save, post_delete], sender="doctors.Specialties")
+@receiver([post_save, post_delete], sender="adminpanel.Specialty")
+@receiver([post_save, post_delete], sender="accounts.Users")
+@receiver([post_save, post_delete], sender="adminpanel.UserLite")
+def filter_choices_changed(sender, instance, **kwargs):
+    # Doctor / specialty dropdowns of the admin lists show these names
+    # (the admin settings pages write them through adminpanel.Specialty / UserLite)
+    filter_choices.invalidate()
@@ -0,0 +1,112 @@
+"""
+Drug stock engine.
+
+`Drug.quantity` is the on-hand figure. Every change goes through this module
+and appends to the `stock_movements` ledger, each row carrying the signed
+change and the on-hand quantity right after it.
+
+`consume()` takes a whole prescription at once: it locks every drug row it
+needs with one SELECT ... FOR UPDATE ordered by id (so concurrent callers
+lock in the same order and cannot deadlock), checks all quantities, applies
+every decrement with one CASE UPDATE and writes the ledger with one bulk
+INSERT. A 30-line prescription costs the same three statements as a 1-line
+one, and two concurrent completions cannot both spend the same units.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+from django.utils import timezone
+
+from .models import Drug, StockMovements
+
+CONSUME = "CONSUME"
+RECEIVE = "RECEIVE"
+ADJUST = "ADJUST"
+RETURN = "RETURN"
+
+
+class InsufficientStock(ValueError):
+    """Some drugs do not have enough stock; .shortages is [(drug_id, name, on_hand, needed)]."""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(" ".join(
+            f"Thuốc '{name}' không đủ hàng. Còn {on_hand}, cần {needed}."
+            for _, name, on_hand, needed in shortages))
+
+
+def _actor_id(actor):
+    return getattr(actor, "pk", actor)
+
+
+@transaction.atomic
+def apply(changes, kind, ref_type=None, ref_id=None, actor=None, note=None, allow_negative=False):
+    """
+    Apply signed quantity changes {drug_id: delta} (or (drug_id, delta) pairs,
+    summed per drug) in three statements. Unknown drug ids are ignored.
+    Raises InsufficientStock, changing nothing, if a drug would go below zero.
+    Returns {drug_id: on_hand after}.
+    """
+    if not isinstance(changes, dict):
+        totals = Counter()
+        for drug_id, delta in changes:
+            totals[drug_id] += delta
+        changes = totals
+    changes = {drug_id: delta for drug_id, delta in changes.items() if drug_id and delta}
+    if not changes:
+        return {}
+
+    locked = list(Drug.objects.select_for_update()
+                  .filter(pk__in=changes)
+                  .order_by("pk")
+                  .values_list("pk", "name", "quantity"))
+    if not allow_negative:
+        shortages = [(pk, name, on_hand, -changes[pk])
+                     for pk, name, on_hand in locked if on_hand + changes[pk] < 0]
+        if shortages:
+            raise InsufficientStock(shortages)
+    if not locked:
+        return {}
+
+    Drug.objects.filter(pk__in=[pk for pk, _, _ in locked]).update(quantity=Case(
+        *[When(pk=pk, then=F("quantity") + changes[pk]) for pk, _, _ in locked],
+        output_field=IntegerField(),
+    ))
+    now, actor_id = timezone.now(), _actor_id(actor)
+    on_hand = {pk: quantity + changes[pk] for pk, _, quantity in locked}
+    StockMovements.objects.bulk_create([
+        StockMovements(drug_id=pk, kind=kind, quantity=changes[pk], on_hand=on_hand[pk],
+                       ref_type=ref_type, ref_id=ref_id, actor_user_id=actor_id, note=note, created_at=now)
+        for pk, _, _ in locked
+    ])
+    return on_hand
+
+
+def consume(lines, ref_type=None, ref_id=None, actor=None, note=None):
+    """Take (drug_id, quantity) lines out of stock, all or nothing."""
+    return apply([(drug_id, -int(quantity)) for drug_id, quantity in lines],
+                 CONSUME, ref_type, ref_id, actor, note)
+
+
+def receive(drug_id, quantity, actor=None, note=None):
+    return apply({drug_id: int(quantity)}, RECEIVE, actor=actor, note=note)
+
+
+def record_adjustment(drug, before, actor=None, note=None):
+    """
+    Ledger row for a quantity set directly on a (locked, already saved) drug,
+    e.g. by the admin drug form.
+    """
+    delta = (drug.quantity or 0) - (before or 0)
+    if delta:
+        StockMovements.objects.create(
+            drug_id=drug.pk, kind=ADJUST if before is not None else RECEIVE, quantity=delta,
+            on_hand=drug.quantity, actor_user_id=_actor_id(actor), note=note, created_at=timezone.now(),
+        )
+    return delta
+
+
+def movements(drug_id, limit=50):
+    """Latest ledger rows of one drug, newest first."""
+    return list(StockMovements.objects.filter(drug_id=drug_id).order_by("-id")[:limit])
@@ -7,6 +7,7 @@ urlpatterns = [
     path("", views.dashboard, name="dashboard"),
     path("debug/", views.debug_dashboard, name="debug_dashboard"),
     path("appointments/", views.appointments, name="appointments"),
+    path("appointments/export/<str:fmt>/", views.appointments_export, name="appointments_export"),
     path("appointments/<int:pk>/", views.appointment_detail, name="appointment_detail"),
     path("doctors/", views.admin_doctors_list, name="admin_doctors_list"),
     path("doctors/create/", views.admin_doctors_create, name="admin_doctors_create"),
@@ -21,6 +22,7 @@ path("staff/", views.admin_staff_list, name="admin_staff_list"),
 path("staff/<int:pk>/update/", views.admin_staff_update, name="admin_staff_update"),
     path("invoices/", views.invoices, name="invoices"),
     path('billing/invoices/', views.invoice_list, name='admin_invoice_list'),
+    path('billing/invoices/export/<str:fmt>/', views.invoice_export, name='admin_invoice_export'),
     path('billing/invoice/<int:pk>/', views.invoice_detail, name='admin_invoice_detail'),
     path('invoices/<int:pk>/print/', views.invoice_print, name='admin_invoice_print'),
     path('billing/invoice/<int:pk>/cash/', views.invoice_cash, name='admin_invoice_cash'),
@@ -3,7 +3,7 @@ from django.db import IntegrityError
 from django.urls import reverse
 from django.db.models import Count, Sum, Q, F, DateTimeField, DecimalField
 from django.utils.timezone import localdate, now, timedelta, make_aware
-from datetime import datetime, time as dt_time
+from datetime import datetime
 from django.db.models.functions import Cast
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
@@ -14,10 +14,14 @@ from django.contrib.auth.hashers import make_password
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from clinic.decorators import role_required
+from clinic.identity import get_identity
+from clinic.localdates import day_list, dense_day_series
 from core.choices import Role
 from appointments.models import Appointments, Schedules, AppointmentLogs
 from billing.models import Invoices, Payments, InvoicePrintLogs, InvoiceItems
+from billing.printing import invoice_response
 from django.views.decorators.http import require_POST
 from django.db.models.functions import Coalesce, TruncDate
 from django.db.models import Value as V, DecimalField
@@ -25,11 +29,13 @@ from doctors.models import Doctors, DoctorSettings, UserExtras
 from accounts.models import Users
 from patients.models import PatientProfiles
 from accounts.models import Users as AccountsUsers
+from accounts.search import search_q
 from django.http import JsonResponse, HttpResponseForbidden
 from django.contrib.auth.hashers import make_password
 from staff.models import StaffProfiles
 from chatbot.models import ChatbotSessions, ChatbotMessages
-from .models import Specialty, DoctorRankFee, Drug, UserLite
+from . import archive, list_filters, revenue, stock
+from .models import Specialty, DoctorRankFee, Drug, StockMovements, UserLite
 from .forms import SpecialtyForm, RankFeeForm, DrugForm, UserRoleForm, CreateUserForm, UpdateUserForm
 @login_required
 @role_required([Role.ADMIN])
@@ -39,10 +45,8 @@ def admin_doctors_list(request):
     st = request.GET.get("status", "")
     qs = Doctors.objects.select_related("user", "specialty").all()
     if q:
-        # Split search terms for better matching
-        terms = q.split()
-        for term in terms:
-            qs = qs.filter(Q(user__full_name__icontains=term) | Q(user__email__icontains=term) | Q(license_number__icontains=term))
+        # Every term must prefix-match a name word / email / license number (accent-insensitive)
+        qs = qs.filter(search_q(q, "user"))
     if sp:
         qs = qs.filter(specialty_id=sp)
     if st == "active":
@@ -177,23 +181,6 @@ def admin_doctor_update(request, doctor_id):
     return JsonResponse({"ok": True})
 
 
-def date_to_datetime_range(date_obj):
-    """Convert a date to timezone-aware datetime range (start and end of day)"""
-    from zoneinfo import ZoneInfo
-    from django.utils import timezone
-    
-    # Get local timezone
-    local_tz = ZoneInfo('Asia/Ho_Chi_Minh')
-    utc_tz = ZoneInfo('UTC')
-    
-    # Create start and end of day in local timezone
-    start_of_day = datetime.combine(date_obj, dt_time.min, tzinfo=local_tz)
-    end_of_day = datetime.combine(date_obj, dt_time.max, tzinfo=local_tz)
-    
-    # Convert to UTC (what Django uses internally)
-    return start_of_day.astimezone(utc_tz), end_of_day.astimezone(utc_tz)
-
-
 @login_required
 @role_required([Role.ADMIN])
 def debug_dashboard(request):
@@ -203,6 +190,116 @@ def debug_dashboard(request):
     return render(request, "adminpanel/debug_dashboard.html", context)
 
 
+def _dashboard_past_block(date_from, date_to):
+    """Rollup data of the closed days [date_from, date_to] (cached long-term)."""
+    from . import rollups
+    from .models import DailyAppointmentStats, DailyRevenueStats, DailyDoctorStats
+
+    appt_map, rev_map, by_day_type, booked_by_doctor = {}, {}, {}, {}
+    if date_to < date_from:
+        return {"appt_map": appt_map, "rev_map": rev_map,
+                "by_day_type": by_day_type, "booked_by_doctor": booked_by_doctor}
+    rollups.ensure_days(date_from, date_to)
+
+    for r in (DailyAppointmentStats.objects
+              .filter(day__range=(date_from, date_to))
+              .values("day")
+              .annotate(total=Sum("total"))):
+        appt_map[r["day"]] = r["total"]
+
+    # Collected revenue per day: one range read of the ledger's day totals
+    rev_map.update((day, float(amount)) for day, amount in revenue.daily(date_from, date_to).items())
+
+    for r in (DailyRevenueStats.objects
+              .filter(day__range=(date_from, date_to))
+              .values("day", "item_type", "billed")):
+        if r["billed"]:
+            per_type = by_day_type.setdefault(r["day"], {})
+            per_type[r["item_type"]] = per_type.get(r["item_type"], 0.0) + float(r["billed"])
+
+    for r in (DailyDoctorStats.objects
+              .filter(day__range=(date_from, date_to), booked__gt=0)
+              .values("doctor_id", "doctor__user__full_name")
+              .annotate(total=Sum("booked"))):
+        booked_by_doctor[r["doctor_id"]] = (r["doctor__user__full_name"], r["total"])
+
+    return {"appt_map": appt_map, "rev_map": rev_map,
+            "by_day_type": by_day_type, "booked_by_doctor": booked_by_doctor}
+
+
+def _dashboard_today_block(today):
+    """KPIs and per-doctor numbers of the current local day (cached briefly)."""
+    from . import rollups
+    from .models import DailyAppointmentStats, DailyRevenueStats, DailyDoctorStats
+
+    rollups.ensure_days(today, today)
+
+    status_today = dict(DailyAppointmentStats.objects.filter(day=today).values_list("status", "total"))
+
+    revenue_today = revenue.day_totals(today)["amount"]
+    type_today = {}
+    for r in DailyRevenueStats.objects.filter(day=today).values("item_type", "billed"):
+        if r["billed"]:
+            type_today[r["item_type"]] = float(r["billed"])
+
+    # Doctors by specialty
+    by_spec = (
+        Doctors.objects.select_related("specialty")
+        .values("specialty__name")
+        .annotate(total=Count("id"))
+        .order_by("specialty__name")
+    )
+
+    # Appointment status distribution today
+    states = [
+        ("PENDING", "Chờ xác nhận"),
+        ("CONFIRMED", "Đã xác nhận"),
+        ("IN_PROGRESS", "Đang khám"),
+        ("COMPLETED", "Hoàn tất"),
+        ("CANCELLED", "Đã hủy"),
+        ("NO_SHOW", "Không đến"),
+    ]
+
+    # Doctor performance today (doctors with a schedule) and bookings for the top 5
+    doctor_perf_rows = []
+    booked_by_doctor = {}
+    for r in (DailyDoctorStats.objects
+              .filter(day=today)
+              .values("doctor_id", "doctor__user__full_name", "schedules", "open_slots", "booked")):
+        name = r["doctor__user__full_name"]
+        if r["booked"]:
+            booked_by_doctor[r["doctor_id"]] = (name, r["booked"])
+        if not r["schedules"]:
+            continue
+        open_slots = r["open_slots"]
+        booked = r["booked"]
+        fill = 0 if open_slots <= 0 else round(booked * 100.0 / open_slots, 1)
+        doctor_perf_rows.append({
+            "doctor_id": r["doctor_id"],
+            "doctor_name": name or f"BS #{r['doctor_id']}",
+            "open_slots": open_slots,
+            "booked": booked,
+            "utilization": fill,
+        })
+
+    # Sort by utilization (high to low)
+    doctor_perf_rows.sort(key=lambda r: r["utilization"], reverse=True)
+
+    return {
+        "appt_today": sum(status_today.values()),
+        "revenue_today": revenue_today,
+        "type_today": type_today,
+        "unpaid": Invoices.objects.filter(status="UNPAID").count(),
+        "active_doctors": Doctors.objects.filter(user__is_active=1).count(),
+        "chart_doc_spec_labels": [x["specialty__name"] or "Khác" for x in by_spec],
+        "chart_doc_spec_data": [x["total"] for x in by_spec],
+        "chart_appt_status_labels": [vn for code, vn in states],
+        "chart_appt_status_data": [status_today.get(code, 0) for code, vn in states],
+        "doctor_perf_rows": doctor_perf_rows,
+        "booked_by_doctor": booked_by_doctor,
+    }
+
+
 def _get_dashboard_context(request):
     """Helper function to get dashboard context - shared by dashboard and debug views"""
     try:
@@ -216,217 +313,62 @@ def _get_dashboard_context(request):
 
         today = localdate()
         date_from = today - timedelta(days=days - 1)
-        
-        # Get timezone-aware datetime ranges
-        today_start, today_end = date_to_datetime_range(today)
-        date_from_start, _ = date_to_datetime_range(date_from)
 
-        # 2) KPI
-        from decimal import Decimal
-        
-        appt_today = Appointments.objects.filter(appointment_at__range=(today_start, today_end)).count()
-        
-        # Revenue today - check payment date OR (no payments and created today)
-        paid_today_qs = Invoices.objects.filter(
-            status='PAID'
-        ).filter(
-            Q(payments__paid_at__gte=today_start, payments__paid_at__lte=today_end) | 
-            Q(payments__isnull=True, created_at__gte=today_start, created_at__lte=today_end)
-        ).distinct()
-        
-        # Get invoice IDs and calculate total from items
-        paid_today_ids = list(paid_today_qs.values_list('id', flat=True))
-        if paid_today_ids:
-            revenue_today = InvoiceItems.objects.filter(
-                invoice_id__in=paid_today_ids
-            ).aggregate(
-                total=Coalesce(
-                    Sum(
-                        F('quantity') * F('unit_price'),
-                        output_field=DecimalField(max_digits=12, decimal_places=2)
-                    ),
-                    V(0, output_field=DecimalField())
-                )
-            ).get('total') or Decimal(0)
-        else:
-            revenue_today = Decimal(0)
-        
-        unpaid = Invoices.objects.filter(status="UNPAID").count()
-        active_doctors = Doctors.objects.filter(user__is_active=1).count()
-
-        # 3) Appointments by day - group by local date (not UTC!)
-        from zoneinfo import ZoneInfo
-        local_tz = ZoneInfo('Asia/Ho_Chi_Minh')
-        
-        appointments_in_range = Appointments.objects.filter(
-            appointment_at__range=(date_from_start, today_end)
+        from . import dashboard_cache
+        past = dashboard_cache.get_block(
+            "past", (days, today.isoformat()),
+            lambda: _dashboard_past_block(date_from, today - timedelta(days=1)),
         )
-        
-        appt_map = {}
-        for appt in appointments_in_range:
-            # Convert to local timezone, then extract date
-            local_dt = appt.appointment_at.astimezone(local_tz)
-            local_date = local_dt.date()
-            appt_map[local_date] = appt_map.get(local_date, 0) + 1
-
-        # 4) Revenue by day - group by local date (not UTC!)
-        # Get paid invoices in range with their payment dates
-        invoices_in_range = Invoices.objects.filter(
-            status="PAID"
-        ).filter(
-            Q(payments__paid_at__gte=date_from_start, payments__paid_at__lte=today_end) |
-            Q(payments__isnull=True, created_at__gte=date_from_start, created_at__lte=today_end)
-        ).distinct().select_related().prefetch_related('items', 'payments')
-        
-        rev_map = {}
-        for inv in invoices_in_range:
-            # Use payment date if available, otherwise creation date
-            payment = inv.payments.first()
-            if payment:
-                local_dt = payment.paid_at.astimezone(local_tz)
-            else:
-                local_dt = inv.created_at.astimezone(local_tz)
-            local_date = local_dt.date()
-            
-            # Calculate total from items instead of amount_due
-            items_total = sum(float(item.quantity * item.unit_price) for item in inv.items.all())
-            rev_map[local_date] = rev_map.get(local_date, 0.0) + items_total
-
-        # 5) Build continuous labels and series (fill zero for missing days)
-        chart_labels = []
-        chart_appt = []
-        chart_revenue = []
-        for i in range(days):
-            d = date_from + timedelta(days=i)
-            chart_labels.append(d.strftime("%d/%m"))
-            chart_appt.append(appt_map.get(d, 0))
-            chart_revenue.append(rev_map.get(d, 0.0))
-
-        # 6) Doctors by specialty
-        by_spec = (
-            Doctors.objects.select_related("specialty")
-            .values("specialty__name")
-            .annotate(total=Count("id"))
-            .order_by("specialty__name")
+        cur = dashboard_cache.get_block(
+            "today", (today.isoformat(),),
+            lambda: _dashboard_today_block(today),
         )
-        chart_doc_spec_labels = [x["specialty__name"] or "Khác" for x in by_spec]
-        chart_doc_spec_data = [x["total"] for x in by_spec]
 
-        # 7) Revenue by item type per day (stacked) - group by local date
-        from collections import defaultdict
-        
-        item_invoices = InvoiceItems.objects.filter(
-            invoice__created_at__range=(date_from_start, today_end)
-        ).select_related('invoice')
-        
-        by_day_type = defaultdict(lambda: defaultdict(float))
-        all_types = set()
-        for item in item_invoices:
-            # Convert invoice created_at to local timezone, then extract date
-            local_dt = item.invoice.created_at.astimezone(local_tz)
-            local_date = local_dt.date()
-            t = item.item_type or "OTHER"
-            v = float(item.quantity or 0) * float(item.unit_price or 0)
-            by_day_type[local_date][t] += v
-            all_types.add(t)
-        all_types = sorted(all_types)
+        # KPI
+        appt_today = cur["appt_today"]
+        revenue_today = cur["revenue_today"]
+        # Whole window from the ledger's running totals: two reads, not cached
+        revenue_period = revenue.period(date_from, today)["amount"]
+        unpaid = cur["unpaid"]
+        active_doctors = cur["active_doctors"]
+
+        # Build continuous labels and series (fill zero for missing days)
+        appt_map = {**past["appt_map"], today: appt_today}
+        rev_map = {**past["rev_map"], today: float(revenue_today)}
+        by_day_type = {**past["by_day_type"], today: cur["type_today"]}
+        all_types = sorted({t for per_type in by_day_type.values() for t in per_type})
+
+        chart_labels = [d.strftime("%d/%m") for d in day_list(date_from, today)]
+        chart_appt = dense_day_series(appt_map, date_from, today)
+        chart_revenue = dense_day_series(rev_map, date_from, today, default=0.0)
 
+        chart_doc_spec_labels = cur["chart_doc_spec_labels"]
+        chart_doc_spec_data = cur["chart_doc_spec_data"]
+
+        # Revenue by item type per day (stacked)
         chart_rev_type_labels = chart_labels[:]
         chart_rev_type_datasets = []
         for t in all_types:
-            data = []
-            for i in range(days):
-                d = date_from + timedelta(days=i)
-                data.append(by_day_type[d].get(t, 0))
-            chart_rev_type_datasets.append({"label": t, "data": data})
-
-        # 5) Appointment status distribution today
-        states = [
-            ("PENDING", "Chờ xác nhận"),
-            ("CONFIRMED", "Đã xác nhận"),
-            ("IN_PROGRESS", "Đang khám"),
-            ("COMPLETED", "Hoàn tất"),
-            ("CANCELLED", "Đã hủy"),
-            ("NO_SHOW", "Không đến"),
-        ]
-        today_appt = Appointments.objects.filter(appointment_at__range=(today_start, today_end))
-        chart_appt_status_labels = [vn for code, vn in states]
-        chart_appt_status_data = [today_appt.filter(status=code).count() for code, vn in states]
-
-        # Helper function to convert time to minutes
-        def _minutes(t):
-            return t.hour * 60 + t.minute
-
-        # --- DOCTOR PERFORMANCE TODAY ---
-        schedules = (
-            Schedules.objects
-            .select_related("doctor", "doctor__user")
-            .filter(work_date=today, status__in=["OPEN", "CLOSED"])
-        )
+            per_day = {d: v[t] for d, v in by_day_type.items() if t in v}
+            chart_rev_type_datasets.append({"label": t, "data": dense_day_series(per_day, date_from, today)})
 
-        # Calculate total slots per doctor
-        slots_by_doctor = {}
-        for s in schedules:
-            st = _minutes(s.start_time)
-            en = _minutes(s.end_time)
-            dur = int(s.slot_duration_minutes or 0) or 30
-            # Fix: Ensure we don't get negative slots and handle edge cases
-            if en > st and dur > 0:
-                total_slots = (en - st) // dur
-            else:
-                total_slots = 0
-            
-            doctor_name = s.doctor.user.full_name if getattr(s.doctor, "user", None) else f"BS #{s.doctor_id}"
-            
-            did = s.doctor_id
-            if did not in slots_by_doctor:
-                slots_by_doctor[did] = {
-                    "name": doctor_name,
-                    "open_slots": 0,
-                }
-            slots_by_doctor[did]["open_slots"] += total_slots
-
-
-        # Count booked appointments (valid status only)
-        valid_status = ["PENDING", "CONFIRMED", "IN_PROGRESS", "COMPLETED"]
-        appt_today_by_doctor = (
-            Appointments.objects
-            .filter(appointment_at__range=(today_start, today_end), status__in=valid_status)
-            .values("doctor_id")
-            .annotate(cnt=Count("id"))
-        )
-        booked_map = {x["doctor_id"]: x["cnt"] for x in appt_today_by_doctor}
-
-        doctor_perf_rows = []
-        for did, info in slots_by_doctor.items():
-            open_slots = info["open_slots"]
-            booked = booked_map.get(did, 0)
-            fill = 0 if open_slots <= 0 else round(booked * 100.0 / open_slots, 1)
-            doctor_perf_rows.append({
-                "doctor_id": did,
-                "doctor_name": info["name"],
-                "open_slots": open_slots,
-                "booked": booked,
-                "utilization": fill,
-            })
-
-        # Sort by utilization (high to low)
-        doctor_perf_rows.sort(key=lambda r: r["utilization"], reverse=True)
+        chart_appt_status_labels = cur["chart_appt_status_labels"]
+        chart_appt_status_data = cur["chart_appt_status_data"]
+        doctor_perf_rows = cur["doctor_perf_rows"]
 
         # --- TOP 5 DOCTORS BY APPOINTMENTS (7/30 DAYS) ---
-        appt_range = (
-            Appointments.objects
-            .filter(appointment_at__range=(date_from_start, today_end), status__in=valid_status)
-            .values("doctor_id", "doctor__user__full_name")
-            .annotate(total=Count("id"))
-            .order_by("-total")[:5]
-        )
-        top5_labels = [x["doctor__user__full_name"] or f"BS #{x['doctor_id']}" for x in appt_range]
-        top5_data = [x["total"] for x in appt_range]
+        totals = {did: list(v) for did, v in past["booked_by_doctor"].items()}
+        for did, (name, n) in cur["booked_by_doctor"].items():
+            totals.setdefault(did, [name, 0])[1] += n
+        top5 = sorted(totals.items(), key=lambda kv: kv[1][1], reverse=True)[:5]
+        top5_labels = [name or f"BS #{did}" for did, (name, n) in top5]
+        top5_data = [n for did, (name, n) in top5]
+        cache_stats = dashboard_cache.stats()
 
         context = {
             "appt_today": appt_today,
             "revenue_today": revenue_today,
+            "revenue_period": revenue_period,
             "unpaid": unpaid,
             "active_doctors": active_doctors,
 
@@ -450,6 +392,8 @@ def _get_dashboard_context(request):
             "doctor_perf_rows": doctor_perf_rows,
             "top5_doctor_labels": top5_labels,
             "top5_doctor_data": top5_data,
+
+            "cache_stats": cache_stats,
         }
 
         return context
@@ -466,6 +410,7 @@ def _get_dashboard_context(request):
         context = {
             "appt_today": 0,
             "revenue_today": 0,
+            "revenue_period": 0,
             "unpaid": 0,
             "active_doctors": 0,
             "day_range": 7,
@@ -483,6 +428,7 @@ def _get_dashboard_context(request):
             "doctor_perf_rows": [],
             "top5_doctor_labels": [],
             "top5_doctor_data": [],
+            "cache_stats": {},
         }
         return context
 
@@ -498,91 +444,57 @@ def dashboard(request):
 @login_required
 @role_required([Role.ADMIN])
 def appointments(request):
-    """Admin appointments list with filters, KPI, and pagination"""
-    from django.core.paginator import Paginator
+    """Admin appointments list with filters, KPI, and keyset pagination"""
     from django.utils import timezone
-    from datetime import datetime
-    
-    # Parse date helper
-    def _parse_date(s):
-        try:
-            return datetime.strptime(s, "%d/%m/%Y").date()
-        except Exception:
-            return None
-    
-    # Get filter parameters
-    q = request.GET.get("q", "").strip()
-    date_from = _parse_date(request.GET.get("date_from", ""))
-    date_to = _parse_date(request.GET.get("date_to", ""))
-    doctor_id = request.GET.get("doctor_id") or None
-    specialty_id = request.GET.get("specialty_id") or None
-    status = request.GET.get("status") or None
-    source = request.GET.get("source") or None
-    order = request.GET.get("order", "desc")
-    page = int(request.GET.get("page", 1))
-    page_size = int(request.GET.get("page_size", 10))
-
-    # Base queryset
-    qs = (Appointments.objects
-          .select_related("doctor", "doctor__user", "doctor__specialty",
-                          "patient", "patient__user"))
-
-    # Apply filters
-    if date_from and date_to:
-        qs = qs.filter(appointment_at__date__range=(date_from, date_to))
-    elif date_from:
-        qs = qs.filter(appointment_at__date__gte=date_from)
-    elif date_to:
-        qs = qs.filter(appointment_at__date__lte=date_to)
-
-    if doctor_id:
-        qs = qs.filter(doctor_id=doctor_id)
-    if specialty_id:
-        qs = qs.filter(doctor__specialty_id=specialty_id)
-    if status:
-        qs = qs.filter(status=status)
-    if source:
-        qs = qs.filter(source=source)
-    if q:
-        # Split search terms for better matching
-        terms = q.split()
-        for term in terms:
-            qs = qs.filter(
-                Q(patient__user__full_name__icontains=term) |
-                Q(patient__user__phone__icontains=term) |
-                Q(doctor__user__full_name__icontains=term)
-        )
+    from clinic import keyset
+    from .filter_choices import filter_choices
 
-    # Sort by appointment time
-    if order == "asc":
-        qs = qs.order_by("appointment_at")
-    else:
-        qs = qs.order_by("-appointment_at")
+    # Get filter parameters (shared with the CSV/XLSX export)
+    filters = list_filters.appointment_filters(request.GET)
+    q, doctor_id, specialty_id = filters["q"], filters["doctor_id"], filters["specialty_id"]
+    status, source, order = filters["status"], filters["source"], filters["order"]
+    try:
+        page_size = min(max(int(request.GET.get("page_size", 10)), 1), 100)
+        start_index = max(int(request.GET.get("start", 0)), 0)
+    except ValueError:
+        page_size, start_index = 10, 0
 
-    # KPI based on current filters
+    qs = list_filters.appointments(filters)
+
+    # KPI based on current filters: one conditional aggregate
     now = timezone.now()
-    kpi = {
-        "upcoming": qs.filter(appointment_at__gte=now,
-                              status__in=["PENDING", "CONFIRMED"]).count(),
-        "in_progress": qs.filter(status="IN_PROGRESS").count(),
-        "completed": qs.filter(status="COMPLETED").count(),
-        "cancelled": qs.filter(status="CANCELLED").count(),
-    }
+    kpi = qs.aggregate(
+        total=Count("id"),
+        upcoming=Count("id", filter=Q(appointment_at__gte=now, status__in=["PENDING", "CONFIRMED"])),
+        in_progress=Count("id", filter=Q(status="IN_PROGRESS")),
+        completed=Count("id", filter=Q(status="COMPLETED")),
+        cancelled=Count("id", filter=Q(status="CANCELLED")),
+    )
 
-    # Pagination
-    paginator = Paginator(qs, page_size)
-    page_obj = paginator.get_page(page)
-    start_index = (page_obj.number - 1) * paginator.per_page
+    # Keyset pagination on (appointment_at, id): bounded cost at any depth
+    page_obj = keyset.paginate(
+        qs.select_related("doctor", "doctor__user", "doctor__specialty", "patient", "patient__user"),
+        "appointment_at", page_size,
+        after=request.GET.get("after"), before=request.GET.get("before"),
+        descending=(order != "asc"),
+    )
+    if request.GET.get("before") and not page_obj.has_previous:
+        start_index = 0
 
-    # Data for filter dropdowns
-    doctors = Doctors.objects.select_related("user").all()
-    specialties = Doctors.objects.select_related("specialty").values_list(
-        "specialty_id", "specialty__name"
-    ).distinct()
+    # Query string of the filters, for the pagination links
+    base_query = request.GET.copy()
+    for key in ("after", "before", "start"):
+        base_query.pop(key, None)
+
+    # Data for filter dropdowns (cached)
+    choices = filter_choices()
 
     context = {
         "appointments_page": page_obj,
         "start_index": start_index,
+        "next_start": start_index + len(page_obj),
+        "prev_start": max(start_index - page_size, 0),
+        "base_query": base_query.urlencode(),
         "filters": {
             "q": q,
             "date_from": request.GET.get("date_from", ""),
@@ -595,12 +507,53 @@ def appointments(request):
             "page_size": page_size,
         },
         "kpi": kpi,
-        "doctors": doctors,
-        "specialties": specialties,
+        "doctors": choices["doctors"],
+        "specialties": choices["specialties"],
     }
     return render(request, "adminpanel/appointments.html", context)
 
 
+APPOINTMENT_EXPORT_COLUMNS = [
+    ("Mã lịch hẹn", "id"),
+    ("Thời gian khám", "appointment_at"),
+    ("Bệnh nhân", "patient__user__full_name"),
+    ("SĐT bệnh nhân", "patient__user__phone"),
+    ("Bác sĩ", "doctor__user__full_name"),
+    ("Chuyên khoa", "doctor__specialty__name"),
+    ("Trạng thái", "status"),
+    ("Nguồn", "source"),
+    ("Ngày tạo", "created_at"),
+]
+
+
+def _export_rows(rows, columns, labels):
+    """Rows with the status codes of `labels` ({column: {code: label}}) in Vietnamese."""
+    mapped = [(columns.index(column), names) for column, names in labels.items()]
+    for row in rows:
+        row = list(row)
+        for i, names in mapped:
+            row[i] = names.get(row[i], row[i])
+        yield row
+
+
+@login_required
+@role_required([Role.ADMIN])
+def appointments_export(request, fmt):
+    """Filtered appointments list as a streamed CSV / XLSX file"""
+    from django.http import Http404
+    from clinic import exports, keyset
+    from clinic.templatetags.vi_labels import APPT_LABEL_VI
+
+    if fmt not in exports.FORMATS:
+        raise Http404
+    filters = list_filters.appointment_filters(request.GET)
+    header, columns = zip(*APPOINTMENT_EXPORT_COLUMNS)
+    rows = keyset.iterate(list_filters.appointments(filters), "appointment_at", columns,
+                          descending=(filters["order"] != "asc"))
+    return exports.response(fmt, f"lich_hen_{localdate():%Y%m%d}", header,
+                            _export_rows(rows, columns, {"status": APPT_LABEL_VI}), sheet_name="Lịch hẹn")
+
+
 @login_required
 @role_required([Role.ADMIN])
 def appointment_detail(request, pk):
@@ -611,7 +564,8 @@ def appointment_detail(request, pk):
         ),
         pk=pk
     )
-    return render(request, "adminpanel/appointment_detail.html", {"appointment": appointment})
+    logs = archive.appointment_logs(appointment)
+    return render(request, "adminpanel/appointment_detail.html", {"appointment": appointment, "logs": logs})
 
 
 @login_required
@@ -622,7 +576,7 @@ def doctors(request):
           .order_by("user__full_name"))
     q = request.GET.get("q")
     if q:
-        qs = qs.filter(Q(user__full_name__icontains=q) | Q(license_number__icontains=q))
+        qs = qs.filter(search_q(q, "user"))
     return render(request, "adminpanel/doctors.html", {"items": qs[:200]})
 
 
@@ -650,10 +604,8 @@ def patients_list(request):
     q = (request.GET.get("q", "") or "").strip()
     qs = PatientProfiles.objects.select_related("user").all().order_by("user__full_name")
     if q:
-        # Split search terms for better matching
-        terms = q.split()
-        for term in terms:
-            qs = qs.filter(Q(user__full_name__icontains=term) | Q(user__email__icontains=term) | Q(cccd__icontains=term) | Q(user__phone__icontains=term))
+        # Every term must prefix-match a name word / email / CCCD / phone (accent-insensitive)
+        qs = qs.filter(search_q(q, "user"))
     paginator = Paginator(qs, 10)
     page_obj = paginator.get_page(request.GET.get("page") or 1)
     # KPI (nếu chưa có dữ liệu thì 0)
@@ -779,11 +731,14 @@ def patient_delete(request, pk):
         user = p.user
         
         # Xóa cascade: xóa tất cả dữ liệu liên quan trước khi xóa patient
-        # 1. Xóa appointments của bệnh nhân này
-        Appointments.objects.filter(patient=p).delete()
+        # 1. Xóa appointment logs / tin nhắn chatbot đã lưu trữ (bảng archive không có khóa ngoại)
+        archive.purge("appointment_logs",
+                      appointment_id__in=list(Appointments.objects.filter(patient=p).values_list("id", flat=True)))
+        archive.purge("chatbot_messages",
+                      session_id__in=list(ChatbotSessions.objects.filter(user=user).values_list("id", flat=True)))
         
-        # 2. Xóa appointment logs liên quan
-        AppointmentLogs.objects.filter(appointment__patient=p).delete()
+        # 2. Xóa appointments của bệnh nhân này (logs đang dùng bị xóa theo CASCADE)
+        Appointments.objects.filter(patient=p).delete()
         
         # 3. Xóa invoices của bệnh nhân này (nếu có)
         Invoices.objects.filter(appointment__patient=p).delete()
@@ -813,7 +768,7 @@ def admin_patients_list(request):
     q = (request.GET.get("q", "") or "").strip()
     qs = PatientProfiles.objects.select_related("user").all().order_by("user__full_name")
     if q:
-        qs = qs.filter(Q(user__full_name__icontains=q) | Q(user__email__icontains=q) | Q(cccd__icontains=q))
+        qs = qs.filter(search_q(q, "user"))
     
     # Pagination
     from django.core.paginator import Paginator
@@ -852,11 +807,8 @@ def admin_staff_list(request):
     q = (request.GET.get("q", "") or "").strip()
     qs = StaffProfiles.objects.select_related("user").all().order_by("user__full_name")
     if q:
-        # Split search terms for better matching
-        terms = q.split()
-        for term in terms:
-            qs = qs.filter(Q(user__full_name__icontains=term) | Q(user__email__icontains=term) | 
-                           Q(employee_code__icontains=term) | Q(cccd__icontains=term))
+        # Every term must prefix-match a name word / email / employee code / CCCD (accent-insensitive)
+        qs = qs.filter(search_q(q, "user"))
     return render(request, "adminpanel/staff_list.html", {"staff": qs, "q": q})
 
 
@@ -1015,11 +967,14 @@ def admin_patient_delete(request, pk):
         user = p.user
         
         # Xóa cascade: xóa tất cả dữ liệu liên quan trước khi xóa patient
-        # 1. Xóa appointments của bệnh nhân này
-        Appointments.objects.filter(patient=p).delete()
+        # 1. Xóa appointment logs / tin nhắn chatbot đã lưu trữ (bảng archive không có khóa ngoại)
+        archive.purge("appointment_logs",
+                      appointment_id__in=list(Appointments.objects.filter(patient=p).values_list("id", flat=True)))
+        archive.purge("chatbot_messages",
+                      session_id__in=list(ChatbotSessions.objects.filter(user=user).values_list("id", flat=True)))
         
-        # 2. Xóa appointment logs liên quan
-        AppointmentLogs.objects.filter(appointment__patient=p).delete()
+        # 2. Xóa appointments của bệnh nhân này (logs đang dùng bị xóa theo CASCADE)
+        Appointments.objects.filter(patient=p).delete()
         
         # 3. Xóa invoices của bệnh nhân này (nếu có)
         Invoices.objects.filter(appointment__patient=p).delete()
@@ -1053,50 +1008,28 @@ def invoices(request):
     return render(request, "adminpanel/invoices.html", {"items": qs[:200]})
 
 
+# Invoice total from its items
+_ITEMS_TOTAL = Coalesce(
+    Sum(
+        F('items__quantity') * F('items__unit_price'),
+        output_field=DecimalField(max_digits=12, decimal_places=2)
+    ),
+    V(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+)
+
+
 @login_required
 def invoice_list(request):
     from django.core.paginator import Paginator
+    # Filters shared with the CSV/XLSX export
     qs = (
-        Invoices.objects
+        list_filters.invoices(request.GET)
         .select_related('appointment__patient__user', 'appointment__doctor__user')
         .order_by('-created_at')
     )
 
-    status = request.GET.get('status')
-    if status in ('UNPAID', 'PAID'):
-        qs = qs.filter(status=status)
-    doctor_id = request.GET.get('doctor')
-    if doctor_id:
-        qs = qs.filter(appointment__doctor_id=doctor_id)
-    q = request.GET.get('q')
-    if q:
-        # Split search terms and search for each word in full_name or cccd
-        search_terms = q.strip().split()
-        if search_terms:
-            # Build query to match all terms
-            query = Q()
-            for term in search_terms:
-                query &= Q(appointment__patient__user__full_name__icontains=term)
-            # OR search in CCCD
-            query |= Q(appointment__patient__cccd__icontains=q)
-            qs = qs.filter(query)
-    
     # Add annotation after filters to calculate total from items
-    qs = qs.annotate(
-        total=Coalesce(
-            Sum(
-                F('items__quantity') * F('items__unit_price'),
-                output_field=DecimalField(max_digits=12, decimal_places=2)
-            ),
-            V(0, output_field=DecimalField(max_digits=12, decimal_places=2))
-        )
-    )
-    date_from = request.GET.get('from')
-    date_to = request.GET.get('to')
-    if date_from:
-        qs = qs.filter(created_at__date__gte=date_from)
-    if date_to:
-        qs = qs.filter(created_at__date__lte=date_to)
+    qs = qs.annotate(total=_ITEMS_TOTAL)
 
     paginator = Paginator(qs, 20)
     page_obj = paginator.get_page(request.GET.get('page'))
@@ -1104,48 +1037,14 @@ def invoice_list(request):
     # Get list of doctors for filter dropdown
     doctors_list = Doctors.objects.select_related('user').filter(user__is_active=True).order_by('user__full_name')
 
-    from zoneinfo import ZoneInfo
-    local_tz = ZoneInfo('Asia/Ho_Chi_Minh')
     today = localdate()
     
-    # Get timezone-aware datetime range for today
-    from datetime import datetime, time as dt_time
-    today_start = timezone.make_aware(datetime.combine(today, dt_time.min), local_tz)
-    today_end = timezone.make_aware(datetime.combine(today, dt_time.max), local_tz)
-    
-    unpaid_today = Invoices.objects.filter(
-        status='UNPAID', 
-        created_at__gte=today_start,
-        created_at__lte=today_end
-    ).count()
-    
-    # Count invoices paid today - check payment datetime range OR (no payments and created today)
-    paid_today_qs = Invoices.objects.filter(
-        status='PAID'
-    ).filter(
-        Q(payments__paid_at__gte=today_start, payments__paid_at__lte=today_end) | 
-        Q(payments__isnull=True, created_at__gte=today_start, created_at__lte=today_end)
-    ).distinct()
-    paid_today = paid_today_qs.count()
-    
-    # Revenue today - calculate total from items for invoices paid today
-    # Get invoice IDs first to avoid join issues
-    paid_today_ids = list(paid_today_qs.values_list('id', flat=True))
-    
-    if paid_today_ids:
-        revenue_today = InvoiceItems.objects.filter(
-            invoice_id__in=paid_today_ids
-        ).aggregate(
-            s=Coalesce(
-                Sum(
-                    F('quantity') * F('unit_price'),
-                    output_field=DecimalField(max_digits=12, decimal_places=2)
-                ),
-                V(0, output_field=DecimalField(max_digits=12, decimal_places=2))
-            )
-        )['s']
-    else:
-        revenue_today = 0
+    unpaid_today = Invoices.objects.for_local_day(today).filter(status='UNPAID').count()
+
+    # Payments and revenue of today: one row of the revenue ledger's day totals
+    totals_today = revenue.day_totals(today)
+    paid_today = totals_today['payments']
+    revenue_today = totals_today['amount']
 
     return render(request, 'adminpanel/billing/invoices_list.html', {
         'page_obj': page_obj,
@@ -1156,6 +1055,36 @@ def invoice_list(request):
     })
 
 
+INVOICE_EXPORT_COLUMNS = [
+    ("Mã hóa đơn", "id"),
+    ("Ngày tạo", "created_at"),
+    ("Bệnh nhân", "appointment__patient__user__full_name"),
+    ("CCCD", "appointment__patient__cccd"),
+    ("Bác sĩ", "appointment__doctor__user__full_name"),
+    ("Trạng thái", "status"),
+    ("Tổng tiền", "total"),
+    ("Phải thu", "amount_due"),
+    ("Ngày in", "printed_at"),
+]
+
+
+@login_required
+@role_required([Role.ADMIN])
+def invoice_export(request, fmt):
+    """Filtered invoice list as a streamed CSV / XLSX file"""
+    from django.http import Http404
+    from clinic import exports, keyset
+    from clinic.templatetags.vi_labels import INV_LABEL_VI
+
+    if fmt not in exports.FORMATS:
+        raise Http404
+    header, columns = zip(*INVOICE_EXPORT_COLUMNS)
+    qs = list_filters.invoices(request.GET).annotate(total=_ITEMS_TOTAL)
+    rows = keyset.iterate(qs, "created_at", columns)
+    return exports.response(fmt, f"hoa_don_{localdate():%Y%m%d}", header,
+                            _export_rows(rows, columns, {"status": INV_LABEL_VI}), sheet_name="Hóa đơn")
+
+
 @login_required
 @require_POST
 @transaction.atomic
@@ -1178,7 +1107,7 @@ def invoice_cash(request, pk):
         ext_user = user
     
     # Create payment record
-    Payments.objects.create(
+    payment = Payments.objects.create(
         invoice=inv,
         amount=total,
         method="CASH",
@@ -1192,6 +1121,7 @@ def invoice_cash(request, pk):
     inv.amount_due = 0
     inv.subtotal = total
     inv.save(update_fields=['status', 'amount_due', 'subtotal'])
+    revenue.record_payment(payment)
     
     messages.success(request, f'Đã nhận tiền mặt cho hóa đơn #{inv.id:05d}.')
     return redirect('adminpanel:admin_invoice_list')
@@ -1233,15 +1163,7 @@ def invoice_print(request, pk):
         "phone": "(0236) 3731 111",
     }
 
-    return render(
-        request,
-        "billing/invoice_print.html",
-        {
-            "invoice": invoice,
-            "lines": lines,
-            "clinic": clinic,
-        },
-    )
+    return invoice_response(request, invoice, lines, clinic)
 
 
 @login_required
@@ -1329,7 +1251,9 @@ def drug_create(request):
     if request.method == "POST":
         form = DrugForm(request.POST)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                drug = form.save()
+                stock.record_adjustment(drug, None, get_identity(request).id, "Tồn kho ban đầu")
             messages.success(request, "Đã thêm thuốc.")
     return redirect(f"{reverse('adminpanel:settings')}?tab=drugs")
 
@@ -1338,9 +1262,16 @@ def drug_create(request):
 def drug_update(request, pk):
     obj = get_object_or_404(Drug, pk=pk)
     if request.method == "POST":
-        form = DrugForm(request.POST, instance=obj)
-        if form.is_valid():
-            form.save()
+        with transaction.atomic():
+            # Khóa dòng thuốc để số lượng nhập tay không ghi đè một lần xuất kho đồng thời
+            obj = Drug.objects.select_for_update().get(pk=pk)
+            before = obj.quantity
+            form = DrugForm(request.POST, instance=obj)
+            saved = form.is_valid()
+            if saved:
+                drug = form.save()
+                stock.record_adjustment(drug, before, get_identity(request).id, "Điều chỉnh tồn kho")
+        if saved:
             messages.success(request, "Đã cập nhật thuốc.")
     return redirect(f"{reverse('adminpanel:settings')}?tab=drugs")
 
@@ -1350,16 +1281,16 @@ def drug_delete(request, pk):
     obj = get_object_or_404(Drug, pk=pk)
     if request.method == "POST":
         try:
-            obj.delete()
+            with transaction.atomic():
+                # Lịch sử tồn kho của thuốc bị xóa cùng thuốc (khôi phục lại nếu không xóa được thuốc)
+                StockMovements.objects.filter(drug=obj).delete()
+                obj.delete()
             messages.success(request, "Đã xóa thuốc.")
         except IntegrityError:
             # Thuốc đang được tham chiếu bởi prescriptions → không thể xóa cứng
             # Chuyển sang vô hiệu hóa thay thế
-            obj.is_active = 0
-            try:
-                obj.save(update_fields=["is_active"])
-            except Exception:
-                pass
+            # (theo pk: obj.delete() có thể đã xóa obj.pk trước khi lỗi được báo lúc commit)
+            Drug.objects.filter(pk=pk).update(is_active=0)
             messages.warning(request, "Thuốc đang được sử dụng trong đơn thuốc nên không thể xóa. Hệ thống đã chuyển sang trạng thái 'Không kích hoạt'.")
     return redirect(f"{reverse('adminpanel:settings')}?tab=drugs")
 
@@ -1432,6 +1363,8 @@ def user_delete(request, pk):
             # 3. Xóa appointments và schedules liên quan đến doctor này
             try:
                 doctor = Doctors.objects.get(user_id=user.id)
+                archive.purge("appointment_logs", appointment_id__in=list(
+                    Appointments.objects.filter(doctor=doctor).values_list("id", flat=True)))
                 Appointments.objects.filter(doctor=doctor).delete()
                 Schedules.objects.filter(doctor=doctor).delete()
             except Doctors.DoesNotExist:
@@ -1439,8 +1372,9 @@ def user_delete(request, pk):
             except Exception as e:
                 print(f"Error deleting appointments/schedules: {e}")
             
-            # 4. Xóa appointment logs
+            # 4. Xóa appointment logs (cả bản đã lưu trữ)
             AppointmentLogs.objects.filter(actor_user_id=user.id).delete()
+            archive.purge("appointment_logs", actor_user_id=user.id)
             
             # 5. Xóa invoices và payments được tạo bởi user này
             Invoices.objects.filter(created_by_user_id=user.id).delete()
@@ -1448,7 +1382,9 @@ def user_delete(request, pk):
             Payments.objects.filter(received_by_user_id=user.id).delete()
             InvoicePrintLogs.objects.filter(printed_by_user_id=user.id).delete()
             
-            # 6. Xóa chatbot sessions và messages
+            # 6. Xóa chatbot sessions và messages (cả bản đã lưu trữ)
+            archive.purge("chatbot_messages",
+                          session_id__in=list(ChatbotSessions.objects.filter(user_id=user.id).values_list("id", flat=True)))
             ChatbotSessions.objects.filter(user_id=user.id).delete()
             # ChatbotMessages không có user_id, chỉ có sender (string)
             
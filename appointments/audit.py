@@ -0,0 +1,152 @@
+"""
+Buffered writer for AppointmentLogs.
+
+`record()` does not insert anything itself. The entry is handed over when the
+surrounding transaction commits (immediately in autocommit mode), so entries
+of a rolled-back transaction are dropped together with the state change they
+describe. Inside a `collect()` scope, committed entries are kept in a
+thread-local buffer and written with one bulk INSERT when the outermost scope
+exits; AuditLogMiddleware opens such a scope around every request, so a
+consult that logs STARTED, UPDATED_RECORD, UPDATED_PRESCRIPTION and COMPLETED
+costs one INSERT. Outside any scope an entry is written as soon as it commits.
+
+Entries recorded with deferred=True (non-critical notes) go to a background
+writer thread instead when AUDIT_LOG_ASYNC is on, so they add no round trip to
+the request at all. The thread writes in batches and is drained at exit.
+"""
+import atexit
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import AppointmentLogs
+
+logger = logging.getLogger(__name__)
+
+ASYNC_BATCH_SIZE = 200
+
+_state = threading.local()
+
+
+def _buffer():
+    if not hasattr(_state, "buffer"):
+        _state.buffer = []
+        _state.depth = 0
+    return _state.buffer
+
+
+def write(entries):
+    """Insert AppointmentLogs rows with one statement."""
+    if entries:
+        AppointmentLogs.objects.bulk_create(entries)
+    return len(entries)
+
+
+def _committed(entry, deferred):
+    if deferred and getattr(settings, "AUDIT_LOG_ASYNC", False):
+        _writer.put(entry)
+    elif getattr(_state, "depth", 0):
+        _buffer().append(entry)
+    else:
+        write([entry])
+
+
+def record(appointment, action, actor=None, note=None, deferred=False):
+    """
+    Queue one log row of an appointment (instance or id); actor is a
+    Users instance or id. Written after the current transaction commits.
+    """
+    entry = AppointmentLogs(action=action, note=note, created_at=timezone.now())
+    if isinstance(appointment, int):
+        entry.appointment_id = appointment
+    else:
+        entry.appointment = appointment
+    if actor is None or isinstance(actor, int):
+        entry.actor_user_id = actor
+    else:
+        entry.actor_user = actor
+    transaction.on_commit(partial(_committed, entry, deferred))
+    return entry
+
+
+def flush():
+    """Write the entries buffered so far by this thread's collect() scope."""
+    entries, _state.buffer = _buffer(), []
+    return write(entries)
+
+
+@contextmanager
+def collect():
+    """Buffer committed log entries and write them with one INSERT when the outermost scope exits."""
+    _buffer()
+    _state.depth += 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+        if not _state.depth:
+            flush()
+
+
+class _AsyncWriter:
+    """Background thread writing deferred entries in batches."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def put(self, entry):
+        self.queue.put(entry)
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                    self.thread.start()
+
+    def _take(self, block):
+        batch = []
+        try:
+            batch.append(self.queue.get(block=block))
+            while len(batch) < ASYNC_BATCH_SIZE:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        try:
+            write(batch)
+        except Exception:
+            logger.exception("Could not write %d deferred appointment log entries", len(batch))
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    def _run(self):
+        while True:
+            batch = self._take(block=True)
+            close_old_connections()
+            self._write(batch)
+
+    def drain(self):
+        """Write whatever is still queued, in the calling thread."""
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+
+_writer = _AsyncWriter()
+atexit.register(_writer.drain)
+
+
+def drain_async():
+    _writer.drain()
@@ -11,6 +11,11 @@ LOG_ACTION = {
     "PRESCRIPTION_DRAFTED": "PRESCRIPTION_DRAFTED",
     "PRESCRIPTION_SIGNED": "PRESCRIPTION_SIGNED",
     "RESCHEDULED": "RESCHEDULED",
+    "SCHEDULE_CLOSED": "SCHEDULE_CLOSED",  # booked appointment kept on a closed schedule, to follow up
 }
 
+# Statuses that don't count as occupied slots
+EXCLUDE_STATUSES = ("CANCELLED", "NO_SHOW")
 
+# Patients can book from today up to today + BOOKING_WINDOW_DAYS
+BOOKING_WINDOW_DAYS = 5
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.management.commands.rebuild_slot_index import parse_date
+from appointments.models import Schedules
+from appointments.schedule_overlap import Window, sweep
+
+
+class Command(BaseCommand):
+    help = "Report schedules of the same doctor and day whose time windows overlap."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First work date (YYYY-MM-DD, default: all)")
+        parser.add_argument("--to", dest="date_to", help="Last work date (YYYY-MM-DD, default: all)")
+        parser.add_argument("--doctor", type=int, help="Only check this doctor id")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per round trip")
+
+    def handle(self, *args, **options):
+        qs = Schedules.objects.all()
+        if options.get("date_from"):
+            qs = qs.filter(work_date__gte=parse_date(options["date_from"]))
+        if options.get("date_to"):
+            qs = qs.filter(work_date__lte=parse_date(options["date_to"]))
+        if options.get("doctor"):
+            qs = qs.filter(doctor_id=options["doctor"])
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        # One sorted stream; the sweep keeps only the windows still open
+        rows = (qs.order_by("doctor_id", "work_date", "start_time", "end_time")
+                .values_list(*Window._fields)
+                .iterator(chunk_size=options["chunk_size"]))
+        conflicts, days = 0, set()
+        for a, b in sweep(Window(*row) for row in rows):
+            conflicts += 1
+            days.add((a.doctor_id, a.work_date))
+            self.stdout.write(
+                f"doctor #{a.doctor_id} {a.work_date}: "
+                f"#{a.id} {a.start_time:%H:%M}-{a.end_time:%H:%M} overlaps "
+                f"#{b.id} {b.start_time:%H:%M}-{b.end_time:%H:%M}"
+            )
+
+        style = self.style.WARNING if conflicts else self.style.SUCCESS
+        self.stdout.write(style(f"{conflicts} overlapping pairs on {len(days)} doctor-days"))
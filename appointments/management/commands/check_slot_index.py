@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointments import slot_index
+from appointments.management.commands.rebuild_slot_index import parse_date
+
+
+class Command(BaseCommand):
+    help = "Check the schedule slot index against schedules and appointments; optionally repair it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First work date (YYYY-MM-DD, default: today)")
+        parser.add_argument("--to", dest="date_to", help="Last work date (YYYY-MM-DD, default: from + 30 days)")
+        parser.add_argument("--doctor", type=int, help="Only check this doctor id")
+        parser.add_argument("--fix", action="store_true", help="Rebuild every inconsistent doctor-day")
+
+    def handle(self, *args, **options):
+        date_from = parse_date(options["date_from"]) if options.get("date_from") else timezone.localdate()
+        date_to = parse_date(options["date_to"]) if options.get("date_to") else date_from + timedelta(days=30)
+        if date_to < date_from:
+            raise CommandError("--to must not be before --from")
+
+        checked = broken = 0
+        for doctor_id, work_date in slot_index.indexed_days(date_from, date_to, options.get("doctor")):
+            checked += 1
+            problems = slot_index.check_day(doctor_id, work_date)
+            if not problems:
+                continue
+            broken += 1
+            for problem in problems:
+                self.stdout.write(f"doctor #{doctor_id} {work_date}: {problem}")
+            if options.get("fix"):
+                slot_index.rebuild_day(doctor_id, work_date)
+
+        summary = f"Checked {checked} doctor-days, {broken} inconsistent"
+        if broken and options.get("fix"):
+            summary += " (rebuilt)"
+        style = self.style.SUCCESS if not broken or options.get("fix") else self.style.WARNING
+        self.stdout.write(style(summary))
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointments import schedule_templates
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Generate Schedules for N weeks from each doctor's DoctorSettings defaults (skips exceptions/holidays)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First work date (YYYY-MM-DD, default: today)")
+        parser.add_argument("--weeks", type=int, default=4, help="Number of weeks to generate (default: 4)")
+        parser.add_argument("--doctor", type=int, action="append", help="Only this doctor id (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=schedule_templates.DEFAULT_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Print the diff, write nothing")
+
+    def handle(self, *args, **options):
+        date_from = parse_date(options["date_from"]) if options.get("date_from") else timezone.localdate()
+        weeks = options["weeks"]
+        if weeks < 1:
+            raise CommandError("--weeks must be at least 1")
+
+        result = schedule_templates.generate(
+            date_from, weeks, options.get("doctor"),
+            dry_run=options["dry_run"], batch_size=max(1, options["batch_size"]),
+        )
+        if options["dry_run"]:
+            for action, doctor_id, day, a, b in result.diff():
+                detail = a if action in ("skip", "overlap") else f"{a:%H:%M}-{b:%H:%M}"
+                self.stdout.write(f"  {action:7} doctor={doctor_id} {day} {detail}")
+        if options["dry_run"]:
+            summary = f"[dry-run] Would create {len(result.create)} schedules"
+        else:
+            summary = f"Created {result.created} schedules"
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary}; {len(result.existing)} already exist, "
+            f"{len(result.excluded)} skipped by exceptions, {len(result.overlapping)} overlapping"
+        ))
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from appointments import slot_index
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized schedule slot index (schedule_slots) for a date range."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First work date (YYYY-MM-DD, default: today)")
+        parser.add_argument("--to", dest="date_to", help="Last work date (YYYY-MM-DD, default: from + 30 days)")
+        parser.add_argument("--doctor", type=int, help="Only rebuild this doctor id")
+
+    def handle(self, *args, **options):
+        date_from = parse_date(options["date_from"]) if options.get("date_from") else timezone.localdate()
+        date_to = parse_date(options["date_to"]) if options.get("date_to") else date_from + timedelta(days=30)
+        if date_to < date_from:
+            raise CommandError("--to must not be before --from")
+
+        days, slots = slot_index.rebuild_range(date_from, date_to, options.get("doctor"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt slot index {date_from}..{date_to}: {days} doctor-days, {slots} slots"
+        ))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments import sweeper
+
+
+class Command(BaseCommand):
+    help = ("Move past-due appointments: CONFIRMED -> NO_SHOW, PENDING -> CANCELLED after a grace period. "
+            "Safe to run concurrently on several nodes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--no-show-grace", type=int,
+                            help="Minutes after its time a CONFIRMED appointment becomes NO_SHOW "
+                                 "(default: APPOINTMENT_NO_SHOW_GRACE_MINUTES)")
+        parser.add_argument("--pending-grace", type=int,
+                            help="Minutes after its time a PENDING appointment is cancelled "
+                                 "(default: APPOINTMENT_PENDING_GRACE_MINUTES)")
+        parser.add_argument("--chunk-size", type=int, default=sweeper.DEFAULT_CHUNK_SIZE,
+                            help=f"Appointments per chunk/transaction (default: {sweeper.DEFAULT_CHUNK_SIZE})")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the due appointments")
+
+    def handle(self, *args, **options):
+        for name in ("no_show_grace", "pending_grace"):
+            if options.get(name) is not None and options[name] < 0:
+                raise CommandError(f"--{name.replace('_', '-')} must not be negative")
+        rules = sweeper.default_rules(options.get("no_show_grace"), options.get("pending_grace"))
+        started = time.monotonic()
+
+        if options["dry_run"]:
+            due = sweeper.count_due(rules)
+            self.stdout.write(self.style.SUCCESS(
+                "[dry-run] Due: " + ", ".join(f"{count} -> {status}" for status, count in due.items())
+            ))
+            return
+
+        def progress(rule, swept, stats):
+            self.stdout.write(f"  {rule.from_status} -> {rule.to_status}: {stats.swept[rule.to_status]} so far")
+
+        stats = sweeper.sweep(rules, chunk_size=max(1, options["chunk_size"]), on_chunk=progress)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Swept {stats.total} appointments ("
+            + ", ".join(f"{count} -> {status}" for status, count in stats.swept.items())
+            + f") in {stats.chunks} chunks, {elapsed:.1f}s"
+        ))
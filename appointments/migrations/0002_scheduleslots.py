@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0001_initial'),
+        ('doctors', '0004_add_avatar_column'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleSlots',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('work_date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='slots', to='appointments.appointments')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='doctors.doctors')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='appointments.schedules')),
+            ],
+            options={
+                'db_table': 'schedule_slots',
+                'managed': True,
+                'unique_together': {('doctor', 'work_date', 'start_time')},
+            },
+        ),
+    ]
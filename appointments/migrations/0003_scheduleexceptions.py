@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_scheduleslots'),
+        ('doctors', '0004_add_avatar_column'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleExceptions',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('reason', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to='doctors.doctors')),
+            ],
+            options={
+                'db_table': 'schedule_exceptions',
+                'managed': True,
+                'indexes': [models.Index(fields=['day'], name='schedule_exc_day_idx')],
+                'unique_together': {('doctor', 'day')},
+            },
+        ),
+    ]
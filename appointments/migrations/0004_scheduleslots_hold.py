@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_scheduleexceptions'),
+        ('patients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduleslots',
+            name='held_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='slot_holds', to='patients.patientprofiles'),
+        ),
+        migrations.AddField(
+            model_name='scheduleslots',
+            name='held_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('appointments', '0004_scheduleslots_hold'),
+    ]
+
+    # appointment_logs is unmanaged; the monthly archiver selects by created_at
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE INDEX appointment_logs_created_at_idx ON appointment_logs (created_at, id);",
+            reverse_sql="DROP INDEX appointment_logs_created_at_idx ON appointment_logs;",
+        ),
+    ]
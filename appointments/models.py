@@ -1,5 +1,6 @@
 from django.db import models
 from core.choices import ScheduleStatus, ApptStatus, Source
+from clinic.localdates import LocalDayQuerySet
 
 class Schedules(models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -16,6 +17,10 @@ class Schedules(models.Model):
         db_table = 'schedules'
         unique_together = (('doctor','work_date','start_time','end_time'),)
 
+class AppointmentQuerySet(LocalDayQuerySet):
+    local_day_field = "appointment_at"
+
+
 class Appointments(models.Model):
     id = models.BigAutoField(primary_key=True)
     patient = models.ForeignKey("patients.PatientProfiles", models.CASCADE, related_name="appointments")
@@ -29,6 +34,8 @@ class Appointments(models.Model):
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
 
+    objects = AppointmentQuerySet.as_manager()
+
     class Meta:
         managed = False
         db_table = 'appointments'
@@ -45,3 +52,47 @@ class AppointmentLogs(models.Model):
     class Meta:
         managed = False
         db_table = 'appointment_logs'
+
+
+class ScheduleSlots(models.Model):
+    """Materialized slot index: one row per bookable slot of an OPEN schedule.
+
+    Rows are (re)built per (doctor, work_date) from `Schedules` and point to the
+    appointment occupying the slot, so availability is a single indexed read.
+    A free slot can be held for a few minutes by a patient in the booking wizard.
+    See appointments.slot_index.
+    """
+    id = models.BigAutoField(primary_key=True)
+    doctor = models.ForeignKey("doctors.Doctors", models.CASCADE, related_name="slots")
+    schedule = models.ForeignKey(Schedules, models.CASCADE, related_name="slots")
+    work_date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    appointment = models.ForeignKey(Appointments, models.SET_NULL, blank=True, null=True, related_name="slots")
+    # Short-lived hold taken in booking step 2; expired holds are simply ignored
+    held_by = models.ForeignKey("patients.PatientProfiles", models.SET_NULL, blank=True, null=True,
+                                related_name="slot_holds")
+    held_until = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'schedule_slots'
+        unique_together = (('doctor', 'work_date', 'start_time'),)
+
+
+class ScheduleExceptions(models.Model):
+    """Days the schedule generator must skip: a doctor's leave, or a clinic-wide
+    holiday when `doctor` is empty. See appointments.schedule_templates.
+    """
+    id = models.BigAutoField(primary_key=True)
+    doctor = models.ForeignKey("doctors.Doctors", models.CASCADE, blank=True, null=True,
+                               related_name="schedule_exceptions")
+    day = models.DateField()
+    reason = models.CharField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        managed = True
+        db_table = 'schedule_exceptions'
+        unique_together = (('doctor', 'day'),)
+        indexes = [models.Index(fields=['day'], name='schedule_exc_day_idx')]
@@ -0,0 +1,134 @@
+"""
+Bulk open / close of working schedules.
+
+`set_status()` flips every Schedules row of a date range (for some doctors, or
+all of them) with one UPDATE. Closing also handles the PENDING / CONFIRMED
+appointments already booked on those days in one set-based pass: they are
+either cancelled or only flagged for staff follow-up, and one AppointmentLogs
+row per appointment is written with a single bulk INSERT.
+
+UPDATE and bulk_create bypass the model signals, so the slot index and the
+dashboard rollups of the touched days are refreshed explicitly after commit.
+"""
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.choices import ApptStatus, ScheduleStatus
+from . import slot_index
+from .constants import LOG_ACTION
+from .models import AppointmentLogs, Appointments, Schedules
+
+CANCEL = "cancel"  # cancel the booked appointments
+FLAG = "flag"      # keep them, only log that their schedule was closed
+ACTIVE_STATUSES = (ApptStatus.PENDING, ApptStatus.CONFIRMED)
+
+
+@dataclass
+class BulkResult:
+    """Summary of a bulk operation."""
+    status: str
+    schedules: int = 0
+    days: int = 0
+    appointments: list = field(default_factory=list)  # (id, doctor_id, patient_id, appointment_at)
+    cancelled: int = 0
+    flagged: int = 0
+    dry_run: bool = False
+
+    def as_dict(self):
+        return {
+            "status": self.status,
+            "schedules": self.schedules,
+            "days": self.days,
+            "appointments": len(self.appointments),
+            "cancelled": self.cancelled,
+            "flagged": self.flagged,
+            "dry_run": self.dry_run,
+        }
+
+
+def _schedules(date_from, date_to, doctor_ids=None):
+    qs = Schedules.objects.filter(work_date__range=(date_from, date_to))
+    if doctor_ids:
+        qs = qs.filter(doctor_id__in=doctor_ids)
+    return qs
+
+
+def affected_appointments(date_from, date_to, doctor_ids=None):
+    """PENDING / CONFIRMED appointments of these doctors on these local days."""
+    qs = Appointments.objects.in_local_range(date_from, date_to).filter(status__in=ACTIVE_STATUSES)
+    if doctor_ids:
+        qs = qs.filter(doctor_id__in=doctor_ids)
+    return qs
+
+
+def _refresh_derived(pairs, appointment_days):
+    from adminpanel import rollups
+    for doctor_id, work_date in sorted(pairs, key=lambda p: (p[1], p[0])):
+        slot_index.rebuild_day(doctor_id, work_date)
+    rollups.mark("doctors", *{work_date for _, work_date in pairs}, *appointment_days)
+    rollups.mark("appointments", *appointment_days)
+
+
+def set_status(date_from, date_to, status, doctor_ids=None, on_booked=CANCEL,
+               actor_id=None, reason=None, dry_run=False):
+    """
+    Open or close every schedule of [date_from, date_to] (both local dates,
+    inclusive) of the given doctors, or of every doctor when doctor_ids is empty.
+
+    When closing, booked appointments are cancelled (on_booked=CANCEL) or left
+    as they are and flagged in their logs (on_booked=FLAG). Returns a BulkResult.
+    """
+    if status not in ScheduleStatus.values:
+        raise ValueError(f"Unknown schedule status {status!r}")
+    if on_booked not in (CANCEL, FLAG):
+        raise ValueError(f"Unknown on_booked policy {on_booked!r}")
+    if date_to < date_from:
+        raise ValueError("date_to is before date_from")
+
+    result = BulkResult(status=status, dry_run=dry_run)
+    with transaction.atomic():
+        schedules = _schedules(date_from, date_to, doctor_ids)
+        pairs = set(schedules.values_list("doctor_id", "work_date"))
+        result.days = len({work_date for _, work_date in pairs})
+
+        if status == ScheduleStatus.CLOSED:
+            booked = affected_appointments(date_from, date_to, doctor_ids)
+            if not dry_run:
+                booked = booked.select_for_update()
+            result.appointments = list(booked.values_list("id", "doctor_id", "patient_id", "appointment_at"))
+
+        if dry_run:
+            result.schedules = schedules.exclude(status=status).count()
+            if on_booked == CANCEL:
+                result.cancelled = len(result.appointments)
+            else:
+                result.flagged = len(result.appointments)
+            return result
+
+        now = timezone.now()
+        result.schedules = schedules.exclude(status=status).update(status=status)
+
+        appointment_days = set()
+        if result.appointments:
+            ids = [row[0] for row in result.appointments]
+            note = "Lịch làm việc đã bị đóng" + (f": {reason}" if reason else "")
+            if on_booked == CANCEL:
+                result.cancelled = Appointments.objects.filter(id__in=ids).update(
+                    status=ApptStatus.CANCELLED, updated_at=now)
+                action = LOG_ACTION["CANCELLED"]
+            else:
+                result.flagged = len(ids)
+                action = LOG_ACTION["SCHEDULE_CLOSED"]
+            AppointmentLogs.objects.bulk_create([
+                AppointmentLogs(appointment_id=i, action=action, actor_user_id=actor_id, note=note, created_at=now)
+                for i in ids
+            ])
+            booked_pairs = {(row[1], timezone.localtime(row[3]).date()) for row in result.appointments}
+            appointment_days = {day for _, day in booked_pairs}
+            pairs |= booked_pairs
+
+        if result.schedules or result.cancelled:
+            transaction.on_commit(lambda: _refresh_derived(pairs, appointment_days))
+    return result
@@ -0,0 +1,114 @@
+"""
+Overlap guard for working schedules.
+
+The table's unique key only rejects exact duplicates of (doctor, work_date,
+start_time, end_time), so 08:00-12:00 and 09:00-11:00 could coexist. Two
+windows of a doctor overlap when each starts before the other ends (touching
+windows, 08:00-10:00 and 10:00-12:00, are fine). `overlapping()` is that
+interval lookup on the (doctor, work_date, ...) index; writers lock the
+doctor row first so two concurrent creates cannot both pass the check.
+
+`sweep()` finds every conflict of a sorted stream of windows in one pass and
+backs the `check_schedule_overlaps` audit command.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+
+from doctors.models import Doctors
+from .models import Appointments, Schedules
+
+REJECT = "reject"
+MERGE = "merge"
+
+Window = namedtuple("Window", "id doctor_id work_date start_time end_time slot_duration_minutes")
+_FIELDS = Window._fields
+
+
+class ScheduleOverlapError(ValueError):
+    """The window overlaps existing schedules of the doctor (listed in .conflicts)."""
+
+    def __init__(self, conflicts, message=None):
+        self.conflicts = list(conflicts)
+        super().__init__(message or "Khung lịch bị trùng với: " + ", ".join(
+            f"{w.start_time:%H:%M}-{w.end_time:%H:%M}" for w in self.conflicts))
+
+
+def overlaps(a_start, a_end, b_start, b_end):
+    return a_start < b_end and b_start < a_end
+
+
+def first_overlap(windows, start_time, end_time):
+    """First of `windows` overlapping [start_time, end_time), or None."""
+    return next((w for w in windows if overlaps(w.start_time, w.end_time, start_time, end_time)), None)
+
+
+def overlapping(doctor_id, work_date, start_time, end_time, exclude_id=None):
+    """Existing windows of the doctor on that day overlapping [start_time, end_time)."""
+    qs = Schedules.objects.filter(
+        doctor_id=doctor_id, work_date=work_date,
+        start_time__lt=end_time, end_time__gt=start_time,
+    )
+    if exclude_id:
+        qs = qs.exclude(pk=exclude_id)
+    return [Window(*row) for row in qs.order_by("start_time").values_list(*_FIELDS)]
+
+
+def lock_doctors(doctor_ids):
+    """Serialize schedule writes per doctor (call inside a transaction)."""
+    list(Doctors.objects.select_for_update().filter(pk__in=doctor_ids).order_by("pk").values_list("pk", flat=True))
+
+
+def sweep(windows):
+    """
+    Yield (earlier, later) for every overlapping pair of a stream of windows
+    sorted by (doctor_id, work_date, start_time). Keeps only the windows still
+    open at the current start, so it is one pass over the stream.
+    """
+    key, active = None, []
+    for w in windows:
+        if (w.doctor_id, w.work_date) != key:
+            key, active = (w.doctor_id, w.work_date), []
+        active = [a for a in active if a.end_time > w.start_time]
+        for a in active:
+            yield a, w
+        active.append(w)
+
+
+def create_schedule(doctor_id, work_date, start_time, end_time, slot_duration_minutes,
+                    status, created_at, on_overlap=REJECT):
+    """
+    Create a schedule unless it overlaps another window of the doctor that day.
+
+    on_overlap=MERGE instead widens one overlapping window to the union of all of
+    them (they must share the slot duration): appointments of the absorbed rows
+    are moved to it and those rows deleted. Returns (schedule, created).
+    """
+    with transaction.atomic():
+        lock_doctors([doctor_id])
+        conflicts = overlapping(doctor_id, work_date, start_time, end_time)
+        if not conflicts:
+            schedule = Schedules.objects.create(
+                doctor_id=doctor_id, work_date=work_date, start_time=start_time, end_time=end_time,
+                slot_duration_minutes=slot_duration_minutes, status=status, created_at=created_at,
+            )
+            return schedule, True
+        if on_overlap != MERGE:
+            raise ScheduleOverlapError(conflicts)
+        return _merge(conflicts, start_time, end_time, slot_duration_minutes), False
+
+
+def _merge(conflicts, start_time, end_time, slot_duration_minutes):
+    if any(w.slot_duration_minutes != slot_duration_minutes for w in conflicts):
+        raise ScheduleOverlapError(conflicts, "Không thể gộp các khung lịch có thời lượng slot khác nhau.")
+    keep, absorbed = conflicts[0].id, [w.id for w in conflicts[1:]]
+    if absorbed:
+        Appointments.objects.filter(schedule_id__in=absorbed).update(schedule_id=keep)
+        # Instance deletes so the slot index and rollup signals see the rows go
+        for schedule in Schedules.objects.filter(pk__in=absorbed):
+            schedule.delete()
+    schedule = Schedules.objects.get(pk=keep)
+    schedule.start_time = min([start_time] + [w.start_time for w in conflicts])
+    schedule.end_time = max([end_time] + [w.end_time for w in conflicts])
+    schedule.save(update_fields=["start_time", "end_time"])
+    return schedule
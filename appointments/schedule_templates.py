@@ -0,0 +1,171 @@
+"""
+Recurring schedule generator.
+
+Each doctor's DoctorSettings (default_work_days, default_start_time,
+default_end_time, default_slot_minutes) is a weekly template. `plan()` expands
+the templates over N weeks, dropping days listed in ScheduleExceptions (a
+doctor's leave, or a clinic-wide holiday), shifts that already exist and
+shifts overlapping another window of the doctor that day (see
+appointments.schedule_overlap). `generate()` locks the doctors, plans and
+writes the plan with one bulk INSERT per batch in the same transaction.
+
+bulk_create bypasses the Schedules signals, so the slot index and the
+dashboard rollups of the generated days are refreshed explicitly.
+"""
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.choices import ScheduleStatus
+from doctors.models import DoctorSettings
+from . import schedule_overlap, slot_index
+from .models import Schedules, ScheduleExceptions
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_SLOT_MINUTES = 30
+
+# Accepted spellings of default_work_days entries -> date.weekday()
+WEEKDAYS = {
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+    "t2": 0, "t3": 1, "t4": 2, "t5": 3, "t6": 4, "t7": 5, "cn": 6,
+}
+
+
+def parse_work_days(value):
+    """'Mon,Tue,Wed' (or 'T2,T3,CN', or '0,1,2') -> {0, 1, 2}. Unknown entries are ignored."""
+    days = set()
+    for part in (value or "").replace(";", ",").split(","):
+        key = part.strip().lower()
+        if key.isdigit() and int(key) < 7:
+            days.add(int(key))
+        elif key[:3] in WEEKDAYS:
+            days.add(WEEKDAYS[key[:3]])
+    return days
+
+
+@dataclass
+class Plan:
+    """Outcome of expanding the templates: rows to insert and what was skipped."""
+    create: list = field(default_factory=list)    # unsaved Schedules
+    existing: list = field(default_factory=list)  # (doctor_id, work_date, start_time, end_time)
+    excluded: list = field(default_factory=list)  # (doctor_id, work_date, reason)
+    overlapping: list = field(default_factory=list)  # (doctor_id, work_date, start, end, conflicting window)
+    created: int = 0  # rows inserted by generate() (0 for a dry run)
+
+    def diff(self):
+        """Rows of a dry-run report: (action, doctor_id, work_date, start, end / reason)."""
+        rows = [("create", s.doctor_id, s.work_date, s.start_time, s.end_time) for s in self.create]
+        rows += [("exists", d, day, st, en) for d, day, st, en in self.existing]
+        rows += [("skip", d, day, reason, None) for d, day, reason in self.excluded]
+        rows += [("overlap", d, day, f"{st:%H:%M}-{en:%H:%M} trùng {w.start_time:%H:%M}-{w.end_time:%H:%M}", None)
+                 for d, day, st, en, w in self.overlapping]
+        return sorted(rows, key=lambda r: (r[2], r[1], r[0]))
+
+
+def _templates(doctor_ids=None):
+    qs = DoctorSettings.objects.filter(default_start_time__isnull=False, default_end_time__isnull=False)
+    if doctor_ids:
+        qs = qs.filter(doctor_id__in=doctor_ids)
+    return [s for s in qs if s.default_start_time < s.default_end_time and parse_work_days(s.default_work_days)]
+
+
+def plan(date_from, weeks, doctor_ids=None):
+    """Expand every template over `weeks` weeks from date_from (three queries in total)."""
+    date_to = date_from + timedelta(days=7 * weeks - 1)
+    result = Plan()
+    templates = _templates(doctor_ids)
+    if not templates:
+        return result
+    ids = [t.doctor_id for t in templates]
+
+    holidays, leave = {}, {}
+    for doctor_id, day, reason in (ScheduleExceptions.objects
+                                   .filter(day__range=(date_from, date_to))
+                                   .values_list("doctor_id", "day", "reason")):
+        if doctor_id is None:
+            holidays[day] = reason
+        else:
+            leave[(doctor_id, day)] = reason
+    windows = {}
+    for row in (Schedules.objects
+                .filter(doctor_id__in=ids, work_date__range=(date_from, date_to))
+                .values_list(*schedule_overlap.Window._fields)):
+        w = schedule_overlap.Window(*row)
+        windows.setdefault((w.doctor_id, w.work_date), []).append(w)
+
+    now = timezone.now()
+    for t in templates:
+        work_days = parse_work_days(t.default_work_days)
+        day = date_from
+        while day <= date_to:
+            if day.weekday() in work_days:
+                key = (t.doctor_id, day, t.default_start_time, t.default_end_time)
+                day_windows = windows.get((t.doctor_id, day), ())
+                clash = schedule_overlap.first_overlap(day_windows, t.default_start_time, t.default_end_time)
+                if day in holidays:
+                    result.excluded.append((t.doctor_id, day, holidays[day] or "Ngày nghỉ lễ"))
+                elif (t.doctor_id, day) in leave:
+                    result.excluded.append((t.doctor_id, day, leave[(t.doctor_id, day)] or "Bác sĩ nghỉ"))
+                elif any((w.start_time, w.end_time) == key[2:] for w in day_windows):
+                    result.existing.append(key)
+                elif clash is not None:
+                    result.overlapping.append((*key, clash))
+                else:
+                    result.create.append(Schedules(
+                        doctor_id=t.doctor_id,
+                        work_date=day,
+                        start_time=t.default_start_time,
+                        end_time=t.default_end_time,
+                        slot_duration_minutes=t.default_slot_minutes or DEFAULT_SLOT_MINUTES,
+                        status=ScheduleStatus.OPEN,
+                        created_at=now,
+                    ))
+            day += timedelta(days=1)
+    return result
+
+
+def add_exceptions(date_from, date_to, doctor_id=None, reason=None):
+    """Record date_from..date_to as leave of a doctor (or holidays when doctor_id is None).
+
+    Days already recorded are left as they are. Returns the number of days added.
+    Schedules already generated on those days are not touched (see schedule_bulk).
+    """
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    # unique (doctor, day) does not stop duplicate holidays (NULL doctor): check first
+    existing = set(ScheduleExceptions.objects
+                   .filter(doctor_id=doctor_id, day__range=(date_from, date_to))
+                   .values_list("day", flat=True))
+    now = timezone.now()
+    rows = [ScheduleExceptions(doctor_id=doctor_id, day=day, reason=reason, created_at=now)
+            for day in days if day not in existing]
+    ScheduleExceptions.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def _refresh_derived(pairs):
+    from adminpanel import rollups
+    for doctor_id, work_date in sorted(pairs, key=lambda p: (p[1], p[0])):
+        slot_index.rebuild_day(doctor_id, work_date)
+    rollups.mark("doctors", *{work_date for _, work_date in pairs})
+
+
+def generate(date_from, weeks, doctor_ids=None, dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Plan and (unless dry_run) insert the schedules. Returns the Plan."""
+    if dry_run:
+        return plan(date_from, weeks, doctor_ids)
+    with transaction.atomic():
+        # Locked doctors cannot get a concurrent window between plan and insert
+        schedule_overlap.lock_doctors([t.doctor_id for t in _templates(doctor_ids)])
+        result = plan(date_from, weeks, doctor_ids)
+        if not result.create:
+            return result
+        # The plan was made under the doctor locks, so none of its keys can exist:
+        # a conflict here is a real error and rolls the whole run back
+        for i in range(0, len(result.create), batch_size):
+            Schedules.objects.bulk_create(result.create[i:i + batch_size])
+        result.created = len(result.create)
+        pairs = {(s.doctor_id, s.work_date) for s in result.create}
+        transaction.on_commit(lambda: _refresh_derived(pairs))
+    return result
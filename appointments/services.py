@@ -1,29 +1,18 @@
 from datetime import datetime, timedelta, time
 from django.utils import timezone
 from django.db import transaction
-from .models import Schedules, Appointments, AppointmentLogs
+from .models import Schedules, Appointments
 from .constants import LOG_ACTION
 from emr.models import MedicalRecords, Prescriptions
-from django.core.exceptions import ValidationError
-from django.db.models import F
-from adminpanel.models import Drug
+from adminpanel import stock
 from billing.models import Invoices, InvoiceItems
-from decimal import Decimal
-from django.db.models import Sum, F
+from billing.totals import replace_invoice_items
 from doctors.pricing import get_consultation_fee
+from . import audit, slot_index
 
-# Statuses that don't count as occupied slots
-EXCLUDE_STATUSES = ("CANCELLED", "NO_SHOW")
-
-def log(appt, action, actor, note=None):
-    """Helper function to create appointment logs"""
-    AppointmentLogs.objects.create(
-        appointment=appt, 
-        action=action, 
-        actor_user=actor, 
-        note=note, 
-        created_at=timezone.now()
-    )
+def log(appt, action, actor, note=None, deferred=False):
+    """Helper function to create appointment logs (buffered, written after commit; see appointments.audit)"""
+    audit.record(appt, action, actor, note, deferred=deferred)
 
 @transaction.atomic
 def start_appointment(appt, actor):
@@ -55,7 +44,7 @@ def save_record(appt, data, actor):
         mr.attachments = data.get("attachments")
         mr.save()
     
-    log(appt, LOG_ACTION["UPDATED_RECORD"], actor)
+    log(appt, LOG_ACTION["UPDATED_RECORD"], actor, deferred=True)
     return mr
 
 @transaction.atomic
@@ -83,7 +72,7 @@ def upsert_prescriptions(mr, items, actor):
     if to_create:
         Prescriptions.objects.bulk_create(to_create)
     
-    log(mr.appointment, LOG_ACTION["UPDATED_PRESCRIPTION"], actor)
+    log(mr.appointment, LOG_ACTION["UPDATED_PRESCRIPTION"], actor, deferred=True)
 
 @transaction.atomic
 def complete_appointment(appt, actor):
@@ -111,9 +100,6 @@ def complete_appointment(appt, actor):
         }
     )
     
-    # 4) Clear existing items (in case doctor changes prescription)
-    InvoiceItems.objects.filter(invoice=inv).delete()
-    
     items = []
     
     # 5) Consultation fee line
@@ -130,19 +116,8 @@ def complete_appointment(appt, actor):
     # 6) Drug lines
     try:
         mr = appt.medical_record
-        # Before creating lines, ensure stock availability and prepare consumption list
-        to_consume = []
-        for prescription in mr.prescriptions.all():
-            # Check stock if model has quantity field
-            try:
-                d = Drug.objects.get(pk=prescription.drug_id)
-                qty_needed = int(prescription.quantity)
-                if hasattr(d, 'quantity'):
-                    if d.quantity < qty_needed:
-                        raise ValidationError(f"Thuốc '{d.name}' không đủ hàng. Còn {d.quantity}, cần {qty_needed}.")
-                    to_consume.append((d.pk, qty_needed))
-            except Drug.DoesNotExist:
-                pass
+        prescriptions = list(mr.prescriptions.all())
+        for prescription in prescriptions:
             items.append(InvoiceItems(
                 invoice=inv, 
                 item_type="DRUG", 
@@ -152,95 +127,56 @@ def complete_appointment(appt, actor):
                 quantity=prescription.quantity, 
                 unit_price=prescription.unit_price_snapshot
             ))
-        # Consume stock atomically
-        for pk, qty in to_consume:
-            Drug.objects.filter(pk=pk).update(quantity=F('quantity') - qty)
+        # Take every drug out of stock at once: rows locked in id order, one UPDATE,
+        # ledger rows in one INSERT; raises InsufficientStock (nothing consumed) on shortage
+        stock.consume(
+            [(p.drug_id, p.quantity) for p in prescriptions],
+            ref_type="APPOINTMENT", ref_id=appt.pk, actor=actor,
+        )
     except MedicalRecords.DoesNotExist:
         pass  # No medical record yet
     
-    # 7) Create invoice items
-    InvoiceItems.objects.bulk_create(items)
-    
-    # 8) Update invoice totals using SUM(quantity * unit_price)
-    from django.db.models import ExpressionWrapper, DecimalField
-    total = InvoiceItems.objects.filter(invoice=inv).aggregate(
-        total=Sum(ExpressionWrapper(F("quantity") * F("unit_price"),
-                                    output_field=DecimalField(max_digits=12, decimal_places=2)))
-    )["total"] or 0
-    inv.subtotal = total
-    inv.amount_due = total
-    inv.save(update_fields=["subtotal", "amount_due"])
+    # 7) Replace invoice items (in case doctor changes prescription);
+    #    totals are recomputed once, with one UPDATE, when the transaction commits
+    replace_invoice_items(inv, items)
     
     # 9) Log completion
     log(appt, LOG_ACTION["COMPLETED"], actor)
     return inv
 
-def build_available_slots(doctor_id, work_date):
+def build_available_slots(doctor_id, work_date, patient_id=None):
     """
     Return list[dict] of slots for a doctor on a specific date.
     Each element: {"start": "HH:MM", "end": "HH:MM", "available": bool}
-    - Split time based on slot_duration_minutes from each schedule
-    - Exclude slots with existing appointments (status NOT IN EXCLUDE_STATUSES)
+    - Slots come from the materialized index (appointments.slot_index)
+    - A slot is taken if an appointment (status NOT IN EXCLUDE_STATUSES) points to it
+    - A slot held by another patient (hold not expired) is unavailable; the
+      hold of `patient_id` itself does not count
     - If today: disable slots where 'end' <= now
-    - Sort by start time ascending; merge if multiple schedules
+    - Sorted by start time ascending; overlapping schedules are merged by start
     """
-    tz_now = timezone.localtime(timezone.now())
-    today = tz_now.date()
+    rows = slot_index.day_slots(doctor_id, work_date)
+    if not rows and Schedules.objects.filter(
+        doctor_id=doctor_id, work_date=work_date, status="OPEN"
+    ).exists():
+        # Day not indexed yet (e.g. before the first rebuild): build it lazily
+        slot_index.rebuild_day(doctor_id, work_date)
+        rows = slot_index.day_slots(doctor_id, work_date)
 
-    # Get OPEN schedules for the date
-    schedules = Schedules.objects.filter(
-        doctor_id=doctor_id, 
-        work_date=work_date, 
-        status="OPEN"
-    )
-
-    # Get taken appointment times
-    taken_times = set(
-        Appointments.objects
-        .filter(
-            doctor_id=doctor_id,
-            appointment_at__date=work_date,
-        )
-        .exclude(status__in=EXCLUDE_STATUSES)
-        .values_list("appointment_at__time", flat=True)
-    )
+    tz_now = timezone.localtime(timezone.now())
+    is_today = work_date == tz_now.date()
 
     slots = []
-    for schedule in schedules:
-        step_minutes = schedule.slot_duration_minutes
-        current = datetime.combine(work_date, schedule.start_time)
-        end_time = datetime.combine(work_date, schedule.end_time)
-
-        while current + timedelta(minutes=step_minutes) <= end_time:
-            start_time = current.time()
-            slot_end_time = (current + timedelta(minutes=step_minutes)).time()
-
-            start_str = start_time.strftime("%H:%M")
-            end_str = slot_end_time.strftime("%H:%M")
-
-            available = True
-
-            # Check if slot is already taken
-            if start_time in taken_times:
-                available = False
-
-            # If today: disable slots that have already ended
-            if work_date == today and timezone.localtime(timezone.now()).time() >= slot_end_time:
-                available = False
-
-            slots.append({
-                "start": start_str, 
-                "end": end_str, 
-                "available": available
-            })
-            current += timedelta(minutes=step_minutes)
-
-    # Sort and remove duplicates by start time
-    seen_starts = set()
-    unique_slots = []
-    for slot in sorted(slots, key=lambda x: x["start"]):
-        if slot["start"] not in seen_starts:
-            unique_slots.append(slot)
-            seen_starts.add(slot["start"])
-    
-    return unique_slots
+    for row in rows:
+        held = (row["held_until"] is not None and row["held_until"] > tz_now
+                and row["held_by_id"] != patient_id)
+        available = row["appointment_id"] is None and not held
+        # If today: disable slots that have already ended
+        if is_today and tz_now.time() >= row["end_time"]:
+            available = False
+        slots.append({
+            "start": row["start_time"].strftime("%H:%M"),
+            "end": row["end_time"].strftime("%H:%M"),
+            "available": available,
+        })
+    return slots
@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from clinic import documents
+from . import slot_index
+from .models import Schedules, Appointments
+
+# Appointment fields that decide which slot (if any) it occupies
+_SLOT_FIELDS = {"status", "appointment_at", "doctor", "doctor_id"}
+
+
+@receiver([post_save, post_delete], sender=Schedules)
+def reindex_schedule_day(sender, instance, **kwargs):
+    doctor_id, work_date = instance.doctor_id, instance.work_date
+    transaction.on_commit(lambda: slot_index.rebuild_day(doctor_id, work_date))
+
+
+@receiver(post_save, sender=Appointments)
+def sync_appointment_slot(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields is not None and not (_SLOT_FIELDS & set(update_fields)):
+        return
+    transaction.on_commit(lambda: slot_index.sync_appointment(instance))
+
+
+@receiver(post_delete, sender=Appointments)
+def drop_stored_visit_summary(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: documents.invalidate(documents.VISIT_SUMMARY, pk))
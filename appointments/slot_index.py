@@ -0,0 +1,255 @@
+"""
+Materialized slot index for doctor schedules.
+
+Each OPEN schedule is expanded once into `ScheduleSlots` rows keyed by
+(doctor, work_date, start_time). Booking or cancelling an appointment only
+moves the appointment pointer on one row, so availability lookups read the
+index instead of re-expanding schedules and re-querying appointments.
+
+A patient picking a slot in the booking wizard takes a hold on its row with a
+conditional UPDATE (free, and not held by someone else until a later time).
+Only one request can win that UPDATE, so a contended slot is settled at step 2
+rather than at the final INSERT. Holds expire by time; the wizard also
+releases them once the appointment is created or the patient starts over.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from core.choices import ScheduleStatus
+from .constants import EXCLUDE_STATUSES
+from .models import Schedules, Appointments, ScheduleSlots
+
+
+def _local(dt):
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return timezone.localtime(dt)
+
+
+def expand_schedule(schedule):
+    """Yield (start_time, end_time) for every full slot of a schedule."""
+    step = timedelta(minutes=schedule.slot_duration_minutes or 0)
+    if step <= timedelta(0):
+        return
+    current = datetime.combine(schedule.work_date, schedule.start_time)
+    end = datetime.combine(schedule.work_date, schedule.end_time)
+    while current + step <= end:
+        yield current.time(), (current + step).time()
+        current += step
+
+
+def _expected_rows(doctor_id, work_date):
+    """Compute the slot rows a (doctor, work_date) should have right now."""
+    schedules = (Schedules.objects
+                 .filter(doctor_id=doctor_id, work_date=work_date, status=ScheduleStatus.OPEN)
+                 .order_by("start_time", "id"))
+    taken = {
+        _local(at).time(): appt_id
+        for at, appt_id in (Appointments.objects
+                            .filter(doctor_id=doctor_id)
+                            .for_local_day(work_date)
+                            .exclude(status__in=EXCLUDE_STATUSES)
+                            .values_list("appointment_at", "id"))
+    }
+
+    rows = {}
+    for schedule in schedules:
+        for slot_start, slot_end in expand_schedule(schedule):
+            # Overlapping schedules: first schedule (by start time) wins
+            if slot_start in rows:
+                continue
+            rows[slot_start] = ScheduleSlots(
+                doctor_id=doctor_id,
+                schedule_id=schedule.id,
+                work_date=work_date,
+                start_time=slot_start,
+                end_time=slot_end,
+                appointment_id=taken.get(slot_start),
+            )
+    return [rows[k] for k in sorted(rows)]
+
+
+@transaction.atomic
+def rebuild_day(doctor_id, work_date):
+    """Rebuild the index of one doctor/day from schedules and appointments (live holds are kept)."""
+    rows = _expected_rows(doctor_id, work_date)
+    existing = ScheduleSlots.objects.filter(doctor_id=doctor_id, work_date=work_date)
+    holds = {
+        start: (patient_id, until)
+        for start, patient_id, until in (existing.filter(held_until__gt=timezone.now())
+                                         .values_list("start_time", "held_by_id", "held_until"))
+    }
+    for row in rows:
+        if row.appointment_id is None and row.start_time in holds:
+            row.held_by_id, row.held_until = holds[row.start_time]
+    existing.delete()
+    ScheduleSlots.objects.bulk_create(rows)
+    return len(rows)
+
+
+def indexed_days(date_from, date_to, doctor_id=None):
+    """Return the (doctor_id, work_date) pairs that have schedules or index rows."""
+    filters = {"work_date__range": (date_from, date_to)}
+    if doctor_id:
+        filters["doctor_id"] = doctor_id
+    pairs = set(Schedules.objects.filter(**filters).values_list("doctor_id", "work_date").distinct())
+    pairs |= set(ScheduleSlots.objects.filter(**filters).values_list("doctor_id", "work_date").distinct())
+    return sorted(pairs, key=lambda p: (p[1], p[0]))
+
+
+def rebuild_range(date_from, date_to, doctor_id=None):
+    """Rebuild every doctor/day in a date range. Returns (days, slots)."""
+    days = slots = 0
+    for did, work_date in indexed_days(date_from, date_to, doctor_id):
+        slots += rebuild_day(did, work_date)
+        days += 1
+    return days, slots
+
+
+def check_day(doctor_id, work_date):
+    """Compare the stored index with what it should be; return a list of problems."""
+    expected = {r.start_time: r for r in _expected_rows(doctor_id, work_date)}
+    actual = {
+        r.start_time: r
+        for r in ScheduleSlots.objects.filter(doctor_id=doctor_id, work_date=work_date)
+    }
+    problems = []
+    for start in sorted(set(expected) - set(actual)):
+        problems.append(f"missing slot {start:%H:%M}")
+    for start in sorted(set(actual) - set(expected)):
+        problems.append(f"stale slot {start:%H:%M}")
+    for start in sorted(set(expected) & set(actual)):
+        exp, act = expected[start], actual[start]
+        if exp.end_time != act.end_time or exp.schedule_id != act.schedule_id:
+            problems.append(f"slot {start:%H:%M} does not match its schedule")
+        if exp.appointment_id != act.appointment_id:
+            problems.append(
+                f"slot {start:%H:%M} points to appointment {act.appointment_id}, expected {exp.appointment_id}"
+            )
+    return problems
+
+
+def sync_appointment(appt):
+    """Point the index at an appointment, or free its slot if it no longer occupies one."""
+    ScheduleSlots.objects.filter(appointment_id=appt.pk).update(appointment=None)
+    if appt.status in EXCLUDE_STATUSES:
+        return
+    local_at = _local(appt.appointment_at)
+    (ScheduleSlots.objects
+     .filter(doctor_id=appt.doctor_id, work_date=local_at.date(),
+             start_time=local_at.time(), appointment__isnull=True)
+     .update(appointment_id=appt.pk, held_by=None, held_until=None))
+
+
+def _not_held(now, patient_id=None):
+    q = Q(held_until__isnull=True) | Q(held_until__lte=now)
+    if patient_id:
+        q |= Q(held_by_id=patient_id)
+    return q
+
+
+def hold_slot(doctor_id, work_date, start_time, patient_id, seconds=None):
+    """
+    Hold a free slot for a patient for SLOT_HOLD_SECONDS. Returns True on success.
+
+    One conditional UPDATE: it matches only if the slot has no appointment and
+    no live hold of another patient, so concurrent callers cannot both win.
+    Calling it again for the same patient extends the hold. A patient keeps
+    at most one hold: holds on other slots are released.
+    """
+    if seconds is None:
+        seconds = getattr(settings, "SLOT_HOLD_SECONDS", 300)
+    now = timezone.now()
+    won = (ScheduleSlots.objects
+           .filter(doctor_id=doctor_id, work_date=work_date, start_time=start_time, appointment__isnull=True)
+           .filter(_not_held(now, patient_id))
+           .update(held_by_id=patient_id, held_until=now + timedelta(seconds=seconds)))
+    if won:
+        (ScheduleSlots.objects
+         .filter(held_by_id=patient_id)
+         .exclude(doctor_id=doctor_id, work_date=work_date, start_time=start_time)
+         .update(held_by=None, held_until=None))
+    return bool(won)
+
+
+def release_holds(patient_id):
+    """Drop every hold of a patient (e.g. after booking or leaving the wizard)."""
+    return ScheduleSlots.objects.filter(held_by_id=patient_id).update(held_by=None, held_until=None)
+
+
+def day_slots(doctor_id, work_date):
+    """Single indexed read of the slot rows of one doctor/day, ordered by start."""
+    return list(ScheduleSlots.objects
+                .filter(doctor_id=doctor_id, work_date=work_date)
+                .order_by("start_time")
+                .values("start_time", "end_time", "appointment_id", "held_by_id", "held_until"))
+
+
+def availability(doctor_ids, dates):
+    """
+    Free-slot summary for many doctors x days in a constant number of queries.
+
+    Returns {doctor_id: {work_date: {"total": int, "free": int, "first_free": "HH:MM" | None}}}
+    with an entry for every requested doctor and date. Past slots of today and slots
+    held by a patient in the booking wizard are not free.
+    """
+    doctor_ids = sorted({int(d) for d in doctor_ids})
+    dates = sorted(set(dates))
+    result = {did: {d: {"total": 0, "free": 0, "first_free": None} for d in dates} for did in doctor_ids}
+    if not doctor_ids or not dates:
+        return result
+
+    tz_now = timezone.localtime(timezone.now())
+    window = {"doctor_id__in": doctor_ids, "work_date__range": (dates[0], dates[-1])}
+
+    # 1) OPEN schedules in the window (tells us which days must have index rows)
+    open_days = set(Schedules.objects
+                    .filter(status=ScheduleStatus.OPEN, **window)
+                    .values_list("doctor_id", "work_date")
+                    .distinct())
+
+    # 2) One grouped read over the slot index
+    free = Q(appointment__isnull=True) & _not_held(tz_now) & (
+        Q(work_date__gt=tz_now.date()) | Q(work_date=tz_now.date(), end_time__gt=tz_now.time())
+    )
+
+    def grouped():
+        return list(ScheduleSlots.objects
+                    .filter(**window)
+                    .values("doctor_id", "work_date")
+                    .annotate(total=Count("id"),
+                              free=Count("id", filter=free),
+                              first_free=Min("start_time", filter=free))
+                    .order_by())
+
+    rows = grouped()
+    missing = open_days - {(r["doctor_id"], r["work_date"]) for r in rows}
+    if missing:
+        # Days never indexed (before the first rebuild): build once, then re-read
+        for did, work_date in missing:
+            rebuild_day(did, work_date)
+        rows = grouped()
+
+    for r in rows:
+        day = result.get(r["doctor_id"], {}).get(r["work_date"])
+        if day is None:
+            continue
+        day["total"] = r["total"]
+        day["free"] = r["free"]
+        day["first_free"] = r["first_free"].strftime("%H:%M") if r["first_free"] else None
+    return result
+
+
+def next_available(summary):
+    """Reduce an availability() summary to {doctor_id: (work_date, "HH:MM") | None}."""
+    nxt = {}
+    for did, days in summary.items():
+        nxt[did] = next(
+            ((d, info["first_free"]) for d, info in sorted(days.items()) if info["free"]),
+            None,
+        )
+    return nxt
@@ -0,0 +1,114 @@
+"""
+Sweeper for past-due appointments.
+
+A CONFIRMED appointment nobody started becomes NO_SHOW, and a PENDING one
+nobody confirmed becomes CANCELLED, once its time is further in the past than
+the configured grace period. Each chunk is one transaction: lock up to
+chunk_size due rows with SELECT ... FOR UPDATE SKIP LOCKED, flip them with one
+UPDATE and write their AppointmentLogs with one bulk INSERT. Rows locked by
+another node running the sweeper at the same time are skipped rather than
+waited for, so several nodes can sweep concurrently without double work.
+
+UPDATE bypasses the Appointments signals, so the freed slot index rows and the
+dashboard rollups of the swept days are updated explicitly.
+"""
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.choices import ApptStatus
+from .constants import LOG_ACTION
+from .models import AppointmentLogs, Appointments, ScheduleSlots
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+@dataclass(frozen=True)
+class Rule:
+    from_status: str
+    to_status: str
+    grace: timedelta
+    note: str
+
+
+def default_rules(no_show_grace=None, pending_grace=None):
+    """Sweep rules; grace periods in minutes default to the settings."""
+    if no_show_grace is None:
+        no_show_grace = getattr(settings, "APPOINTMENT_NO_SHOW_GRACE_MINUTES", 60)
+    if pending_grace is None:
+        pending_grace = getattr(settings, "APPOINTMENT_PENDING_GRACE_MINUTES", 30)
+    return [
+        Rule(ApptStatus.CONFIRMED, ApptStatus.NO_SHOW, timedelta(minutes=no_show_grace),
+             "Tự động: bệnh nhân không đến khám"),
+        Rule(ApptStatus.PENDING, ApptStatus.CANCELLED, timedelta(minutes=pending_grace),
+             "Tự động: lịch hẹn không được xác nhận trước giờ khám"),
+    ]
+
+
+@dataclass
+class SweepStats:
+    swept: dict = field(default_factory=dict)  # to_status -> rows
+    chunks: int = 0
+
+    @property
+    def total(self):
+        return sum(self.swept.values())
+
+
+def _due(rule, now):
+    return Appointments.objects.filter(status=rule.from_status, appointment_at__lt=now - rule.grace)
+
+
+def count_due(rules, now=None):
+    now = now or timezone.now()
+    return {rule.to_status: _due(rule, now).count() for rule in rules}
+
+
+def sweep_chunk(rule, now, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Sweep at most chunk_size due rows of one rule. Returns the number swept."""
+    from adminpanel import rollups
+
+    with transaction.atomic():
+        rows = list(_due(rule, now)
+                    .select_for_update(skip_locked=True)
+                    .order_by("appointment_at", "id")
+                    .values_list("id", "appointment_at")[:chunk_size])
+        if not rows:
+            return 0
+        ids = [row[0] for row in rows]
+        swept = (Appointments.objects
+                 .filter(id__in=ids, status=rule.from_status)
+                 .update(status=rule.to_status, updated_at=now))
+        AppointmentLogs.objects.bulk_create([
+            AppointmentLogs(appointment_id=i, action=LOG_ACTION[rule.to_status], note=rule.note, created_at=now)
+            for i in ids
+        ])
+        # NO_SHOW / CANCELLED no longer occupy a slot
+        ScheduleSlots.objects.filter(appointment_id__in=ids).update(appointment=None)
+        days = {rollups.local_day(at) for _, at in rows}
+        rollups.mark("appointments", *days)
+        rollups.mark("doctors", *days)
+    return swept
+
+
+def sweep(rules=None, now=None, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None):
+    """Run every rule until no due row is left (or only rows other nodes hold). Returns SweepStats."""
+    rules = default_rules() if rules is None else rules
+    now = now or timezone.now()
+    stats = SweepStats()
+    for rule in rules:
+        stats.swept.setdefault(rule.to_status, 0)
+        while True:
+            swept = sweep_chunk(rule, now, chunk_size)
+            if not swept:
+                break
+            stats.swept[rule.to_status] += swept
+            stats.chunks += 1
+            if on_chunk:
+                on_chunk(rule, swept, stats)
+            if swept < chunk_size:
+                break
+    return stats
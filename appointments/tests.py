@@ -1,3 +1,184 @@
-from django.test import TestCase
+import unittest
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.db.utils import ConnectionHandler
+from django.test import Client
+from django.utils import timezone
+
+from .models import Appointments, ScheduleSlots, Schedules
+
+
+class LocalDayQuerySetTests(unittest.TestCase):
+    """Local-day filters must stay sargable: a half-open range on the raw column.
+
+    The project's migrations alter the existing MySQL schema, so no test database
+    is needed here (plain unittest); query plans are checked on a private in-memory
+    SQLite connection holding the appointments table and its (doctor, appointment_at)
+    index.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.handler = ConnectionHandler({"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}})
+        cls.conn = cls.handler["default"]
+        with cls.conn.schema_editor() as editor:
+            editor.create_model(Appointments)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.handler.close_all()
+        super().tearDownClass()
+
+    def plan(self, qs):
+        sql, params = qs.query.get_compiler(connection=self.conn).as_sql()
+        with self.conn.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return " ".join(row[-1] for row in cursor.fetchall()).replace(" ", "")
+
+    def test_local_day_is_a_utc_half_open_range(self):
+        qs = Appointments.objects.for_local_day(date(2025, 3, 10))
+        lookups = sorted((c.lookup_name, c.rhs) for c in qs.query.where.children)
+        self.assertEqual(lookups, [
+            ("gte", datetime(2025, 3, 9, 17, 0, tzinfo=dt_timezone.utc)),
+            ("lt", datetime(2025, 3, 10, 17, 0, tzinfo=dt_timezone.utc)),
+        ])
+
+    def test_consecutive_days_collapse_into_one_range(self):
+        days = [date(2025, 3, 12), date(2025, 3, 10), date(2025, 3, 11)]
+        self.assertEqual(
+            str(Appointments.objects.for_local_days(days).query),
+            str(Appointments.objects.in_local_range(date(2025, 3, 10), date(2025, 3, 12)).query),
+        )
+
+    def test_open_ended_range(self):
+        qs = Appointments.objects.in_local_range(date_from=date(2025, 3, 10))
+        self.assertEqual([c.lookup_name for c in qs.query.where.children], ["gte"])
+        self.assertEqual(str(Appointments.objects.in_local_range().query), str(Appointments.objects.all().query))
+
+    def test_doctor_day_lookup_seeks_the_index(self):
+        plan = self.plan(Appointments.objects.filter(doctor_id=1).for_local_day(date(2025, 3, 10)))
+        self.assertIn("USINGINDEX", plan)
+        self.assertIn("appointment_at>", plan)
+        # The function-wrapped form can only seek on doctor_id
+        legacy = self.plan(Appointments.objects.filter(doctor_id=1, appointment_at__date=date(2025, 3, 10)))
+        self.assertNotIn("appointment_at>", legacy)
+
+    def test_day_lookup_needs_no_function_on_the_column(self):
+        sql, _ = Appointments.objects.for_local_day(date(2025, 3, 10)).query.get_compiler(
+            connection=self.conn).as_sql()
+        self.assertIn('"appointments"."appointment_at" >= %s', sql)
+        self.assertIn('"appointments"."appointment_at" < %s', sql)
+
+
+class InMemoryDatabaseTests(unittest.TestCase):
+    """As above, no test database: every model's table is created on a private
+    in-memory SQLite connection that stands in for "default" during the class.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.handler = ConnectionHandler({"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}})
+        cls.saved = connections["default"]
+        connections["default"] = cls.handler["default"]
+        # patient_profiles is mapped by accounts.PatientProfile too: create it from the full model
+        models = sorted(apps.get_models(), key=lambda m: m._meta.label != "patients.PatientProfiles")
+        with connections["default"].schema_editor() as editor:
+            created = set()
+            for model in models:
+                if model._meta.db_table not in created:
+                    editor.create_model(model)
+                    created.add(model._meta.db_table)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["default"] = cls.saved
+        cls.handler.close_all()
+        super().tearDownClass()
+
+
+class BookingWizardTests(InMemoryDatabaseTests):
+    """Portal booking end to end: step 2 holds the slot, the step 3 POST books it."""
+
+    def setUp(self):
+        from accounts.models import Users
+        from doctors.models import Doctors, Specialties
+        from patients.models import PatientProfiles
+
+        now = timezone.now()
+
+        def user(email, role):
+            return Users.objects.create(email=email, password_hash=make_password("Secret123"), full_name=email,
+                                        role=role, is_active=1, created_at=now, updated_at=now)
+
+        self.doctor = Doctors.objects.create(user=user("bs@test.vn", "DOCTOR"),
+                                             specialty=Specialties.objects.create(name="Nội"), license_number="L1")
+        self.patient = PatientProfiles.objects.create(user=user("bn@test.vn", "PATIENT"), cccd="001200000001")
+        self.day = timezone.localdate() + timedelta(days=1)
+        Schedules.objects.create(doctor=self.doctor, work_date=self.day, start_time=time(8), end_time=time(10),
+                                 slot_duration_minutes=30, status="OPEN", created_at=now)
+        self.client = Client()
+        self.client.post("/auth/login/", {"login_field": "bn@test.vn", "password": "Secret123"})
+
+    def test_step2_hold_then_step3_post_books_the_slot(self):
+        day = self.day.isoformat()
+        resp = self.client.post(f"/appointments/new/slots/?doctor_id={self.doctor.id}",
+                                {"doctor_id": self.doctor.id, "date": day, "appointment_time": "08:30"})
+        self.assertEqual(resp.status_code, 302)
+        self.assertIn("/appointments/new/confirm/", resp["Location"])
+        slot = ScheduleSlots.objects.get(doctor=self.doctor, work_date=self.day, start_time=time(8, 30))
+        self.assertEqual(slot.held_by_id, self.patient.id)
+
+        resp = self.client.post(resp["Location"], {"reason": "Đau đầu"})
+        self.assertEqual(resp.status_code, 302)
+        self.assertIn("/appointments/my", resp["Location"])
+        appointment = Appointments.objects.get(doctor=self.doctor, patient=self.patient)
+        self.assertEqual(timezone.localtime(appointment.appointment_at).time(), time(8, 30))
+        slot.refresh_from_db()
+        self.assertEqual(slot.appointment_id, appointment.id)
+        self.assertFalse(ScheduleSlots.objects.filter(held_by=self.patient).exists())
+
+
+class ScheduleGeneratorTests(InMemoryDatabaseTests):
+    """schedule_templates.generate(): weekly templates minus exceptions, reported counts."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from accounts.models import Users
+        from doctors.models import DoctorSettings, Doctors, Specialties
+
+        now = timezone.now()
+        user = Users.objects.create(email="gen@test.vn", password_hash="x", full_name="gen", role="DOCTOR",
+                                    is_active=1, created_at=now, updated_at=now)
+        cls.doctor = Doctors.objects.create(user=user, specialty=Specialties.objects.create(name="Ngoại"),
+                                             license_number="L2")
+        DoctorSettings.objects.create(doctor=cls.doctor, default_work_days="Mon,Tue,Wed,Thu,Fri",
+                                      default_start_time=time(8), default_end_time=time(11), default_slot_minutes=30)
+        today = timezone.localdate()
+        cls.monday = today + timedelta(days=7 - today.weekday())
+
+    def test_generate_creates_the_plan_and_reports_it(self):
+        from .schedule_templates import add_exceptions, generate
+
+        add_exceptions(self.monday + timedelta(days=2), self.monday + timedelta(days=2), reason="Lễ")
+        result = generate(self.monday, 1, [self.doctor.id])
+        self.assertEqual(result.created, 4)
+        self.assertEqual(len(result.excluded), 1)
+        days = sorted(Schedules.objects.filter(doctor=self.doctor).values_list("work_date", flat=True))
+        self.assertEqual(days, [self.monday + timedelta(days=i) for i in (0, 1, 3, 4)])
+
+        again = generate(self.monday, 1, [self.doctor.id])
+        self.assertEqual((again.created, len(again.existing)), (0, 4))
+        self.assertEqual(Schedules.objects.filter(doctor=self.doctor).count(), 4)
+
+    def test_dry_run_writes_nothing(self):
+        from .schedule_templates import generate
+
+        result = generate(self.monday + timedelta(days=14), 1, [self.doctor.id], dry_run=True)
+        self.assertEqual((len(result.create), result.created), (5, 0))
+        self.assertFalse(Schedules.objects.filter(work_date__gte=self.monday + timedelta(days=14)).exists())
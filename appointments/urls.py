@@ -7,6 +7,11 @@ urlpatterns = [
     # Doctor Schedule Management URLs
     path('doctor/schedule/', views.schedule_index, name='schedule_index'),
     path('doctor/schedule/create/', views.schedule_create, name='schedule_create'),
+    path('doctor/schedule/generate/', views.schedule_generate, name='schedule_generate'),
+    path('doctor/schedule/bulk/', views.schedule_bulk, name='schedule_bulk'),
+    path('doctor/schedule/exceptions/', views.schedule_exception_create, name='schedule_exception_create'),
+    path('doctor/schedule/exceptions/<int:pk>/delete/', views.schedule_exception_delete,
+         name='schedule_exception_delete'),
     path('doctor/schedule/<int:schedule_id>/open/', views.schedule_open, name='schedule_open'),
     path('doctor/schedule/<int:schedule_id>/close/', views.schedule_close, name='schedule_close'),
     path('doctor/appointment/<int:appointment_id>/', views.appointment_detail, name='appointment_detail'),
@@ -21,6 +26,7 @@ urlpatterns = [
     
     # Patient Booking URLs
     path('new/', views.new_step1, name='new_step1'),
+    path('new/availability/', views.availability_api, name='availability_api'),
     path('new/slots/', views.new_step2, name='new_step2'),
     path('new/confirm/', views.new_step3, name='new_step3'),
     path('my/', views.my_appointments, name='my_appointments'),
@@ -2,47 +2,45 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.http import JsonResponse
 from django.db import IntegrityError
+from django.db.models import Q
 from django.utils import timezone
-from datetime import datetime, date, time
-from .models import Schedules, Appointments
+from datetime import datetime, date, time, timedelta
+from .models import Schedules, Appointments, ScheduleExceptions
+from . import audit
+from .schedule_overlap import create_schedule, ScheduleOverlapError, MERGE, REJECT
 from doctors.models import Doctors
 from accounts.models import Users
 from core.choices import ScheduleStatus, Role
-from clinic.decorators import role_required, patient_required, doctor_or_staff_required
+from clinic.decorators import role_required, patient_required, doctor_or_staff_required, staff_required
+from clinic.identity import get_identity
 
 
 # -----------------------------------------------------------------------------
 # Helpers to resolve role and external user for the current request
 # -----------------------------------------------------------------------------
 def _get_external_user(request):
-    try:
-        email = getattr(request.user, 'email', None)
-        if not email:
-            return None
-        return Users.objects.filter(email=email).first()
-    except Exception:
-        return None
+    return get_identity(request).user
 
 
 def _get_user_role(request):
-    ext = _get_external_user(request)
-    return getattr(ext, 'role', None)
+    return get_identity(request).role
 
 
-def _local_day_range(d: date):
-    """Return timezone-aware UTC datetimes for start/end of local day."""
-    try:
-        from zoneinfo import ZoneInfo
-        local_tz = ZoneInfo('Asia/Ho_Chi_Minh')
-        utc_tz = ZoneInfo('UTC')
-        start = datetime.combine(d, time.min, tzinfo=local_tz).astimezone(utc_tz)
-        end = datetime.combine(d, time.max, tzinfo=local_tz).astimezone(utc_tz)
-        return start, end
-    except Exception:
-        # Fallback: assume server timezone is correct
-        start = timezone.make_aware(datetime.combine(d, time.min))
-        end = timezone.make_aware(datetime.combine(d, time.max))
-        return start, end
+def _get_doctor(request):
+    """Doctors row of the current user (raises Doctors.DoesNotExist when none)."""
+    doctor = get_identity(request).doctor
+    if doctor is None:
+        raise Doctors.DoesNotExist
+    return doctor
+
+
+def _get_patient_profile(request):
+    """PatientProfiles row of the current user (raises PatientProfiles.DoesNotExist when none)."""
+    from patients.models import PatientProfiles
+    patient = get_identity(request).patient
+    if patient is None:
+        raise PatientProfiles.DoesNotExist
+    return patient
 
 
 @doctor_or_staff_required
@@ -51,18 +49,18 @@ def schedule_index(request):
     user = request.user
     
     # Lấy danh sách bác sĩ cho dropdown (chỉ hiển thị nếu user là STAFF)
+    user_role = _get_user_role(request)
     doctors = []
-    if _get_user_role(request) == Role.STAFF:
+    if user_role == Role.STAFF:
         doctors = Doctors.objects.select_related('user').all()
     
     # Lấy danh sách lịch làm việc
     schedules = Schedules.objects.select_related('doctor__user').all()
     
     # Nếu user là DOCTOR, chỉ hiển thị lịch của chính mình
-    if _get_user_role(request) == Role.DOCTOR:
+    if user_role == Role.DOCTOR:
         try:
-            ext_user = _get_external_user(request)
-            doctor = Doctors.objects.get(user=ext_user)
+            doctor = _get_doctor(request)
             schedules = schedules.filter(doctor=doctor)
         except Doctors.DoesNotExist:
             schedules = Schedules.objects.none()
@@ -73,12 +71,22 @@ def schedule_index(request):
     
     if filter_date:
         schedules = schedules.filter(work_date=filter_date)
-    if filter_doctor and _get_user_role(request) == Role.STAFF:
+    if filter_doctor and user_role == Role.STAFF:
         schedules = schedules.filter(doctor_id=filter_doctor)
+
+    # Ngày nghỉ sắp tới (bác sĩ: của mình và ngày lễ chung)
+    exceptions = (ScheduleExceptions.objects
+                  .select_related('doctor__user')
+                  .filter(day__gte=timezone.localdate())
+                  .order_by('day', 'doctor_id'))
+    if user_role == Role.DOCTOR:
+        doctor = get_identity(request).doctor
+        exceptions = exceptions.filter(Q(doctor__isnull=True) | Q(doctor=doctor))
     
     context = {
         'doctors': doctors,
         'schedules': schedules,
+        'exceptions': exceptions,
         'user_role': getattr(user, 'role', None),
         'filter_date': filter_date,
         'filter_doctor': filter_doctor,
@@ -91,22 +99,18 @@ def schedule_index(request):
 def today_visits(request):
     """Danh sách bệnh nhân khám hôm nay cho bác sĩ hoặc nhân viên"""
     today = timezone.localdate()
-    start_dt, end_dt = _local_day_range(today)
 
     # Lọc theo bác sĩ nếu là DOCTOR
     doctor_filter = {}
-    ext_user = _get_external_user(request)
-    if ext_user and _get_user_role(request) == Role.DOCTOR:
-        try:
-            doc = Doctors.objects.filter(user=ext_user).first()
-            if doc:
-                doctor_filter = {"doctor": doc}
-        except Exception:
-            doctor_filter = {}
+    if _get_user_role(request) == Role.DOCTOR:
+        doc = get_identity(request).doctor
+        if doc:
+            doctor_filter = {"doctor": doc}
 
     appts = (Appointments.objects
              .select_related("patient__user", "doctor__user", "schedule")
-             .filter(appointment_at__range=(start_dt, end_dt), **doctor_filter)
+             .for_local_day(today)
+             .filter(**doctor_filter)
              .order_by("appointment_at"))
 
     context = {
@@ -126,8 +130,8 @@ def appointment_detail(request, appointment_id: int):
     )
 
     # Quyền xem: bác sĩ chỉ xem được lịch của mình
-    ext_user = _get_external_user(request)
-    if _get_user_role(request) == Role.DOCTOR and appt.doctor.user != ext_user:
+    ident = get_identity(request)
+    if ident.role == Role.DOCTOR and appt.doctor.user_id != ident.id:
         messages.error(request, 'Bạn không có quyền truy cập chức năng này.')
         return redirect('appointments:appt_doctor_today')
 
@@ -169,8 +173,7 @@ def schedule_create(request):
         if _get_user_role(request) == Role.DOCTOR:
             # Nếu user là DOCTOR, chỉ tạo lịch cho chính mình
             try:
-                ext_user = _get_external_user(request)
-                doctor = Doctors.objects.get(user=ext_user)
+                doctor = _get_doctor(request)
                 doctor_id = doctor.id
             except Doctors.DoesNotExist:
                 messages.error(request, 'Không tìm thấy thông tin bác sĩ.')
@@ -185,19 +188,29 @@ def schedule_create(request):
             messages.error(request, 'Bạn không có quyền tạo lịch làm việc.')
             return redirect('appointments:schedule_index')
         
-        # Tạo schedule mới
-        schedule = Schedules.objects.create(
+        # Tạo schedule mới (từ chối hoặc gộp nếu trùng khung lịch khác của bác sĩ)
+        schedule, created = create_schedule(
             doctor_id=doctor_id,
             work_date=work_date,
             start_time=start_time,
             end_time=end_time,
             slot_duration_minutes=slot_duration,
             status=ScheduleStatus.OPEN,
-            created_at=timezone.now()
+            created_at=timezone.now(),
+            on_overlap=MERGE if request.POST.get('on_overlap') == MERGE else REJECT,
         )
         
-        messages.success(request, f'Đã tạo khung lịch thành công cho ngày {work_date.strftime("%d/%m/%Y")}.')
+        if created:
+            messages.success(request, f'Đã tạo khung lịch thành công cho ngày {work_date.strftime("%d/%m/%Y")}.')
+        else:
+            messages.success(
+                request,
+                f'Đã gộp vào khung lịch {schedule.start_time.strftime("%H:%M")}-{schedule.end_time.strftime("%H:%M")} '
+                f'ngày {work_date.strftime("%d/%m/%Y")}.'
+            )
         
+    except ScheduleOverlapError as e:
+        messages.error(request, str(e))
     except ValueError as e:
         messages.error(request, 'Dữ liệu không hợp lệ.')
     except IntegrityError:
@@ -208,6 +221,178 @@ def schedule_create(request):
     return redirect('appointments:schedule_index')
 
 
+@staff_required
+def schedule_generate(request):
+    """Sinh lịch làm việc N tuần từ cấu hình mặc định của bác sĩ (dry_run=1: chỉ xem trước, trả JSON)"""
+    if request.method != 'POST':
+        return redirect('appointments:schedule_index')
+
+    from .schedule_templates import generate
+
+    try:
+        date_from = request.POST.get('date_from')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else timezone.localdate()
+        weeks = int(request.POST.get('weeks') or 4)
+        doctor_ids = [int(x) for x in request.POST.getlist('doctor_id') if x]
+    except ValueError:
+        messages.error(request, 'Dữ liệu không hợp lệ.')
+        return redirect('appointments:schedule_index')
+    if not 1 <= weeks <= 26:
+        messages.error(request, 'Số tuần phải từ 1 đến 26.')
+        return redirect('appointments:schedule_index')
+
+    dry_run = request.POST.get('dry_run') == '1'
+    result = generate(date_from, weeks, doctor_ids or None, dry_run=dry_run)
+    if dry_run:
+        return JsonResponse({
+            'create': len(result.create),
+            'exists': len(result.existing),
+            'skipped': len(result.excluded),
+            'overlapping': len(result.overlapping),
+            'diff': [
+                {'action': action, 'doctor_id': doctor_id, 'date': day.isoformat(),
+                 'detail': a if action in ('skip', 'overlap') else f"{a:%H:%M}-{b:%H:%M}"}
+                for action, doctor_id, day, a, b in result.diff()
+            ],
+        })
+
+    messages.success(
+        request,
+        f'Đã sinh {result.created} khung lịch cho {weeks} tuần từ {date_from.strftime("%d/%m/%Y")} '
+        f'({len(result.existing)} đã tồn tại, {len(result.excluded)} bỏ qua do ngày nghỉ, '
+        f'{len(result.overlapping)} bỏ qua do trùng khung lịch khác).'
+    )
+    return redirect('appointments:schedule_index')
+
+
+@doctor_or_staff_required
+def schedule_exception_create(request):
+    """Thêm ngày nghỉ của bác sĩ hoặc ngày lễ (STAFF, không chọn bác sĩ) để bỏ qua khi sinh lịch"""
+    if request.method != 'POST':
+        return redirect('appointments:schedule_index')
+
+    from .schedule_templates import add_exceptions
+
+    try:
+        date_from = datetime.strptime(request.POST.get('date_from', ''), '%Y-%m-%d').date()
+        date_to = request.POST.get('date_to')
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else date_from
+        doctor_id = int(request.POST['doctor_id']) if request.POST.get('doctor_id') else None
+    except ValueError:
+        messages.error(request, 'Dữ liệu không hợp lệ.')
+        return redirect('appointments:schedule_index')
+    if date_to < date_from or (date_to - date_from).days > 62:
+        messages.error(request, 'Khoảng ngày không hợp lệ (tối đa 63 ngày).')
+        return redirect('appointments:schedule_index')
+
+    # DOCTOR chỉ thêm ngày nghỉ của mình; ngày lễ chung do STAFF thêm
+    if _get_user_role(request) == Role.DOCTOR:
+        try:
+            doctor_id = _get_doctor(request).id
+        except Doctors.DoesNotExist:
+            messages.error(request, 'Không tìm thấy thông tin bác sĩ.')
+            return redirect('appointments:schedule_index')
+
+    added = add_exceptions(date_from, date_to, doctor_id,
+                           reason=(request.POST.get('reason') or '').strip() or None)
+    label = 'ngày nghỉ' if doctor_id else 'ngày lễ'
+    messages.success(
+        request,
+        f'Đã thêm {added} {label}. Lịch sinh theo mẫu sẽ bỏ qua các ngày này; '
+        f'khung lịch đã có trong những ngày đó cần đóng bằng "Mở/đóng lịch hàng loạt".'
+    )
+    return redirect('appointments:schedule_index')
+
+
+@doctor_or_staff_required
+def schedule_exception_delete(request, pk):
+    """Xóa một ngày nghỉ / ngày lễ"""
+    if request.method != 'POST':
+        return redirect('appointments:schedule_index')
+
+    exception = get_object_or_404(ScheduleExceptions, pk=pk)
+    if _get_user_role(request) == Role.DOCTOR:
+        doctor = get_identity(request).doctor
+        if doctor is None or exception.doctor_id != doctor.id:
+            messages.error(request, 'Bạn không có quyền xóa ngày nghỉ này.')
+            return redirect('appointments:schedule_index')
+
+    exception.delete()
+    messages.success(request, f'Đã xóa ngày nghỉ {exception.day.strftime("%d/%m/%Y")}.')
+    return redirect('appointments:schedule_index')
+
+
+@doctor_or_staff_required
+def schedule_bulk(request):
+    """Mở/đóng hàng loạt lịch làm việc theo khoảng ngày (dry_run=1: chỉ xem trước, trả JSON)"""
+    if request.method != 'POST':
+        return redirect('appointments:schedule_index')
+
+    from . import schedule_bulk as bulk
+
+    try:
+        date_from = datetime.strptime(request.POST.get('date_from', ''), '%Y-%m-%d').date()
+        date_to = request.POST.get('date_to')
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else date_from
+        doctor_ids = [int(x) for x in request.POST.getlist('doctor_id') if x]
+    except ValueError:
+        messages.error(request, 'Dữ liệu không hợp lệ.')
+        return redirect('appointments:schedule_index')
+
+    status = request.POST.get('status')
+    on_booked = request.POST.get('on_booked') or bulk.CANCEL
+    if status not in ScheduleStatus.values or on_booked not in (bulk.CANCEL, bulk.FLAG):
+        messages.error(request, 'Dữ liệu không hợp lệ.')
+        return redirect('appointments:schedule_index')
+    if date_to < date_from or (date_to - date_from).days > 62:
+        messages.error(request, 'Khoảng ngày không hợp lệ (tối đa 63 ngày).')
+        return redirect('appointments:schedule_index')
+
+    # DOCTOR chỉ có thể sửa lịch của mình, STAFF có thể sửa tất cả
+    if _get_user_role(request) == Role.DOCTOR:
+        try:
+            doctor_ids = [_get_doctor(request).id]
+        except Doctors.DoesNotExist:
+            messages.error(request, 'Không tìm thấy thông tin bác sĩ.')
+            return redirect('appointments:schedule_index')
+
+    dry_run = request.POST.get('dry_run') == '1'
+    result = bulk.set_status(
+        date_from, date_to, status,
+        doctor_ids=doctor_ids or None,
+        on_booked=on_booked,
+        actor_id=get_identity(request).id,
+        reason=(request.POST.get('reason') or '').strip() or None,
+        dry_run=dry_run,
+    )
+    if dry_run:
+        data = result.as_dict()
+        data['appointment_list'] = [
+            {'id': appt_id, 'doctor_id': doctor_id, 'patient_id': patient_id,
+             'appointment_at': timezone.localtime(at).isoformat()}
+            for appt_id, doctor_id, patient_id, at in result.appointments
+        ]
+        return JsonResponse(data)
+
+    period = date_from.strftime('%d/%m/%Y')
+    if date_to != date_from:
+        period += f' - {date_to.strftime("%d/%m/%Y")}'
+    if status == ScheduleStatus.OPEN:
+        messages.success(request, f'Đã mở {result.schedules} khung lịch ({period}).')
+    elif result.flagged:
+        messages.warning(
+            request,
+            f'Đã đóng {result.schedules} khung lịch ({period}). '
+            f'{result.flagged} lịch hẹn đã đặt được giữ nguyên và đánh dấu cần liên hệ bệnh nhân.'
+        )
+    else:
+        messages.success(
+            request,
+            f'Đã đóng {result.schedules} khung lịch ({period}), hủy {result.cancelled} lịch hẹn đã đặt.'
+        )
+    return redirect('appointments:schedule_index')
+
+
 @doctor_or_staff_required
 def schedule_open(request, schedule_id):
     """Cập nhật trạng thái schedule thành OPEN"""
@@ -222,8 +407,7 @@ def schedule_open(request, schedule_id):
         # Kiểm tra quyền: DOCTOR chỉ có thể sửa lịch của mình, STAFF có thể sửa tất cả
         if _get_user_role(request) == Role.DOCTOR:
             try:
-                ext_user = _get_external_user(request)
-                doctor = Doctors.objects.get(user=ext_user)
+                doctor = _get_doctor(request)
                 if schedule.doctor != doctor:
                     messages.error(request, 'Bạn chỉ có thể sửa lịch của chính mình.')
                     return redirect('appointments:schedule_index')
@@ -256,8 +440,7 @@ def schedule_close(request, schedule_id):
         # Kiểm tra quyền: DOCTOR chỉ có thể sửa lịch của mình, STAFF có thể sửa tất cả
         if _get_user_role(request) == Role.DOCTOR:
             try:
-                ext_user = _get_external_user(request)
-                doctor = Doctors.objects.get(user=ext_user)
+                doctor = _get_doctor(request)
                 if schedule.doctor != doctor:
                     messages.error(request, 'Bạn chỉ có thể sửa lịch của chính mình.')
                     return redirect('appointments:schedule_index')
@@ -289,6 +472,12 @@ def new_step1(request):
     from django.core.paginator import Paginator
     from doctors.models import Specialties
     
+    # Bắt đầu lại từ bước 1: bỏ slot đang giữ (nếu có) từ lần đặt trước
+    from . import slot_index
+    patient_id = get_identity(request).patient_id
+    if patient_id:
+        slot_index.release_holds(patient_id)
+
     # Lấy danh sách chuyên khoa
     specialties = Specialties.objects.all()
     
@@ -303,23 +492,10 @@ def new_step1(request):
     # Xử lý GET - hiển thị form và danh sách bác sĩ
     selected_specialty_id = request.GET.get('specialty_id')
     
-    # Lấy danh sách bác sĩ và annotate giá theo rank từ database
-    from django.db import models
-    from django.db.models import Case, When, IntegerField, Value, CharField, F, Subquery, OuterRef
-    from adminpanel.models import DoctorRankFee
-    
-    # Subquery để lấy giá từ DoctorRankFee
-    rank_fee_subquery = Subquery(
-        DoctorRankFee.objects.filter(rank=OuterRef('settings__degree_title'))
-        .values('default_fee')[:1]
-    )
-    
-    degree_title = F('settings__degree_title')
-    fee_order = Case(
-        When(settings__degree_title__isnull=False, then=rank_fee_subquery),
-        default=Value(200000),
-        output_field=IntegerField(),
-    )
+    # Lấy danh sách bác sĩ và annotate giá theo rank (bảng phí dùng chung, không truy vấn thêm)
+    from django.db.models import Case, When, Value, CharField
+    from doctors.pricing import fee_case
+
     degree_label = Case(
         When(settings__degree_title="ThS", then=Value("ThS")),
         When(settings__degree_title="TS",  then=Value("TS")),
@@ -331,7 +507,7 @@ def new_step1(request):
 
     doctors_query = (
         Doctors.objects.select_related('user', 'specialty', 'settings')
-        .annotate(effective_fee=fee_order, degree_label=degree_label)
+        .annotate(effective_fee=fee_case('rank'), degree_label=degree_label)
         .order_by('effective_fee', 'user__full_name')
     )
     
@@ -342,6 +518,16 @@ def new_step1(request):
     paginator = Paginator(doctors_query, 6)
     page_number = request.GET.get('page')
     doctors = paginator.get_page(page_number)
+
+    # "Lịch trống gần nhất" cho các bác sĩ trên trang (một lần cho cả trang)
+    from .constants import BOOKING_WINDOW_DAYS
+    today = timezone.localdate()
+    booking_dates = [today + timedelta(days=i) for i in range(BOOKING_WINDOW_DAYS + 1)]
+    next_free = slot_index.next_available(
+        slot_index.availability([d.id for d in doctors], booking_dates)
+    )
+    for d in doctors:
+        d.next_available = next_free.get(d.id)
     
     context = {
         'title': 'Đặt lịch hẹn - Bước 1',
@@ -361,10 +547,11 @@ def new_step1(request):
 
 # Legacy function - moved to services.py
 # Kept for compatibility with step3 view that still references it
-def build_available_slots_legacy(doctor_id, date):
+def build_available_slots_legacy(doctor_id, date, patient_id=None):
     """Legacy function - use services.build_available_slots instead"""
     from .services import build_available_slots
-    slots = build_available_slots(doctor_id, date)
+    # patient_id: the patient's own hold does not make the slot unavailable
+    slots = build_available_slots(doctor_id, date, patient_id)
     
     # Convert to old format for step3 compatibility
     legacy_slots = []
@@ -394,6 +581,44 @@ def build_available_slots_legacy(doctor_id, date):
     return legacy_slots, schedule
 
 
+@never_cache
+@patient_required
+def availability_api(request):
+    """
+    Batch availability for the booking wizard (JSON).
+
+    GET ?doctor_ids=1,2,3&days=6 → free-slot counts and first free slot per doctor per day,
+    starting today. Cost is a constant number of queries regardless of doctors × days.
+    """
+    from .constants import BOOKING_WINDOW_DAYS
+    from . import slot_index
+
+    try:
+        doctor_ids = [int(x) for x in (request.GET.get('doctor_ids') or '').split(',') if x.strip()]
+        days = int(request.GET.get('days') or BOOKING_WINDOW_DAYS + 1)
+    except ValueError:
+        return JsonResponse({"ok": False, "msg": "Tham số không hợp lệ."}, status=400)
+    if not doctor_ids:
+        return JsonResponse({"ok": False, "msg": "Vui lòng chọn bác sĩ."}, status=400)
+    if len(doctor_ids) > 50:
+        return JsonResponse({"ok": False, "msg": "Tối đa 50 bác sĩ mỗi lần."}, status=400)
+    days = max(1, min(days, BOOKING_WINDOW_DAYS + 1))
+
+    today = timezone.localdate()
+    dates = [today + timedelta(days=i) for i in range(days)]
+    summary = slot_index.availability(doctor_ids, dates)
+    next_free = slot_index.next_available(summary)
+
+    doctors = {}
+    for did, by_day in summary.items():
+        nxt = next_free.get(did)
+        doctors[str(did)] = {
+            "days": {d.isoformat(): info for d, info in by_day.items()},
+            "next_available": {"date": nxt[0].isoformat(), "time": nxt[1]} if nxt else None,
+        }
+    return JsonResponse({"ok": True, "dates": [d.isoformat() for d in dates], "doctors": doctors})
+
+
 @never_cache
 @patient_required
 def new_step2(request):
@@ -417,10 +642,13 @@ def new_step2(request):
         messages.error(request, 'Không tìm thấy bác sĩ.')
         return redirect('appointments:new_step1')
     
-    # Date restrictions: today to today+5
+    # Date restrictions: today to today+BOOKING_WINDOW_DAYS
+    from .constants import BOOKING_WINDOW_DAYS
+    from . import slot_index
     tz_now = timezone.localtime(timezone.now())
     today = tz_now.date()
-    max_date = today + timedelta(days=5)
+    max_date = today + timedelta(days=BOOKING_WINDOW_DAYS)
+    patient_id = get_identity(request).patient_id
     
     # Xử lý POST - chọn slot
     if request.method == 'POST':
@@ -439,13 +667,22 @@ def new_step2(request):
                     return redirect(f'{request.path}?doctor_id={doctor_id}&date={selected_date}')
                 
                 # Re-validate slot availability
-                slots = build_available_slots(doctor_id, parsed_date)
+                slots = build_available_slots(doctor_id, parsed_date, patient_id)
                 slot_valid = any(s["start"] == appointment_time and s["available"] for s in slots)
                 
                 if not slot_valid:
                     messages.error(request, 'Khung giờ không còn khả dụng, vui lòng chọn lại.')
                     return redirect(f'{request.path}?doctor_id={doctor_id}&date={selected_date}')
                 
+                # Giữ chỗ slot trong vài phút để bệnh nhân khác không chọn trùng
+                if not patient_id:
+                    messages.error(request, 'Vui lòng cập nhật thông tin bệnh nhân trước khi đặt lịch.')
+                    return redirect('theme:profile')
+                parsed_time = datetime.strptime(appointment_time, '%H:%M').time()
+                if not slot_index.hold_slot(doctor_id, parsed_date, parsed_time, patient_id):
+                    messages.error(request, 'Khung giờ đang được bệnh nhân khác giữ chỗ, vui lòng chọn giờ khác.')
+                    return redirect(f'{request.path}?doctor_id={doctor_id}&date={selected_date}')
+                
                 # OK → redirect to step 3
                 return redirect(f'/appointments/new/confirm/?doctor_id={doctor_id}&date={selected_date}&time={appointment_time}')
             except ValueError:
@@ -469,7 +706,7 @@ def new_step2(request):
         parsed_date = today
     
     # Get available slots
-    slots = build_available_slots(doctor_id, parsed_date)
+    slots = build_available_slots(doctor_id, parsed_date, patient_id)
     
     context = {
         'title': 'Đặt lịch hẹn - Bước 2',
@@ -490,7 +727,7 @@ def new_step2(request):
 def new_step3(request):
     """Bước 3: Xác nhận & tạo lịch hẹn"""
     from datetime import datetime, date, time, timedelta
-    from .models import Appointments, AppointmentLogs
+    from .models import Appointments
     from patients.models import PatientProfiles
     from core.choices import ApptStatus, Source
     from .services import build_available_slots
@@ -514,10 +751,11 @@ def new_step3(request):
         messages.error(request, 'Thông tin không hợp lệ.')
         return redirect('appointments:new_step1')
     
-    # Validate date range (today to today+5)
+    # Validate date range (today to today+BOOKING_WINDOW_DAYS)
+    from .constants import BOOKING_WINDOW_DAYS
     tz_now = timezone.localtime(timezone.now())
     today = tz_now.date()
-    max_date = today + timedelta(days=5)
+    max_date = today + timedelta(days=BOOKING_WINDOW_DAYS)
     
     if parsed_date < today or parsed_date > max_date:
         messages.error(request, f'Chỉ có thể đặt lịch từ hôm nay đến {max_date.strftime("%d/%m/%Y")}.')
@@ -529,13 +767,23 @@ def new_step3(request):
         return redirect(f'/appointments/new/slots/?doctor_id={doctor_id}&date={appointment_date}')
     
     # Re-validate slot availability
-    slots = build_available_slots(doctor_id, parsed_date)
+    patient_id = get_identity(request).patient_id
+    slots = build_available_slots(doctor_id, parsed_date, patient_id)
     slot_valid = any(s["start"] == appointment_time and s["available"] for s in slots)
     
     if not slot_valid:
         messages.error(request, 'Khung giờ không còn khả dụng, vui lòng chọn lại.')
         return redirect(f'/appointments/new/slots/?doctor_id={doctor_id}&date={appointment_date}')
     
+    # Slot phải đang được giữ cho bệnh nhân này (gia hạn nếu còn; lấy lại nếu đã hết hạn mà chưa ai giữ)
+    from . import slot_index
+    if not patient_id:
+        messages.error(request, 'Vui lòng cập nhật thông tin bệnh nhân trước khi đặt lịch.')
+        return redirect('theme:profile')
+    if not slot_index.hold_slot(doctor_id, parsed_date, parsed_time, patient_id):
+        messages.error(request, 'Khung giờ đang được bệnh nhân khác giữ chỗ, vui lòng chọn giờ khác.')
+        return redirect(f'/appointments/new/slots/?doctor_id={doctor_id}&date={appointment_date}')
+    
     # Update variables for consistency
     appointment_date = parsed_date
     appointment_time = parsed_time
@@ -549,11 +797,9 @@ def new_step3(request):
         # Tìm Users instance từ Django User (request.user)
         from accounts.models import Users
         
-        # Tìm Users instance bằng email (cách chính)
-        users_instance = Users.objects.get(email=request.user.email)
-        
-        # Tìm PatientProfiles
-        patient_profile = PatientProfiles.objects.get(user=users_instance)
+        # PatientProfiles (+ Users) của request, đã ghim trong session
+        patient_profile = _get_patient_profile(request)
+        users_instance = patient_profile.user
         
     except (PatientProfiles.DoesNotExist, Users.DoesNotExist, ValueError) as e:
         print(f"DEBUG: Error finding patient profile: {e}")
@@ -568,7 +814,7 @@ def new_step3(request):
             messages.error(request, 'Vui lòng nhập lý do khám.')
         else:
             # Re-check slot availability
-            slots, schedule = build_available_slots_legacy(doctor_id, appointment_date)
+            slots, schedule = build_available_slots_legacy(doctor_id, appointment_date, patient_id)
             selected_slot_available = any(
                 slot['formatted_time'] == appointment_time.strftime('%H:%M') and slot['available']
                 for slot in slots
@@ -609,17 +855,11 @@ def new_step3(request):
                 messages.error(request, 'Slot vừa được đặt bởi người khác. Vui lòng chọn giờ khác.')
                 return redirect(f'/appointments/new/slots/?doctor_id={doctor_id}&date={appointment_date.strftime("%Y-%m-%d")}')
 
-            # Ghi log
-            try:
-                AppointmentLogs.objects.create(
-                    appointment=appointment,
-                    action='CREATE',
-                    actor_user=users_instance,  # Sử dụng Users instance thay vì request.user
-                    note=f'Đặt lịch hẹn qua portal - {reason}',
-                    created_at=timezone.now()
-                )
-            except Exception:
-                pass
+            # Slot đã có lịch hẹn: bỏ giữ chỗ của bệnh nhân
+            slot_index.release_holds(patient_id)
+
+            # Ghi log (ghi gộp sau khi commit, xem appointments.audit)
+            audit.record(appointment, 'CREATE', users_instance, f'Đặt lịch hẹn qua portal - {reason}')
             
             messages.success(request, 'Đặt lịch thành công!')
             return redirect('appointments:my_appointments')
@@ -639,21 +879,9 @@ def new_step3(request):
         messages.error(request, 'Không tìm thấy lịch làm việc phù hợp.')
         return redirect(f'/appointments/new/slots/?doctor_id={doctor_id}&date={appointment_date.strftime("%Y-%m-%d")}')
     
-    # Compute effective fee based on degree_title
-    from django.db.models import Case, When, IntegerField, Value
-    fee_case = Case(
-        When(settings__degree_title="ThS", then=Value(200000)),
-        When(settings__degree_title="TS",  then=Value(500000)),
-        When(settings__degree_title="PGS", then=Value(900000)),
-        When(settings__degree_title="GS",  then=Value(1200000)),
-        default=Value(200000),
-        output_field=IntegerField(),
-    )
-    try:
-        doc_with_fee = Doctors.objects.select_related('settings').annotate(effective_fee=fee_case).get(id=doctor_id)
-        effective_fee = doc_with_fee.effective_fee
-    except Exception:
-        effective_fee = None
+    # Phí khám theo học vị (cùng quy tắc với hóa đơn)
+    from doctors.pricing import get_consultation_fee
+    effective_fee = get_consultation_fee(doctor)
 
     context = {
         'title': 'Đặt lịch hẹn - Bước 3',
@@ -686,29 +914,21 @@ def my_appointments(request):
     try:
         # Tìm Users instance từ Django User
         from accounts.models import Users
-        users_instance = Users.objects.get(email=request.user.email)
         
         # Tìm PatientProfiles
         from patients.models import PatientProfiles
-        patient_profile = PatientProfiles.objects.get(user=users_instance)
+        patient_profile = _get_patient_profile(request)
+        users_instance = patient_profile.user
         
         # Lấy danh sách appointments
-        from django.db.models import Case, When, IntegerField, Value
-        fee_case = Case(
-            When(doctor__settings__degree_title="ThS", then=Value(200000)),
-            When(doctor__settings__degree_title="TS",  then=Value(500000)),
-            When(doctor__settings__degree_title="PGS", then=Value(900000)),
-            When(doctor__settings__degree_title="GS",  then=Value(1200000)),
-            default=Value(200000),
-            output_field=IntegerField(),
-        )
+        from doctors.pricing import fee_case
 
         appointments = Appointments.objects.filter(
             patient=patient_profile
         ).select_related(
             'doctor__user', 'doctor__specialty', 'schedule'
         ).annotate(
-            effective_fee=fee_case
+            effective_fee=fee_case('doctor__rank')
         ).order_by('-appointment_at')
         
         # Pagination
@@ -738,7 +958,7 @@ def cancel_appointment(request, pk):
     """Hủy lịch hẹn (POST only)"""
     from django.conf import settings
     from datetime import datetime, timedelta
-    from .models import Appointments, AppointmentLogs
+    from .models import Appointments
     
     if not request.user.is_authenticated:
         messages.error(request, 'Vui lòng đăng nhập.')
@@ -750,11 +970,11 @@ def cancel_appointment(request, pk):
     try:
         # Tìm Users instance từ Django User
         from accounts.models import Users
-        users_instance = Users.objects.get(email=request.user.email)
         
         # Tìm PatientProfiles
         from patients.models import PatientProfiles
-        patient_profile = PatientProfiles.objects.get(user=users_instance)
+        patient_profile = _get_patient_profile(request)
+        users_instance = patient_profile.user
         
         # Tìm appointment
         appointment = Appointments.objects.select_related(
@@ -781,13 +1001,7 @@ def cancel_appointment(request, pk):
         appointment.save()
         
         # Ghi log
-        AppointmentLogs.objects.create(
-            appointment=appointment,
-            action='CANCEL',
-            actor_user=users_instance,
-            note=f'Hủy lịch hẹn bởi bệnh nhân',
-            created_at=timezone.now()
-        )
+        audit.record(appointment, 'CANCEL', users_instance, 'Hủy lịch hẹn bởi bệnh nhân')
         
         messages.success(request, 'Đã hủy lịch hẹn thành công.')
         
@@ -816,10 +1030,9 @@ from emr.models import Drugs
 def doctor_today(request):
     """Danh sách ca hôm nay của bác sĩ hiện tại"""
     today = timezone.localdate()
-    start_dt, end_dt = _local_day_range(today)
     
     # Get external user
-    ext_user = _get_external_user(request)
+    ext_user = get_identity(request)
     if not ext_user:
         messages.error(request, "Không tìm thấy thông tin người dùng.")
         return redirect("theme:home")
@@ -831,7 +1044,8 @@ def doctor_today(request):
     inv_sub = Invoices.objects.filter(appointment_id=OuterRef("pk")).values("status")[:1]
     qs = (Appointments.objects
           .select_related("doctor__user", "doctor", "doctor__specialty", "schedule", "patient__user")
-          .filter(doctor__user_id=ext_user.id, appointment_at__range=(start_dt, end_dt))
+          .for_local_day(today)
+          .filter(doctor__user_id=ext_user.id)
           .annotate(invoice_status=Subquery(inv_sub))
           .order_by("appointment_at"))
     
@@ -967,7 +1181,7 @@ def pending_appointments(request):
     from django.db.models import Count, Q
     
     # Get external user
-    ext_user = _get_external_user(request)
+    ext_user = get_identity(request)
     if not ext_user:
         messages.error(request, "Không tìm thấy thông tin người dùng.")
         return redirect("theme:home")
@@ -0,0 +1,116 @@
+"""
+Chunked, set-based maintenance engines for invoices.
+
+Invoices are walked in primary-key order (keyset pagination, no OFFSET); each
+chunk is handled with a constant number of statements and its own short
+transaction, so the engines scale to millions of rows in a maintenance window.
+Used by the reprice_invoices and recompute_invoices management commands.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value as V, When
+
+from .models import Invoices, InvoiceItems
+from . import totals
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def iter_id_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE, fields=("id",)):
+    """Yield lists of value tuples (id first) in ascending id order, chunk by chunk."""
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by("id").values_list(*fields)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def stale_totals(invoice_ids):
+    """Invoices among invoice_ids whose stored subtotal / amount_due differ from their lines."""
+    computed = totals.items_total()
+    return (Invoices.objects
+            .filter(id__in=invoice_ids)
+            .annotate(computed=computed)
+            .filter(~Q(subtotal=F("computed")) | ~Q(amount_due=F("computed") - F("discount")))
+            .values_list("id", flat=True))
+
+
+def recompute_chunk(invoice_ids, dry_run=False):
+    """Recompute totals of one chunk with one UPDATE. Returns the number of stale invoices."""
+    stale = list(stale_totals(invoice_ids))
+    if stale and not dry_run:
+        with transaction.atomic():
+            totals.recompute(stale)
+    return len(stale)
+
+
+def reprice_chunk(rows, fees, dry_run=False):
+    """
+    Bring the consultation line of each UNPAID invoice in `rows` to the doctor's fee.
+
+    rows: (invoice_id, status, doctor_id) tuples; fees: {doctor_id: fee}.
+    Mismatched lines are fixed with one CASE UPDATE, missing lines are inserted
+    with one bulk INSERT, and totals of touched or stale invoices are recomputed
+    with one UPDATE. Returns {"updated", "created", "recomputed"} counts.
+    """
+    expected = {
+        invoice_id: Decimal(fees[doctor_id])
+        for invoice_id, status, doctor_id in rows
+        if status == "UNPAID" and doctor_id in fees
+    }
+    if not expected:
+        return {"updated": 0, "created": 0, "recomputed": 0}
+    doctor_of = {invoice_id: doctor_id for invoice_id, _, doctor_id in rows}
+
+    has_line = set()
+    touched = set()
+    ids_by_fee = defaultdict(list)
+    for line_id, invoice_id, unit_price in (InvoiceItems.objects
+                                            .filter(invoice_id__in=list(expected), item_type="CONSULTATION")
+                                            .values_list("id", "invoice_id", "unit_price")):
+        has_line.add(invoice_id)
+        if unit_price != expected[invoice_id]:
+            ids_by_fee[expected[invoice_id]].append(line_id)
+            touched.add(invoice_id)
+    missing = [invoice_id for invoice_id in expected if invoice_id not in has_line]
+    touched.update(missing)
+
+    if dry_run:
+        # Lines would change for `touched`; other invoices only if their totals are stale
+        stale = set(stale_totals(list(set(expected) - touched)))
+        return {"updated": sum(len(ids) for ids in ids_by_fee.values()),
+                "created": len(missing),
+                "recomputed": len(touched | stale)}
+
+    with transaction.atomic():
+        if ids_by_fee:
+            (InvoiceItems.objects
+             .filter(id__in=[i for ids in ids_by_fee.values() for i in ids])
+             .update(unit_price=Case(
+                 *[When(id__in=ids, then=V(fee)) for fee, ids in ids_by_fee.items()],
+                 default=F("unit_price"),
+             )))
+        if missing:
+            InvoiceItems.objects.bulk_create([
+                InvoiceItems(
+                    invoice_id=invoice_id,
+                    item_type="CONSULTATION",
+                    ref_id=doctor_of[invoice_id],
+                    description="Phí khám bệnh",
+                    unit=None,
+                    quantity=1,
+                    unit_price=expected[invoice_id],
+                )
+                for invoice_id in missing
+            ])
+        # Set-based writes bypass the item signals: recompute totals here, once per chunk
+        stale = touched | set(stale_totals(list(set(expected) - touched)))
+        totals.recompute(stale)
+
+    return {"updated": sum(len(ids) for ids in ids_by_fee.values()),
+            "created": len(missing),
+            "recomputed": len(stale)}
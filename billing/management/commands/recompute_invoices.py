@@ -1,18 +1,35 @@
+import time
+
 from django.core.management.base import BaseCommand
+
+from billing.bulk import DEFAULT_CHUNK_SIZE, iter_id_chunks, recompute_chunk
 from billing.models import Invoices
 
 
 class Command(BaseCommand):
     help = "Recompute subtotal/amount_due for all invoices"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f"Invoices per chunk/transaction (default: {DEFAULT_CHUNK_SIZE})")
+        parser.add_argument("--dry-run", action="store_true", help="Only count invoices with stale totals")
+
     def handle(self, *args, **options):
-        count = 0
-        for inv in Invoices.objects.all():
-            try:
-                inv.recompute_totals()
-                count += 1
-            except Exception as e:
-                self.stderr.write(f"Failed invoice #{inv.id}: {e}")
-        self.stdout.write(self.style.SUCCESS(f"Recomputed {count} invoices"))
+        chunk_size = max(1, options["chunk_size"])
+        dry_run = options["dry_run"]
 
+        total = Invoices.objects.count()
+        done = stale = 0
+        started = time.monotonic()
+        for rows in iter_id_chunks(Invoices.objects.all(), chunk_size):
+            stale += recompute_chunk([r[0] for r in rows], dry_run=dry_run)
+            done += len(rows)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"  {done}/{total} invoices ({done / elapsed if elapsed else 0:.0f}/s)")
 
+        elapsed = time.monotonic() - started
+        prefix = "[dry-run] Stale" if dry_run else "Recomputed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {stale} of {done} invoices "
+            f"({elapsed:.1f}s, {done / elapsed if elapsed else 0:.0f}/s)"
+        ))
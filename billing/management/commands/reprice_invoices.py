@@ -1,9 +1,11 @@
+import time
+
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from django.db.models import Sum, F, ExpressionWrapper, DecimalField
 
-from billing.models import Invoices, InvoiceItems
-from doctors.pricing import get_consultation_fee
+from billing.bulk import DEFAULT_CHUNK_SIZE, iter_id_chunks, reprice_chunk
+from billing.models import Invoices
+from doctors.models import Doctors
+from doctors.pricing import consultation_fees_by_doctor
 
 
 class Command(BaseCommand):
@@ -11,53 +13,33 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("--all", action="store_true", help="Process all invoices (default: only UNPAID)")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f"Invoices per chunk/transaction (default: {DEFAULT_CHUNK_SIZE})")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change, write nothing")
 
-    @transaction.atomic
     def handle(self, *args, **options):
         qs = Invoices.objects.all() if options.get("all") else Invoices.objects.filter(status="UNPAID")
-        updated = 0
-        for inv in qs.select_related("appointment__doctor"):
-            doctor = getattr(inv.appointment, "doctor", None)
-            if not doctor:
-                continue
-            expected_fee = get_consultation_fee(doctor)
-
-            allow_item_edit = inv.status == "UNPAID"
-
-            # Find consultation item
-            consult_item = InvoiceItems.objects.filter(invoice=inv, item_type="CONSULTATION").first()
-            if allow_item_edit:
-                if not consult_item:
-                    # Create if missing
-                    consult_item = InvoiceItems(
-                        invoice=inv,
-                        item_type="CONSULTATION",
-                        ref_id=getattr(doctor, "id", None),
-                        description="Phí khám bệnh",
-                        unit=None,
-                        quantity=1,
-                        unit_price=expected_fee,
-                    )
-                    consult_item.save()
-                    updated += 1
-                elif consult_item.unit_price != expected_fee:
-                    consult_item.unit_price = expected_fee
-                    consult_item.save(update_fields=["unit_price"])
-                    updated += 1
-
-            # Recompute totals from quantity * unit_price
-            agg = InvoiceItems.objects.filter(invoice=inv).aggregate(
-                total=Sum(
-                    ExpressionWrapper(F("quantity") * F("unit_price"),
-                                      output_field=DecimalField(max_digits=12, decimal_places=2))
-                )
-            )
-            total = agg.get("total") or 0
-            if inv.status == "UNPAID":
-                inv.subtotal = total
-                inv.amount_due = total
-                inv.save(update_fields=["subtotal", "amount_due"])
-
-        self.stdout.write(self.style.SUCCESS(f"Repriced invoices. Updated items: {updated}"))
-
-
+        chunk_size = max(1, options["chunk_size"])
+        dry_run = options["dry_run"]
+
+        # Expected fee of every doctor, computed once for the whole run
+        fees = consultation_fees_by_doctor(Doctors.objects.values_list("id", flat=True))
+
+        total = qs.count()
+        done = 0
+        counts = {"updated": 0, "created": 0, "recomputed": 0}
+        started = time.monotonic()
+        for rows in iter_id_chunks(qs, chunk_size, fields=("id", "status", "appointment__doctor_id")):
+            for key, n in reprice_chunk(rows, fees, dry_run=dry_run).items():
+                counts[key] += n
+            done += len(rows)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"  {done}/{total} invoices ({done / elapsed if elapsed else 0:.0f}/s)")
+
+        elapsed = time.monotonic() - started
+        prefix = "[dry-run] Would reprice" if dry_run else "Repriced"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} invoices. Updated items: {counts['updated']}, created items: {counts['created']}, "
+            f"recomputed totals: {counts['recomputed']} "
+            f"({done} invoices in {elapsed:.1f}s, {done / elapsed if elapsed else 0:.0f}/s)"
+        ))
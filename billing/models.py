@@ -2,6 +2,16 @@ from django.db import models
 from django.db.models import Sum, F, DecimalField, Value as V
 from django.db.models.functions import Coalesce
 from core.choices import InvoiceStatus, ItemType
+from clinic.localdates import LocalDayQuerySet
+
+
+class InvoiceQuerySet(LocalDayQuerySet):
+    local_day_field = "created_at"
+
+
+class PaymentQuerySet(LocalDayQuerySet):
+    local_day_field = "paid_at"
+
 
 class Invoices(models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -15,25 +25,17 @@ class Invoices(models.Model):
     printed_at = models.DateTimeField(blank=True, null=True)
     printed_by_user = models.ForeignKey("accounts.Users", models.DO_NOTHING, blank=True, null=True, related_name="printed_invoices")
 
+    objects = InvoiceQuerySet.as_manager()
+
     class Meta:
         managed = False
         db_table = 'invoices'
 
     def recompute_totals(self):
-        total = (
-            self.items.aggregate(
-                s=Coalesce(
-                    Sum(
-                        F('quantity') * F('unit_price'),
-                        output_field=DecimalField(max_digits=12, decimal_places=2)
-                    ),
-                    V(0, output_field=DecimalField(max_digits=12, decimal_places=2))
-                )
-            ).get('s') or 0
-        )
-        self.subtotal = total
-        self.amount_due = total - (self.discount or 0)
-        self.save(update_fields=["subtotal", "amount_due"])
+        """Recompute subtotal / amount_due from the items right away (see billing.totals)."""
+        from .totals import recompute
+        recompute([self.pk])
+        self.refresh_from_db(fields=["subtotal", "amount_due"])
 
 class InvoiceItems(models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -58,6 +60,8 @@ class Payments(models.Model):
     received_by_user = models.ForeignKey("accounts.Users", models.PROTECT)
     note = models.TextField(blank=True, null=True)
 
+    objects = PaymentQuerySet.as_manager()
+
     class Meta:
         managed = False
         db_table = 'payments'
@@ -0,0 +1,45 @@
+"""
+Invoice printout shared by the staff and admin print views.
+
+A PAID invoice no longer changes, so its printout is rendered once and kept
+in the document store (clinic.documents); later prints, copies included, are
+served from the stored file. Other invoices are rendered on every request.
+"""
+from django.shortcuts import render
+from django.template.loader import render_to_string
+
+from clinic import documents
+from core.choices import InvoiceStatus
+
+TEMPLATE = "billing/invoice_print.html"
+
+
+def _version(invoice, lines, clinic):
+    appointment = invoice.appointment
+    patient, doctor = appointment.patient, appointment.doctor
+    return documents.fingerprint(
+        documents.template_version(TEMPLATE),
+        documents.values(invoice),
+        [documents.values(line) for line in lines],
+        patient.user.full_name, patient.cccd,
+        doctor.user.full_name, doctor.specialty.name, doctor.room_number,
+        invoice.printed_by_user.full_name if invoice.printed_by_user_id else None,
+        sorted(clinic.items()),
+    )
+
+
+def invoice_response(request, invoice, lines, clinic):
+    """Printout of an invoice; served from the document store once it is PAID."""
+    context = {
+        "invoice": invoice,
+        "lines": lines,
+        "clinic": clinic,
+        "printed_at": invoice.printed_at,
+    }
+    if invoice.status != InvoiceStatus.PAID:
+        return render(request, TEMPLATE, context)
+    doc = documents.get_or_render(
+        documents.INVOICE, invoice.pk, _version(invoice, lines, clinic), documents.HTML,
+        lambda: render_to_string(TEMPLATE, context, request=request),
+    )
+    return documents.serve(request, doc)
@@ -1,13 +1,18 @@
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import InvoiceItems
+from clinic import documents
+from .models import InvoiceItems, Invoices
+from . import totals
 
 
 @receiver([post_save, post_delete], sender=InvoiceItems)
 def recompute_invoice_totals(sender, instance, **kwargs):
-    try:
-        instance.invoice.recompute_totals()
-    except Exception:
-        pass
+    # Batched: recomputed once per invoice when the transaction commits
+    totals.mark_dirty(instance.invoice_id)
 
 
+@receiver(post_delete, sender=Invoices)
+def drop_stored_printout(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: documents.invalidate(documents.INVOICE, pk))
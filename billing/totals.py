@@ -0,0 +1,101 @@
+"""
+Batched maintenance of Invoices.subtotal / amount_due.
+
+Item writes only mark their invoice dirty; after the surrounding transaction
+commits, every dirty invoice is recomputed with a single set-based UPDATE
+(correlated SUM over invoice_items). Bulk helpers write many lines at once and
+mark the invoice a single time, so a 50-line invoice costs one aggregate.
+
+`invoice_totals_changed` is sent after each recompute with the invoice ids, for
+listeners that depend on the totals (e.g. dashboard rollups).
+"""
+import threading
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value as V
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+
+from .models import Invoices, InvoiceItems
+
+invoice_totals_changed = Signal()  # kwargs: invoice_ids (set)
+
+_MONEY = DecimalField(max_digits=12, decimal_places=2)
+_state = threading.local()
+
+
+def _dirty():
+    if not hasattr(_state, "dirty"):
+        _state.dirty = set()
+    return _state.dirty
+
+
+def items_total():
+    """SUM(quantity * unit_price) of an invoice's lines, correlated on the outer invoice pk."""
+    return Coalesce(
+        Subquery(InvoiceItems.objects
+                 .filter(invoice_id=OuterRef("pk"))
+                 .values("invoice_id")
+                 .annotate(s=Sum(F("quantity") * F("unit_price"), output_field=_MONEY))
+                 .values("s")[:1],
+                 output_field=_MONEY),
+        V(0, output_field=_MONEY),
+    )
+
+
+def recompute(invoice_ids):
+    """Recompute totals of the given invoices with one UPDATE. Returns rows updated."""
+    ids = sorted({i for i in invoice_ids if i is not None})
+    if not ids:
+        return 0
+    total = items_total()
+    updated = Invoices.objects.filter(id__in=ids).update(
+        subtotal=total,
+        amount_due=total - F("discount"),
+    )
+    invoice_totals_changed.send(sender=Invoices, invoice_ids=set(ids))
+    return updated
+
+
+def _flush():
+    ids, _state.dirty = _dirty(), set()
+    if ids:
+        recompute(ids)
+
+
+def mark_dirty(*invoice_ids):
+    """Recompute these invoices' totals once, after the current transaction commits."""
+    ids = {i for i in invoice_ids if i is not None}
+    if not ids:
+        return
+    _dirty().update(ids)
+    transaction.on_commit(_flush)
+
+
+def _apply_in_memory(invoice, items):
+    """Keep the caller's invoice instance in line with what the UPDATE will store."""
+    subtotal = sum((Decimal(str(i.quantity)) * Decimal(str(i.unit_price)) for i in items), Decimal(0))
+    invoice.subtotal = subtotal
+    invoice.amount_due = subtotal - (invoice.discount or 0)
+
+
+@transaction.atomic
+def add_invoice_items(invoice, items):
+    """Insert many lines of one invoice; totals are recomputed once at commit."""
+    items = list(items)
+    for item in items:
+        item.invoice = invoice
+    InvoiceItems.objects.bulk_create(items)
+    mark_dirty(invoice.pk)
+    return items
+
+
+@transaction.atomic
+def replace_invoice_items(invoice, items):
+    """Replace every line of an invoice; totals are recomputed once at commit."""
+    items = list(items)
+    InvoiceItems.objects.filter(invoice=invoice).delete()
+    add_invoice_items(invoice, items)
+    _apply_in_memory(invoice, items)
+    return items
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('chatbot', '0001_initial'),
+    ]
+
+    # chatbot_messages is unmanaged; the monthly archiver selects by created_at
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE INDEX chatbot_messages_created_at_idx ON chatbot_messages (created_at, id);",
+            reverse_sql="DROP INDEX chatbot_messages_created_at_idx ON chatbot_messages;",
+        ),
+    ]
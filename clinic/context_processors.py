@@ -2,6 +2,7 @@
 Context processors for DUT Hospital System
 """
 from core.choices import Role
+from .identity import get_identity
 
 
 def role_flags(request):
@@ -22,17 +23,8 @@ def role_flags(request):
             "USER_ROLE_DISPLAY": None,
         }
     
-    # Find role from ExternalUser table by email
-    user_role = None
-    try:
-        from accounts.models import Users as ExternalUser
-        email = getattr(request.user, 'email', None)
-        if email:
-            ext_user = ExternalUser.objects.filter(email=email).first()
-            if ext_user:
-                user_role = ext_user.role
-    except Exception:
-        pass
+    # Role from the request's external user (resolved once per request)
+    user_role = get_identity(request).role
     
     return {
         "IS_AUTH": True,
@@ -63,19 +55,12 @@ def user_info(request):
     user_full_name = getattr(request.user, 'full_name', '')
     user_email = getattr(request.user, 'email', '')
     
-    try:
-        from accounts.models import Users as ExternalUser
-        email = getattr(request.user, 'email', None)
-        if email:
-            ext_user = ExternalUser.objects.filter(email=email).first()
-            if ext_user:
-                # Use full_name from ExternalUser if available
-                if hasattr(ext_user, 'full_name') and ext_user.full_name:
-                    user_full_name = ext_user.full_name
-                if hasattr(ext_user, 'email') and ext_user.email:
-                    user_email = ext_user.email
-    except Exception:
-        pass
+    ident = get_identity(request)
+    # Use full_name / email from ExternalUser if available
+    if ident.full_name:
+        user_full_name = ident.full_name
+    if ident.email:
+        user_email = ident.email
     
     return {
         "CURRENT_USER": request.user,
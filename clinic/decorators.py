@@ -6,21 +6,12 @@ from django.contrib import messages
 from django.shortcuts import redirect
 from django.urls import reverse
 from core.choices import Role
+from .identity import get_identity
 
 
 def _resolve_user_role(request):
-    """Return user role string by looking up ExternalUser by email."""
-    try:
-        if not request.user.is_authenticated:
-            return None
-        email = getattr(request.user, "email", None)
-        if not email:
-            return None
-        from accounts.models import Users as ExternalUser
-        ext = ExternalUser.objects.filter(email=email).first()
-        return getattr(ext, "role", None)
-    except Exception:
-        return None
+    """Return the role of the request's external user (resolved once per request)."""
+    return get_identity(request).role
 
 
 def role_required(allowed_roles):
@@ -114,16 +105,9 @@ def doctor_owns_appointment(view):
             return redirect("theme:home")
         
         if user_role == "DOCTOR":
-            try:
-                email = getattr(request.user, "email", None)
-                if email:
-                    from accounts.models import Users as ExternalUser
-                    ext = ExternalUser.objects.filter(email=email).first()
-                    if ext and appt.doctor.user_id != ext.id:
-                        messages.error(request, "Bạn không có quyền với lịch hẹn này.")
-                        return redirect("appointments:appt_doctor_today")
-            except Exception:
-                messages.error(request, "Lỗi xác thực người dùng.")
+            ident = get_identity(request)
+            if ident and appt.doctor.user_id != ident.id:
+                messages.error(request, "Bạn không có quyền với lịch hẹn này.")
                 return redirect("appointments:appt_doctor_today")
         
         request.appt = appt
@@ -0,0 +1,189 @@
+"""
+Content-addressed store for rendered documents (PDF / print HTML).
+
+Once an invoice is PAID or a visit COMPLETED its printout never changes, so
+it is rendered once and kept on disk at
+
+    DOCUMENT_STORE_ROOT/<kind>/<entity id>/<fingerprint>.<ext>
+
+The fingerprint is a hash of everything the document shows (the caller lists
+those values, from rows it loads anyway) plus the template name, so an edit of
+the underlying record simply addresses a new file; the stale one is removed
+when the new one is written, and `invalidate()` drops all files of a deleted
+record. The fingerprint doubles as the HTTP ETag: a browser revalidating an
+unchanged document gets a 304 without the file being read.
+
+Writes go to a temporary file renamed into place, so concurrent renders of
+the same document are harmless and readers never see a partial file.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.template import Context
+from django.template.loader import get_template
+from django.template.loader_tags import ExtendsNode
+
+# Document kinds
+INVOICE = "invoice"
+VISIT_SUMMARY = "visit_summary"
+
+PDF = ("pdf", "application/pdf")
+HTML = ("html", "text/html; charset=utf-8")
+
+
+class PdfUnavailable(Exception):
+    """Neither WeasyPrint nor xhtml2pdf could render the document."""
+
+
+def root():
+    return Path(getattr(settings, "DOCUMENT_STORE_ROOT", Path(settings.BASE_DIR) / "var" / "documents"))
+
+
+def fingerprint(*parts):
+    """Stable hash of the values a document is rendered from."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()[:32]
+
+
+def values(obj):
+    """Column values of a model instance (None stays None), for fingerprint()."""
+    if obj is None:
+        return None
+    return [getattr(obj, f.attname) for f in obj._meta.concrete_fields]
+
+
+@lru_cache(maxsize=None)
+def template_version(name):
+    """
+    Hash of a template's source and of the templates it extends, so a layout
+    change addresses new files after a deploy.
+    """
+    sources, template = [name], get_template(name).template
+    while template is not None:
+        sources.append(template.source)
+        parent = next((n for n in template.nodelist if isinstance(n, ExtendsNode)), None)
+        template = get_template(parent.parent_name.resolve(Context())).template if parent else None
+    return fingerprint(*sources)
+
+
+class Document:
+    def __init__(self, kind, entity_id, version, fmt):
+        self.kind, self.entity_id, self.version = kind, entity_id, version
+        self.ext, self.content_type = fmt
+
+    @property
+    def folder(self):
+        return root() / self.kind / str(self.entity_id)
+
+    @property
+    def path(self):
+        return self.folder / f"{self.version}.{self.ext}"
+
+    @property
+    def etag(self):
+        return f'"{self.version}"'
+
+    def exists(self):
+        return self.path.is_file()
+
+    def save(self, content):
+        """Store the rendered bytes/str and drop older versions of the same entity."""
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        self.folder.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        for other in self.folder.iterdir():
+            if other != self.path and not other.name.endswith(".tmp"):
+                other.unlink(missing_ok=True)
+        return self.path
+
+
+def get_or_render(kind, entity_id, version, fmt, render):
+    """The stored document, rendering it with render() -> bytes|str only when missing."""
+    doc = Document(kind, entity_id, version, fmt)
+    if not doc.exists():
+        doc.save(render())
+    return doc
+
+
+def not_modified(request, doc):
+    """304 response if the client already holds this version, else None."""
+    tags = [t.strip() for t in request.headers.get("If-None-Match", "").split(",")]
+    if doc.etag in tags or "*" in tags:
+        response = HttpResponseNotModified()
+        response["ETag"] = doc.etag
+        return response
+    return None
+
+
+def serve(request, doc, filename=None, as_attachment=False):
+    """FileResponse of a stored document with its ETag (or a 304)."""
+    response = not_modified(request, doc)
+    if response is None:
+        response = FileResponse(open(doc.path, "rb"), content_type=doc.content_type,
+                                as_attachment=as_attachment, filename=filename)
+        response["ETag"] = doc.etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def invalidate(kind, entity_id):
+    """Drop every stored version of one entity's document."""
+    shutil.rmtree(root() / kind / str(entity_id), ignore_errors=True)
+
+
+# WeasyPrint state kept by a long-lived renderer process (see warm_up)
+_weasy_options = {}
+
+
+def warm_up():
+    """
+    Load WeasyPrint and its fonts once, for a process that renders many
+    documents (the render worker); later renders reuse the font configuration
+    and the image/stylesheet cache. Returns False if WeasyPrint is unavailable.
+    """
+    try:
+        from weasyprint import HTML as WeasyHTML  # type: ignore
+        from weasyprint.text.fonts import FontConfiguration  # type: ignore
+        options = {"font_config": FontConfiguration(), "cache": {}}
+        WeasyHTML(string="<p>.</p>").write_pdf(**options)
+    except Exception:
+        return False
+    _weasy_options.update(options)
+    return True
+
+
+def html_to_pdf(html, base_url=None):
+    """Render HTML with WeasyPrint, falling back to xhtml2pdf (both optional)."""
+    try:
+        from weasyprint import HTML as WeasyHTML  # type: ignore
+        return WeasyHTML(string=html, base_url=base_url).write_pdf(**_weasy_options)
+    except Exception:
+        pass
+    try:
+        from io import BytesIO
+        from xhtml2pdf import pisa  # type: ignore
+    except Exception as e:
+        raise PdfUnavailable(str(e))
+    result = BytesIO()
+    status = pisa.CreatePDF(src=html, dest=result, encoding="utf-8")
+    if status.err:
+        raise PdfUnavailable("xhtml2pdf failed")
+    return result.getvalue()
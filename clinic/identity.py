@@ -0,0 +1,194 @@
+"""
+Request-scoped identity of the logged-in user.
+
+Django's auth user and the clinic's `accounts.Users` row are linked by email.
+The external user's id, role, active flag and doctor / patient profile ids are
+pinned in the session at login, so most requests resolve their identity with
+no database query at all. Every pin carries a version stamp read from the
+shared cache; `invalidate_identity(user_id)` (called from the Users / profile
+write paths) changes the stamp, and the next request of that user reloads the
+row, so role changes and deactivations apply on the following request. Pins
+are also re-checked against the database every IDENTITY_RECHECK_SECONDS as a
+safety net for writes made outside the application.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+
+SESSION_KEY = "_identity"
+
+
+def _version_key(user_id):
+    return f"identity:ver:{user_id}"
+
+
+def identity_version(user_id):
+    return cache.get(_version_key(user_id)) or 0
+
+
+def invalidate_identity(user_id):
+    """Force every session of this external user to reload its identity."""
+    if user_id:
+        cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+class Identity:
+    """External user, role and role profile of one request."""
+
+    revoked = False  # session pinned to an account that was deleted
+
+    def __init__(self, user=None, pin=None):
+        self._pin = pin
+        if user is not None or pin is None:
+            self.__dict__["user"] = user  # accounts.Users or None
+
+    def __bool__(self):
+        return self._pin is not None or self.user is not None
+
+    def _get(self, name):
+        if self._pin is not None:
+            return self._pin.get(name)
+        return getattr(self.user, name, None)
+
+    @property
+    def id(self):
+        return self._pin["user_id"] if self._pin is not None else getattr(self.user, "id", None)
+
+    @property
+    def role(self):
+        return self._get("role")
+
+    @property
+    def full_name(self):
+        return self._get("full_name")
+
+    @property
+    def email(self):
+        return self._get("email")
+
+    @property
+    def is_active(self):
+        return bool(self._get("is_active"))
+
+    @cached_property
+    def user(self):
+        # Only reached for pinned identities: load the full row on demand
+        from accounts.models import Users
+        return Users.objects.filter(pk=self._pin["user_id"]).first()
+
+    @cached_property
+    def doctor(self):
+        if self._pin is not None:
+            if not self._pin.get("doctor_id"):
+                return None
+            from doctors.models import Doctors
+            return (Doctors.objects.select_related("user", "specialty")
+                    .filter(pk=self._pin["doctor_id"]).first())
+        return self._reverse_one("doctors")
+
+    @cached_property
+    def patient(self):
+        if self._pin is not None:
+            if not self._pin.get("patient_id"):
+                return None
+            from patients.models import PatientProfiles
+            return (PatientProfiles.objects.select_related("user")
+                    .filter(pk=self._pin["patient_id"]).first())
+        return self._reverse_one("patientprofiles")
+
+    @property
+    def patient_id(self):
+        """PatientProfiles id without loading the row when the identity is pinned."""
+        if self._pin is not None:
+            return self._pin.get("patient_id")
+        return getattr(self.patient, "id", None)
+
+    @cached_property
+    def staff(self):
+        if not self:
+            return None
+        from staff.models import StaffProfiles
+        return StaffProfiles.objects.filter(user_id=self.id).first()
+
+    def _reverse_one(self, name):
+        if self.user is None:
+            return None
+        try:
+            return getattr(self.user, name)
+        except Exception:
+            return None
+
+
+ANONYMOUS = Identity(None)
+
+
+def load_identity(email):
+    """One query: accounts.Users by email, joined with its doctor / patient row."""
+    if not email:
+        return ANONYMOUS
+    from accounts.models import Users
+    try:
+        user = (Users.objects
+                .select_related("doctors", "doctors__specialty", "patientprofiles")
+                .filter(email=email)
+                .first())
+    except Exception:
+        user = None
+    return Identity(user)
+
+
+def pin_identity(request, ident):
+    """Store the identity's ids and role in the session (no-op without an external user)."""
+    if not hasattr(request, "session") or ident.user is None:
+        return
+    doctor, patient = ident.doctor, ident.patient
+    request.session[SESSION_KEY] = {
+        "user_id": ident.id,
+        "email": ident.email,
+        "full_name": ident.full_name,
+        "role": ident.role,
+        "is_active": int(bool(getattr(ident.user, "is_active", 0))),
+        "doctor_id": getattr(doctor, "id", None),
+        "patient_id": getattr(patient, "id", None),
+        "version": identity_version(ident.id),
+        "checked_at": int(time.time()),
+    }
+
+
+def _pin_is_fresh(pin, email):
+    recheck = getattr(settings, "IDENTITY_RECHECK_SECONDS", 300)
+    return (
+        pin.get("email") == email
+        and pin.get("version") == identity_version(pin.get("user_id"))
+        and time.time() - pin.get("checked_at", 0) < recheck
+    )
+
+
+def get_identity(request):
+    """Identity of the request's user, resolved at most once per request."""
+    ident = getattr(request, "_identity", None)
+    if ident is not None:
+        return ident
+
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        ident = ANONYMOUS
+    else:
+        email = getattr(user, "email", None)
+        session = getattr(request, "session", None)
+        pin = session.get(SESSION_KEY) if session is not None else None
+        if pin and _pin_is_fresh(pin, email):
+            ident = Identity(pin=pin)
+        else:
+            ident = load_identity(email)
+            if ident:
+                pin_identity(request, ident)
+            elif pin and session is not None:
+                # The pinned external account no longer exists
+                del session[SESSION_KEY]
+                ident = Identity(None)
+                ident.revoked = True
+    request._identity = ident
+    return ident
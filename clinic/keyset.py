@@ -0,0 +1,103 @@
+"""
+Keyset (cursor) pagination.
+
+Rows are ordered by (field, id) and a page is "the next N rows after / before
+this (field, id) pair", which the database answers with one index range read
+whatever the depth. No COUNT(*) and no OFFSET. Cursors are opaque strings
+"<field value ISO>_<id>" carried in the query string.
+"""
+from dataclasses import dataclass, field as dc_field
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(value, pk):
+    return f"{value.isoformat()}_{pk}"
+
+
+def decode_cursor(cursor):
+    """(datetime, id) from a cursor string, or None if it is malformed."""
+    try:
+        value, pk = (cursor or "").rsplit("_", 1)
+        return datetime.fromisoformat(value), int(pk)
+    except ValueError:
+        return None
+
+
+@dataclass
+class KeysetPage:
+    items: list = dc_field(default_factory=list)
+    has_next: bool = False
+    has_previous: bool = False
+    next_cursor: str = ""
+    prev_cursor: str = ""
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _beyond(field, value, pk, descending):
+    """Rows strictly after (value, pk) in the given direction."""
+    op = "lt" if descending else "gt"
+    return Q(**{f"{field}__{op}": value}) | Q(**{field: value, f"id__{op}": pk})
+
+
+def paginate(queryset, field, page_size, after=None, before=None, descending=True):
+    """
+    One page of `queryset` ordered by (field, id).
+
+    `after` continues forward from a next_cursor; `before` goes back from a
+    prev_cursor. Reads page_size + 1 rows to know whether another page exists.
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+    backwards = before is not None and after is None
+    forward_order = [f"-{field}", "-id"] if descending else [field, "id"]
+    reverse_order = [f"{field}", "id"] if descending else [f"-{field}", "-id"]
+
+    if backwards:
+        qs = queryset.filter(_beyond(field, *before, not descending)).order_by(*reverse_order)
+    else:
+        qs = queryset.order_by(*forward_order)
+        if after is not None:
+            qs = qs.filter(_beyond(field, *after, descending))
+
+    rows = list(qs[:page_size + 1])
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    page = KeysetPage(items=rows)
+    if backwards:
+        page.has_previous, page.has_next = more, True
+    else:
+        page.has_previous, page.has_next = after is not None, more
+    if rows:
+        page.prev_cursor = encode_cursor(getattr(rows[0], field), rows[0].pk)
+        page.next_cursor = encode_cursor(getattr(rows[-1], field), rows[-1].pk)
+    return page
+
+
+def iterate(queryset, field, columns, chunk_size=2000, descending=True):
+    """
+    Yield `columns` tuples (values_list) of every row of `queryset` ordered by
+    (field, id), reading chunk_size rows per query. Each chunk continues after
+    the last (field, id) read, so memory stays bounded by one chunk whatever
+    the size of the result and the database driver's buffering.
+    """
+    order = [f"-{field}", "-id"] if descending else [field, "id"]
+    qs = queryset.order_by(*order).values_list(field, "id", *columns)
+    last = None
+    while True:
+        page = qs if last is None else qs.filter(_beyond(field, *last, descending))
+        count = 0
+        for row in page[:chunk_size].iterator(chunk_size=chunk_size):
+            count += 1
+            last = row[:2]
+            yield row[2:]
+        if count < chunk_size:
+            return
@@ -0,0 +1,125 @@
+"""
+Local-calendar-day helpers for reports.
+
+Datetimes are stored in UTC; the clinic works in settings.TIME_ZONE
+(Asia/Ho_Chi_Minh, UTC+7, no DST). Grouping "per day" therefore has to happen on
+the local date. `LocalDate` does that inside the database with a fixed offset:
+on MySQL it renders DATE(DATE_ADD(col, INTERVAL n MINUTE)), which needs no
+time zone tables (CONVERT_TZ with named zones returns NULL without them). Other
+backends use Django's TruncDate with the same fixed offset.
+
+Filtering "on a local day" works the other way round: `LocalDayQuerySet`
+turns days into half-open [start, end) ranges on the raw column, which the
+database can answer from an index (`col__date=...` wraps the column in a
+function and forces a scan).
+"""
+from datetime import datetime, timedelta, time, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def local_offset():
+    """UTC offset of the clinic's time zone (fixed; the zone has no DST)."""
+    return ZoneInfo(settings.TIME_ZONE).utcoffset(datetime.now())
+
+
+def local_tzinfo():
+    return dt_timezone(local_offset())
+
+
+class LocalDate(TruncDate):
+    """Local calendar date of a datetime column, computed in SQL."""
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, tzinfo=local_tzinfo(), **extra)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.lhs)
+        minutes = int(local_offset().total_seconds() // 60)
+        return f"DATE(DATE_ADD({sql}, INTERVAL %s MINUTE))", (*params, minutes)
+
+
+def local_day_bounds(day):
+    """Half-open [start, end) aware datetimes covering a local day."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def local_range_bounds(date_from, date_to):
+    """Half-open [start, end) aware datetimes covering local days date_from..date_to."""
+    return local_day_bounds(date_from)[0], local_day_bounds(date_to)[1]
+
+
+def local_range_q(field, date_from=None, date_to=None):
+    """Q for `field` within local days date_from..date_to (either end may be open)."""
+    q = Q()
+    if date_from:
+        q &= Q(**{f"{field}__gte": local_day_bounds(date_from)[0]})
+    if date_to:
+        q &= Q(**{f"{field}__lt": local_day_bounds(date_to)[1]})
+    return q
+
+
+class LocalDayQuerySet(models.QuerySet):
+    """QuerySet filtering a datetime column by local calendar days, index friendly.
+
+    Subclasses set `local_day_field` to the column used when `field` is omitted.
+    """
+    local_day_field = None
+
+    def _field(self, field):
+        return field or self.local_day_field
+
+    def for_local_day(self, day, field=None):
+        return self.filter(local_range_q(self._field(field), day, day))
+
+    def for_local_days(self, days, field=None):
+        """Rows on any of `days`; consecutive days collapse into one range."""
+        days = sorted(set(days))
+        if not days:
+            return self.none()
+        q, run_start, prev = Q(), days[0], days[0]
+        for day in days[1:] + [None]:
+            if day is not None and (day - prev).days == 1:
+                prev = day
+                continue
+            q |= local_range_q(self._field(field), run_start, prev)
+            run_start = prev = day
+        return self.filter(q)
+
+    def in_local_range(self, date_from=None, date_to=None, field=None):
+        """Rows from local day date_from to date_to inclusive (None leaves that end open)."""
+        return self.filter(local_range_q(self._field(field), date_from, date_to))
+
+
+def day_list(date_from, date_to):
+    """Every date from date_from to date_to inclusive."""
+    return [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+
+
+def group_by_local_day(queryset, field, date_from, date_to, by=(), filter_range=True, **aggregates):
+    """
+    Aggregate `queryset` per local day of the datetime `field` (and the extra `by` fields).
+
+    Returns a list of dicts with "day", the `by` fields and the aggregate names.
+    The range filter is applied on the raw column (index friendly); pass
+    filter_range=False when the caller already restricts the rows.
+    """
+    if filter_range:
+        start, end = local_range_bounds(date_from, date_to)
+        queryset = queryset.filter(**{f"{field}__gte": start, f"{field}__lt": end})
+    return list(queryset
+                .annotate(day=LocalDate(field))
+                .values("day", *by)
+                .annotate(**aggregates)
+                .order_by())
+
+
+def dense_day_series(values, date_from, date_to, default=0):
+    """Zero-filled list of values[day] for every day from date_from to date_to."""
+    return [values.get(d, default) for d in day_list(date_from, date_to)]
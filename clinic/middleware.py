@@ -0,0 +1,48 @@
+"""
+Middleware for DUT Hospital System
+"""
+from django.contrib import messages
+from django.contrib.auth import logout
+from django.shortcuts import redirect
+from django.utils.functional import SimpleLazyObject
+
+from .identity import get_identity
+
+
+class IdentityMiddleware:
+    """
+    Attach `request.identity` (external user, role, doctor/patient/staff row).
+
+    For authenticated users the identity comes from the session pin (see
+    clinic.identity); sessions of deleted or deactivated external accounts are
+    logged out here. Must come after Session/Authentication/Message middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.user.is_authenticated:
+            ident = get_identity(request)
+            if ident.revoked or (ident and not ident.is_active):
+                logout(request)
+                messages.error(request, "Tài khoản đã bị vô hiệu hóa!")
+                return redirect("theme:login")
+        request.identity = SimpleLazyObject(lambda: get_identity(request))
+        return self.get_response(request)
+
+
+class AuditLogMiddleware:
+    """
+    Collect the AppointmentLogs rows a request records and write them with one
+    INSERT at the end of the request (see appointments.audit).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from appointments import audit
+
+        with audit.collect():
+            return self.get_response(request)
@@ -5,6 +5,7 @@ from django.contrib import messages
 from django.shortcuts import redirect
 from django.urls import reverse
 from core.choices import Role
+from .identity import get_identity
 
 
 class RoleRequiredMixin:
@@ -24,15 +25,7 @@ class RoleRequiredMixin:
             return redirect('theme:login')
         
         # Check if user has required role
-        user_role = None
-        try:
-            email = getattr(request.user, 'email', None)
-            if email:
-                from accounts.models import Users as ExternalUser
-                ext = ExternalUser.objects.filter(email=email).first()
-                user_role = getattr(ext, 'role', None)
-        except Exception:
-            user_role = None
+        user_role = get_identity(request).role
         if user_role not in self.allowed_roles:
             messages.error(request, "Bạn không có quyền truy cập chức năng này.")
             return redirect('theme:home')
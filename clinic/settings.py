@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from django.contrib.messages import constants as messages
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -67,6 +68,8 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'clinic.middleware.IdentityMiddleware',
+    'clinic.middleware.AuditLogMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -168,6 +171,13 @@ STATICFILES_DIRS = [
 # Media files (user uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Rendered invoices / visit summaries (clinic.documents); private, never served as static media
+DOCUMENT_STORE_ROOT = BASE_DIR / 'var' / 'documents'
+# PDFs are rendered by `manage.py render_worker`, never inside a web request;
+# set DOCUMENT_RENDER_ASYNC = False to render in the request (no worker running)
+DOCUMENT_RENDER_ASYNC = True
+RENDER_WORKER_PROCESSES = 2
+RENDER_JOB_TIMEOUT_SECONDS = 300   # a RUNNING job older than this is retried (worker died)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -176,6 +186,33 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Appointment Settings
 APPOINTMENT_CANCEL_BEFORE_MINUTES = 120  # 2 hours before appointment
+# How long a slot picked in booking step 2 stays reserved for the patient
+SLOT_HOLD_SECONDS = 300
+# Sweeper (manage.py sweep_appointments): past-due appointments nobody acted on
+APPOINTMENT_NO_SHOW_GRACE_MINUTES = 60    # CONFIRMED this long after its time -> NO_SHOW
+APPOINTMENT_PENDING_GRACE_MINUTES = 30    # PENDING this long after its time -> CANCELLED
+# Write non-critical appointment log notes (record/prescription edits) from a background thread
+AUDIT_LOG_ASYNC = False
+
+# Cache (shared between worker processes so dashboard invalidation reaches all of them)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'clinic_cache'),
+    }
+}
+
+# Identity pinned in the session is re-checked against the database at least this often
+IDENTITY_RECHECK_SECONDS = 300
+
+# Admin dashboard / list caches
+DASHBOARD_CACHE_TODAY_TTL = 60             # seconds; today's KPIs
+DASHBOARD_CACHE_PAST_TTL = 60 * 60 * 24    # seconds; closed days of the 7/30-day window
+ADMIN_FILTER_CHOICES_TTL = 600             # seconds; doctor/specialty dropdowns of admin lists
+
+# History tables (appointment_logs, chatbot_messages) older than this many months
+# are moved to monthly archive tables by `manage.py archive_history`
+ARCHIVE_AFTER_MONTHS = 6
 
 # Bootstrap5 Configuration
 BOOTSTRAP5 = {
@@ -1,40 +1,33 @@
-from adminpanel.models import DoctorRankFee
+"""
+Consultation fee per doctor rank.
 
-def get_rank_fees():
-    """Get rank fees from database"""
-    fees = {}
-    try:
-        for rank_fee in DoctorRankFee.objects.all():
-            fees[rank_fee.rank] = int(rank_fee.default_fee)
-    except Exception:
-        # Fallback to hardcoded values if database is not available
-        fees = {
-            "BS": 200_000,
-            "THS": 300_000,
-            "TS": 500_000,
-            "PGS": 700_000,
-            "GS": 1_000_000,
-        }
-    return fees
+The fee table (adminpanel.DoctorRankFee) is loaded lazily into a process-wide
+registry keyed by the normalized rank code (BS, THS, TS, PGS, GS), so lookups
+cost no query. rankfee_create/update/delete call `invalidate_rank_fees()`, which
+bumps a version key in the shared cache; every worker compares its copy with
+that version (at most once per RANK_FEE_RECHECK_SECONDS) and reloads on change.
+`fee_case()` turns the same table into a SQL CASE for annotated querysets.
+"""
+import threading
+import time
 
-def get_default_fee():
-    """Get default fee from database"""
-    try:
-        bs_fee = DoctorRankFee.objects.filter(rank="BS").first()
-        return int(bs_fee.default_fee) if bs_fee else 200_000
-    except Exception:
-        return 200_000
-
-# Cache the fees to avoid repeated database queries
-_rank_fees_cache = None
-def get_cached_rank_fees():
-    global _rank_fees_cache
-    if _rank_fees_cache is None:
-        _rank_fees_cache = get_rank_fees()
-    return _rank_fees_cache
-
-RANK_FEES = get_cached_rank_fees()
-DEFAULT_FEE = get_default_fee()
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Lower, Replace, Trim, Upper
+from django.db.models.lookups import Exact, In
+
+from adminpanel.models import DoctorRankFee
+
+FALLBACK_FEES = {
+    "BS": 200_000,
+    "THS": 300_000,
+    "TS": 500_000,
+    "PGS": 700_000,
+    "GS": 1_000_000,
+}
+FALLBACK_DEFAULT_FEE = 200_000
+VERSION_KEY = "pricing:rankfees:ver"
 
 NORMALIZE_MAP = {
     "bs": "BS", "bácsĩ": "BS", "bacsi": "BS", "bác sĩ": "BS",
@@ -61,22 +54,106 @@ def normalize_rank(raw: str | None) -> str:
     return v.upper()
 
 
+_lock = threading.Lock()
+_registry = {"fees": None, "version": None, "checked_at": 0.0}
+
+
+def _load():
+    fees = {}
+    for rank, fee in DoctorRankFee.objects.values_list("rank", "default_fee"):
+        code = normalize_rank(rank)
+        if code:
+            fees[code] = int(fee)
+    return fees
+
+
+def _fee_table():
+    """Normalized {rank code: fee}, reloaded only when the shared version changes."""
+    now = time.monotonic()
+    recheck = getattr(settings, "RANK_FEE_RECHECK_SECONDS", 5)
+    if _registry["fees"] is not None and now - _registry["checked_at"] < recheck:
+        return _registry["fees"]
+    with _lock:
+        version = cache.get(VERSION_KEY)
+        if _registry["fees"] is None or _registry["version"] != version:
+            try:
+                _registry["fees"] = _load()
+            except Exception:
+                # Database not available (e.g. during startup): serve the fallback, retry next call
+                return FALLBACK_FEES
+            _registry["version"] = version
+        _registry["checked_at"] = now
+        return _registry["fees"]
+
+
+def invalidate_rank_fees():
+    """Make every process reload the fee table (call after DoctorRankFee writes)."""
+    cache.set(VERSION_KEY, time.time_ns(), None)
+    with _lock:
+        _registry["fees"] = None
+
+
+def get_rank_fees():
+    """{normalized rank code: fee} (a copy)"""
+    return dict(_fee_table())
+
+
+def get_default_fee():
+    """Fee of a doctor without a known rank: the BS fee."""
+    return _fee_table().get("BS", FALLBACK_DEFAULT_FEE)
+
+
+def fee_for_rank(rank: str | None) -> int:
+    fees = _fee_table()
+    return fees.get(normalize_rank(rank), fees.get("BS", FALLBACK_DEFAULT_FEE))
+
+
+def fee_case(field="rank"):
+    """
+    SQL CASE giving the consultation fee from the rank column `field`.
+
+    Mirrors normalize_rank step by step, so the database and Python agree on
+    the fee: the trimmed lower-case spelling first, then the same with dots and
+    spaces removed, then the upper-case value as a rank code of its own.
+    """
+    fees = _fee_table()
+    trimmed = Trim(field)
+    exact = Lower(trimmed)
+    stripped = Replace(Replace(exact, Value("."), Value("")), Value(" "), Value(""))
+    whens = []
+    for key in (exact, stripped):
+        for code, fee in fees.items():
+            spellings = sorted(k for k, v in NORMALIZE_MAP.items() if v == code)
+            if spellings:
+                whens.append(When(In(key, spellings), then=Value(fee)))
+    for code, fee in fees.items():
+        whens.append(When(Exact(Upper(trimmed), code), then=Value(fee)))
+    return Case(
+        *whens,
+        default=Value(fees.get("BS", FALLBACK_DEFAULT_FEE)),
+        output_field=IntegerField(),
+    )
+
+
 def get_consultation_fee(doctor) -> int:
     code = ""
     # Ưu tiên field rank; nếu dự án dùng tên khác, thử thêm:
     for field in ("rank", "degree", "degree_code", "title_code"):
         if hasattr(doctor, field) and getattr(doctor, field):
-            code = normalize_rank(getattr(doctor, field))
+            code = getattr(doctor, field)
             break
-    
-    # Get fresh fees from database
-    fees = get_rank_fees()
-    return fees.get(code or "", get_default_fee())
+    return fee_for_rank(code)
 
 
 # Backward-compatibility helper (if some places still call this)
 def get_effective_fee(rank: str | None) -> int:
-    fees = get_rank_fees()
-    return fees.get(normalize_rank(rank), get_default_fee())
+    return fee_for_rank(rank)
 
 
+def consultation_fees_by_doctor(doctor_ids) -> dict:
+    """{doctor_id: fee} for many doctors (same rules as get_consultation_fee)."""
+    from .models import Doctors
+    return {
+        doctor_id: fee_for_rank(rank)
+        for doctor_id, rank in Doctors.objects.filter(id__in=set(doctor_ids)).values_list("id", "rank")
+    }
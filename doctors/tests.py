@@ -1,3 +1,62 @@
-from django.test import TestCase
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.db.models import CharField, Value
+from django.db.models.sql import Query
+from django.db.utils import ConnectionHandler
+
+from . import pricing
+from .models import Doctors
+
+FEES = dict(pricing.FALLBACK_FEES, CKI=400_000)
+
+
+@mock.patch.object(pricing, "_fee_table", return_value=FEES)
+class FeeCaseTests(unittest.TestCase):
+    """fee_case() (SQL, for annotated lists) must give the fee billing charges (fee_for_rank).
+
+    Evaluated on a private in-memory SQLite connection; no table is needed.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.handler = ConnectionHandler({"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}})
+        cls.conn = cls.handler["default"]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.handler.close_all()
+        super().tearDownClass()
+
+    def sql_fee(self, rank):
+        query = Query(Doctors)
+        expr = pricing.fee_case(Value(rank, output_field=CharField())).resolve_expression(query)
+        sql, params = query.get_compiler(connection=self.conn).compile(expr)
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT " + sql, params)
+            return cursor.fetchone()[0]
+
+    def spellings(self):
+        for key in pricing.NORMALIZE_MAP:
+            yield key
+            yield key.title()
+            yield f"  {key.title()}. "
+            yield ".".join(key)
+            if key.isascii():
+                yield key.upper()
+
+    def test_every_known_spelling_agrees_with_billing(self, _):
+        for rank in self.spellings():
+            with self.subTest(rank=rank):
+                self.assertEqual(self.sql_fee(rank), pricing.fee_for_rank(rank))
+
+    def test_dotted_ranks_are_not_the_default_fee(self, _):
+        for rank, code in (("ThS.", "THS"), ("PGS.", "PGS"), ("P.G.S", "PGS"), ("T.S.", "TS")):
+            with self.subTest(rank=rank):
+                self.assertEqual(self.sql_fee(rank), FEES[code])
+
+    def test_other_codes_and_unknown_ranks(self, _):
+        for rank in ("CKI", " cki ", "", "Khác"):
+            with self.subTest(rank=rank):
+                self.assertEqual(self.sql_fee(rank), pricing.fee_for_rank(rank))
@@ -1,7 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from clinic.decorators import doctor_or_staff_required, staff_required, doctor_required
+from clinic.identity import get_identity
 from accounts.models import Users
 from accounts.forms import ChangePasswordForm
 from accounts.passwords import check_password, hash_password
@@ -13,6 +16,8 @@ from .forms import (
     DoctorSettingsForm,
 )
 from .pricing import normalize_rank, get_consultation_fee
+from . import visit_summary
+from clinic import documents
 from appointments.models import Appointments
 from patients.models import PatientProfiles
 from emr.models import MedicalRecords, Prescriptions
@@ -20,10 +25,7 @@ from decimal import Decimal
 
 
 def _get_ext_user(request):
-    email = getattr(request.user, "email", None)
-    if not email:
-        return None
-    return Users.objects.filter(email=email).first()
+    return get_identity(request).user
 
 
 @login_required
@@ -33,7 +35,7 @@ def profile(request):
         messages.error(request, "Không tìm thấy tài khoản ngoài.")
         return redirect("theme:home")
 
-    doctor = Doctors.objects.select_related("user", "specialty").filter(user=ext_user).first()
+    doctor = get_identity(request).doctor
     extras, _ = UserExtras.objects.get_or_create(user=ext_user)
     settings, _ = DoctorSettings.objects.get_or_create(doctor=doctor) if doctor else (None, None)
     is_doctor_role = getattr(ext_user, 'role', '') == 'DOCTOR'
@@ -302,86 +304,68 @@ def doctor_visit_summary_print(request, appointment_id):
 
 @login_required
 def doctor_visit_summary_pdf(request, appointment_id):
-    """Generate PDF version of visit summary report"""
-    # Lazy imports to keep optional dependencies optional
-    from django.http import HttpResponse
-    from django.template.loader import render_to_string
-    
-    # Get the same data as the HTML view
-    appointment = get_object_or_404(
-        Appointments.objects.select_related(
-            'patient__user', 'doctor__user', 'doctor__specialty'
-        ),
-        id=appointment_id,
-        status='COMPLETED'
-    )
-    
+    """Serve the stored visit summary PDF; a missing one is queued for the render worker"""
+    from django.conf import settings
+    from adminpanel import render_jobs
+
+    appointment = get_object_or_404(visit_summary.queryset(), id=appointment_id)
+
     # Security check: only the doctor who handled the appointment can view it
     ext_user = _get_ext_user(request)
     if not ext_user or appointment.doctor.user != ext_user:
         messages.error(request, "Bạn không có quyền xem phiếu khám này.")
         return redirect("theme:home")
-    
-    # Get medical record and prescriptions
-    try:
-        medical_record = appointment.medical_record
-        prescriptions = medical_record.prescriptions.all()
-    except MedicalRecords.DoesNotExist:
-        medical_record = None
-        prescriptions = []
-    
-    # Calculate consultation fee based on doctor's rank
-    consultation_fee = get_consultation_fee(appointment.doctor)
-    
-    # Calculate total medication cost
-    medication_total = sum(
-        prescription.quantity * prescription.unit_price_snapshot
-        for prescription in prescriptions
-    )
-    
-    # Calculate grand total
-    grand_total = consultation_fee + medication_total
-    
-    context = {
-        'appointment': appointment,
-        'patient': appointment.patient,
-        'doctor': appointment.doctor,
-        'medical_record': medical_record,
-        'prescriptions': prescriptions,
-        'consultation_fee': consultation_fee,
-        'medication_total': medication_total,
-        'grand_total': grand_total,
-        'is_pdf': True,  # Flag to modify template for PDF
-    }
-    
-    # Render HTML string once, reuse across engines
-    html_string = render_to_string('doctors/doctor_visit_summary_pdf.html', context, request=request)
-
-    filename = f"phieu_kham_{appointment.patient.user.full_name}_{appointment.appointment_at.strftime('%d%m%Y')}.pdf"
 
-    # 1) Try WeasyPrint first (best quality if system libs available)
-    try:
-        from weasyprint import HTML  # type: ignore
-        pdf_bytes = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
-    except Exception:
-        # 2) Fallback to xhtml2pdf (pure Python, works well on Windows)
+    doc = visit_summary.document(appointment)
+    if not doc.exists() and not getattr(settings, "DOCUMENT_RENDER_ASYNC", True):
         try:
-            from io import BytesIO
-            from xhtml2pdf import pisa  # type: ignore
-            result = BytesIO()
-            pisa_status = pisa.CreatePDF(src=html_string, dest=result, encoding='utf-8')
-            if pisa_status.err:
-                messages.error(request, "Xuất PDF thất bại.")
-                return redirect("doctors:visit_summary", appointment_id=appointment_id)
-            response = HttpResponse(result.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
-        except Exception as e:
+            doc = visit_summary.render(appointment.pk, base_url=request.build_absolute_uri())
+        except documents.PdfUnavailable as e:
             messages.error(request, f"PDF export không khả dụng: {str(e)}")
             return redirect("doctors:visit_summary", appointment_id=appointment_id)
+    if doc.exists():
+        return documents.serve(request, doc, filename=visit_summary.filename(appointment), as_attachment=True)
+
+    # Rendering takes seconds: leave it to `manage.py render_worker` and let the client poll
+    job = render_jobs.enqueue(
+        documents.VISIT_SUMMARY, appointment.pk, doc.version,
+        base_url=request.build_absolute_uri(), user=ext_user, retry=request.GET.get("retry") == "1",
+    )
+    status = _render_job_status(job)
+    if "application/json" in request.headers.get("Accept", ""):
+        return JsonResponse(status, status=202 if job.status != render_jobs.FAILED else 200)
+    return render(request, "doctors/visit_summary_pdf_pending.html", {
+        "appointment": appointment,
+        "job": job,
+        "status": status,
+        "failed": job.status == render_jobs.FAILED,
+    }, status=202 if job.status != render_jobs.FAILED else 200)
+
+
+def _render_job_status(job):
+    from adminpanel import render_jobs
+    data = {
+        "id": job.pk,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "status_url": reverse("doctors:render_job_status", args=[job.pk]),
+    }
+    if job.status == render_jobs.DONE:
+        data["download_url"] = reverse("doctors:visit_summary_pdf", args=[job.entity_id])
+    return data
+
+
+@login_required
+def render_job_status(request, job_id):
+    """JSON status of a queued visit summary render"""
+    from adminpanel.models import RenderJobs
+
+    job = get_object_or_404(RenderJobs, pk=job_id, kind=documents.VISIT_SUMMARY)
+    ext_user = _get_ext_user(request)
+    if not ext_user or not Appointments.objects.filter(pk=job.entity_id, doctor__user=ext_user).exists():
+        return JsonResponse({"error": "Bạn không có quyền xem phiếu khám này."}, status=403)
+    return JsonResponse(_render_job_status(job))
 
 
 @login_required
@@ -389,7 +373,8 @@ def doctor_visit_summary_pdf(request, appointment_id):
 def doctor_confirm_appointment(request, pk):
     """Doctor confirm a pending appointment"""
     from django.utils import timezone
-    from appointments.models import Appointments, AppointmentLogs
+    from appointments import audit
+    from appointments.models import Appointments
     from core.choices import ApptStatus
     
     if request.method != 'POST':
@@ -402,7 +387,7 @@ def doctor_confirm_appointment(request, pk):
         messages.error(request, "Không tìm thấy tài khoản ngoài.")
         return redirect("theme:home")
     
-    doctor = Doctors.objects.select_related("user", "specialty").filter(user=ext_user).first()
+    doctor = get_identity(request).doctor
     if not doctor:
         messages.error(request, "Không tìm thấy thông tin bác sĩ.")
         return redirect("theme:home")
@@ -425,13 +410,7 @@ def doctor_confirm_appointment(request, pk):
     appointment.save()
     
     # Log the action
-    AppointmentLogs.objects.create(
-        appointment=appointment,
-        action='CONFIRMED',
-        actor_user=ext_user,
-        note='Bác sĩ xác nhận lịch hẹn',
-        created_at=timezone.now()
-    )
+    audit.record(appointment, 'CONFIRMED', ext_user, 'Bác sĩ xác nhận lịch hẹn')
     
     messages.success(request, f"Đã xác nhận lịch hẹn của {appointment.patient.user.full_name}.")
     return redirect("theme:home")
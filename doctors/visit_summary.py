@@ -0,0 +1,88 @@
+"""
+Visit summary PDF of a completed appointment.
+
+Shared by the PDF view (which only serves stored files and queues renders)
+and the render worker (adminpanel.render_jobs), which calls `render()`.
+"""
+from django.template.loader import render_to_string, select_template
+
+from clinic import documents
+from appointments.models import Appointments
+from emr.models import MedicalRecords
+from .pricing import get_consultation_fee
+
+TEMPLATES = [
+    "doctors/doctor_visit_summary_pdf.html",
+    "doctors/doctor_visit_summary_print.html",
+]
+
+
+def template_name():
+    return select_template(TEMPLATES).template.name
+
+
+def queryset():
+    """Completed appointments, with everything the summary shows."""
+    return Appointments.objects.select_related(
+        "patient__user", "doctor__user", "doctor__specialty"
+    ).filter(status="COMPLETED")
+
+
+def context(appointment):
+    try:
+        medical_record = appointment.medical_record
+        prescriptions = list(medical_record.prescriptions.all())
+    except MedicalRecords.DoesNotExist:
+        medical_record = None
+        prescriptions = []
+    consultation_fee = get_consultation_fee(appointment.doctor)
+    medication_total = sum(
+        prescription.quantity * prescription.unit_price_snapshot
+        for prescription in prescriptions
+    )
+    return {
+        "appointment": appointment,
+        "patient": appointment.patient,
+        "doctor": appointment.doctor,
+        "medical_record": medical_record,
+        "prescriptions": prescriptions,
+        "consultation_fee": consultation_fee,
+        "medication_total": medication_total,
+        "grand_total": consultation_fee + medication_total,
+        "is_pdf": True,  # Flag to modify template for PDF
+    }
+
+
+def version(ctx):
+    """Fingerprint of everything the summary shows."""
+    patient, doctor = ctx["patient"], ctx["doctor"]
+    return documents.fingerprint(
+        documents.template_version(template_name()),
+        documents.values(ctx["appointment"]),
+        documents.values(patient), patient.user.full_name,
+        documents.values(doctor), doctor.user.full_name, doctor.specialty.name,
+        documents.values(ctx["medical_record"]),
+        [documents.values(p) for p in ctx["prescriptions"]],
+        ctx["consultation_fee"],
+    )
+
+
+def document(appointment, ctx=None):
+    """The store entry of the summary's current version (may not be rendered yet)."""
+    ctx = ctx or context(appointment)
+    return documents.Document(documents.VISIT_SUMMARY, appointment.pk, version(ctx), documents.PDF)
+
+
+def filename(appointment):
+    return f"phieu_kham_{appointment.patient.user.full_name}_{appointment.appointment_at.strftime('%d%m%Y')}.pdf"
+
+
+def render(appointment_id, base_url=None):
+    """Render and store the current version of the summary. Returns the Document."""
+    appointment = queryset().get(id=appointment_id)
+    ctx = context(appointment)
+    doc = document(appointment, ctx)
+    if not doc.exists():
+        html_string = render_to_string(template_name(), ctx)
+        doc.save(documents.html_to_pdf(html_string, base_url=base_url))
+    return doc
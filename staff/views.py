@@ -6,16 +6,16 @@ from django.db import transaction
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField
 from django.shortcuts import get_object_or_404
 from clinic.decorators import staff_or_admin_required, admin_required
+from clinic.identity import get_identity
 from billing.models import Invoices, InvoiceItems, Payments, InvoicePrintLogs
+from billing.printing import invoice_response
+from adminpanel import revenue
 from accounts.models import Users
 from .models import StaffProfiles
 
 
 def _resolve_target_user(request, allow_admin_override: bool):
-    email = getattr(request.user, 'email', None)
-    if not email:
-        return None
-    me = Users.objects.filter(email=email).first()
+    me = get_identity(request).user
     if not me:
         return None
     if allow_admin_override:
@@ -247,11 +247,7 @@ def invoice_print(request, pk):
         "phone": "(0236) 3731 111",
     }
 
-    return render(request, "billing/invoice_print.html", {
-        "invoice": inv,
-        "lines": lines,
-        "clinic": clinic,
-    })
+    return invoice_response(request, inv, lines, clinic)
 
 
 @staff_or_admin_required
@@ -275,7 +271,7 @@ def invoice_pay_cash(request, pk):
                                     output_field=DecimalField(max_digits=12, decimal_places=2)))
         )["t"] or 0
 
-        Payments.objects.create(
+        payment = Payments.objects.create(
             invoice=inv,
             amount=total,
             method="CASH",
@@ -287,6 +283,7 @@ def invoice_pay_cash(request, pk):
         inv.amount_due = 0
         inv.subtotal = total
         inv.save(update_fields=["status", "amount_due", "subtotal"])
+        revenue.record_payment(payment)
         messages.success(request, "Đã nhận tiền mặt. Hóa đơn chuyển sang ĐÃ THANH TOÁN.")
         return redirect("staff:staff_cashier")
     return redirect("staff:staff_invoice_detail", pk=pk)
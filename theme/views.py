@@ -12,6 +12,7 @@ from django.db import connection
 from django.db.utils import OperationalError, ProgrammingError
 from django.utils import timezone
 from django.contrib.auth.hashers import check_password
+from clinic.identity import get_identity, load_identity, pin_identity
 
 def get_user_by_login_field(login_field):
     """Helper function to find user by email, phone, or username in Django auth.User"""
@@ -152,6 +153,8 @@ def login_view(request):
                 django_user.backend = 'django.contrib.auth.backends.ModelBackend'
                 login(request, django_user)
                 request.session.set_expiry(60 * 60 * 24 * 14 if remember else 0)
+                # Pin role / profile ids in the session (see clinic.identity)
+                pin_identity(request, load_identity(ext_user.email))
                 if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
                     return redirect(next_url)
                 messages.success(request, 'Đăng nhập thành công!')
@@ -291,9 +294,7 @@ def profile_view(request):
     # Map Django auth user -> external Users by email (fallback by username)
     ext_user = None
     if external_users_available():
-        email = getattr(request.user, 'email', None)
-        if email:
-            ext_user = ExternalUser.objects.filter(email=email).first()
+        ext_user = get_identity(request).user
         if not ext_user:
             full_name = f"{request.user.first_name} {request.user.last_name}".strip()
             ext_user = ExternalUser.objects.filter(full_name=full_name).first()